@@ -0,0 +1,487 @@
+"""Local on-disk cache of GitHub data shared across GitGeo runs."""
+
+import json
+import os
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+# bump whenever the cache tables change so that stale caches are rebuilt
+SCHEMA_VERSION = 3
+
+DEFAULT_CACHE_DIR = Path(
+    os.environ.get("GITGEO_CACHE_DIR", Path.home() / ".cache" / "gitgeo")
+)
+CACHE_FILENAME = "cache.sqlite3"
+
+# cached user profiles older than this many seconds are fetched again
+DEFAULT_PROFILE_TTL = 7 * 24 * 60 * 60  # one week
+# maximum number of user profiles to keep before evicting the least
+# recently used ones
+DEFAULT_MAX_PROFILES = 100000
+# maximum number of stored API responses, e.g. contributor list pages
+DEFAULT_MAX_RESPONSES = 20000
+# cached contributor lists older than this many seconds are fetched again
+DEFAULT_CONTRIBUTOR_LIST_TTL = 24 * 60 * 60  # one day
+# maximum number of contributor lists to keep
+DEFAULT_MAX_CONTRIBUTOR_LISTS = 20000
+
+# cache settings, changed through configure_cache()
+CACHE_SETTINGS = {
+    "cache_dir": DEFAULT_CACHE_DIR,
+    "enabled": True,
+    "profile_ttl": DEFAULT_PROFILE_TTL,
+    "max_profiles": DEFAULT_MAX_PROFILES,
+    "max_responses": DEFAULT_MAX_RESPONSES,
+    "contributor_list_ttl": DEFAULT_CONTRIBUTOR_LIST_TTL,
+    "max_contributor_lists": DEFAULT_MAX_CONTRIBUTOR_LISTS,
+}
+
+# every table in the cache database, keyed by name
+CACHE_TABLES = {
+    "profiles": """CREATE TABLE IF NOT EXISTS profiles (
+        url TEXT PRIMARY KEY,
+        location TEXT,
+        etag TEXT,
+        last_modified TEXT,
+        fetched_at REAL NOT NULL,
+        accessed_at REAL NOT NULL
+    )""",
+    "responses": """CREATE TABLE IF NOT EXISTS responses (
+        url TEXT PRIMARY KEY,
+        etag TEXT,
+        last_modified TEXT,
+        link TEXT,
+        body TEXT NOT NULL,
+        fetched_at REAL NOT NULL,
+        accessed_at REAL NOT NULL
+    )""",
+    "contributor_lists": """CREATE TABLE IF NOT EXISTS contributor_lists (
+        repo_and_num TEXT PRIMARY KEY,
+        contributors TEXT NOT NULL,
+        fetched_at REAL NOT NULL,
+        accessed_at REAL NOT NULL
+    )""",
+}
+
+_SHARED_CACHES = {}
+_SHARED_CACHES_LOCK = threading.Lock()
+
+
+def connect_to_cache(path):
+    """Open the cache database, creating or rebuilding its tables.
+
+    Args:
+        path - location of the SQLite database file
+
+    Returns:
+        sqlite3.Connection: a connection that can be shared between threads
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+    # write-ahead logging keeps frequent small commits cheap
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    with connection:
+        version = connection.execute("PRAGMA user_version").fetchone()[0]
+        for table, create_statement in CACHE_TABLES.items():
+            if version != SCHEMA_VERSION:
+                connection.execute("DROP TABLE IF EXISTS " + table)
+            connection.execute(create_statement)
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS {0}_accessed_at ON {0} (accessed_at)".format(
+                    table
+                )
+            )
+        # PRAGMA statements do not accept placeholders
+        connection.execute("PRAGMA user_version = {}".format(int(SCHEMA_VERSION)))
+    return connection
+
+
+class LruCacheTable:
+    """Base class for a size-capped cache table with LRU eviction.
+
+    Subclasses set TABLE and KEY, the table name and its primary key
+    column. Once the table holds more than max_entries rows, the least
+    recently accessed rows are evicted. Instances can be shared between
+    threads.
+    """
+
+    TABLE = None
+    KEY = None
+
+    def __init__(self, path, max_entries):
+        """Open (and create if needed) the cache database.
+
+        Args:
+            path - location of the SQLite database file
+            max_entries - maximum number of rows to keep
+        """
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = connect_to_cache(self.path)
+        self._num_entries = self._connection.execute(
+            "SELECT COUNT(*) FROM " + self.TABLE
+        ).fetchone()[0]
+
+    def _select(self, key, columns):
+        """Return the requested columns of a row and mark it as used.
+
+        Args:
+            key - primary key of the row
+            columns - list of column names to return
+
+        Returns:
+            dict: column values, or None if the row does not exist
+        """
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT {} FROM {} WHERE {} = ?".format(
+                    ", ".join(columns), self.TABLE, self.KEY
+                ),
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE {} SET accessed_at = ? WHERE {} = ?".format(
+                    self.TABLE, self.KEY
+                ),
+                (time.time(), key),
+            )
+        return dict(zip(columns, row))
+
+    def _upsert(self, key, values):
+        """Insert or replace a row, evicting old rows if the table is full.
+
+        Args:
+            key - primary key of the row
+            values - dict of column names to values, excluding the key
+        """
+        now = time.time()
+        values = dict(values, fetched_at=now, accessed_at=now)
+        columns = list(values)
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "UPDATE {} SET {} WHERE {} = ?".format(
+                    self.TABLE,
+                    ", ".join(column + " = ?" for column in columns),
+                    self.KEY,
+                ),
+                [values[column] for column in columns] + [key],
+            )
+            if cursor.rowcount == 0:
+                self._connection.execute(
+                    "INSERT INTO {} ({}, {}) VALUES (?, {})".format(
+                        self.TABLE,
+                        self.KEY,
+                        ", ".join(columns),
+                        ", ".join("?" for _ in columns),
+                    ),
+                    [key] + [values[column] for column in columns],
+                )
+                self._num_entries += 1
+                if self._num_entries > self.max_entries:
+                    self._evict(self._num_entries - self.max_entries)
+
+    def _evict(self, count):
+        """Delete the least recently used rows.
+
+        Must be called while holding the lock.
+
+        Args:
+            count - number of rows to delete
+        """
+        self._connection.execute(
+            "DELETE FROM {0} WHERE {1} IN "
+            "(SELECT {1} FROM {0} ORDER BY accessed_at LIMIT ?)".format(
+                self.TABLE, self.KEY
+            ),
+            (count,),
+        )
+        self._num_entries -= count
+
+    def __len__(self):
+        """Return the number of cached rows."""
+        return self._num_entries
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            self._connection.close()
+
+
+class ProfileCache(LruCacheTable):
+    """Cache of GitHub user locations keyed by profile URL.
+
+    Each entry stores the user's location, the time it was fetched and the
+    ETag and Last-Modified values returned by GitHub. Entries older than
+    the TTL are reported as expired. The URL includes the API base URL, so
+    users of e.g. a local mock server never mix with real GitHub users.
+    """
+
+    TABLE = "profiles"
+    KEY = "url"
+
+    def __init__(self, path, ttl=DEFAULT_PROFILE_TTL, max_entries=DEFAULT_MAX_PROFILES):
+        """Open (and create if needed) the cache database.
+
+        Args:
+            path - location of the SQLite database file
+            ttl - number of seconds a cached profile stays fresh
+            max_entries - maximum number of profiles to keep
+        """
+        super().__init__(path, max_entries)
+        self.ttl = ttl
+
+    def get(self, url):
+        """Return the cached profile for a user, or None if not cached.
+
+        Args:
+            url - API URL of the user, e.g. https://api.github.com/users/octocat
+
+        Returns:
+            dict: location, etag, last_modified and fetched_at (seconds
+                  since the epoch)
+        """
+        # GitHub user names are case-insensitive
+        return self._select(
+            url.lower(), ["location", "etag", "last_modified", "fetched_at"]
+        )
+
+    def is_expired(self, entry):
+        """Return whether a cached profile is older than the TTL.
+
+        Args:
+            entry - a profile returned by get()
+
+        Returns:
+            bool: True if the profile should be fetched again
+        """
+        return time.time() - entry["fetched_at"] > self.ttl
+
+    def set(self, url, location, etag=None, last_modified=None):
+        """Store a freshly fetched (or revalidated) profile.
+
+        Args:
+            url - API URL of the user
+            location - location text from the user's profile
+            etag - ETag header of the GitHub response, if any
+            last_modified - Last-Modified header of the response, if any
+        """
+        self._upsert(
+            url.lower(),
+            {"location": location, "etag": etag, "last_modified": last_modified},
+        )
+
+
+class ResponseCache(LruCacheTable):
+    """Cache of GitHub API response bodies and validators keyed by URL.
+
+    Stored ETag and Last-Modified values allow repeat requests to be sent
+    as conditional requests, and a 304 Not Modified answer can then be
+    served from the stored body.
+    """
+
+    TABLE = "responses"
+    KEY = "url"
+
+    def get(self, url):
+        """Return the stored response for a URL, or None if not stored.
+
+        Args:
+            url - the requested URL
+
+        Returns:
+            dict: etag, last_modified, link (the Link header) and body
+        """
+        return self._select(url, ["etag", "last_modified", "link", "body"])
+
+    def set(self, url, body, etag=None, last_modified=None, link=None):
+        """Store a response.
+
+        Args:
+            url - the requested URL
+            body - the response text
+            etag - ETag header of the response, if any
+            last_modified - Last-Modified header of the response, if any
+            link - Link header of the response, if any
+        """
+        self._upsert(
+            url,
+            {
+                "etag": etag,
+                "last_modified": last_modified,
+                "link": link,
+                "body": body,
+            },
+        )
+
+
+class ContributorListCache(LruCacheTable):
+    """Cache of repo contributor lists keyed by repo URL and list length.
+
+    Lets consecutive scans of a repo, e.g. a summary and then a map, reuse
+    the list without requesting any page. Entries older than the TTL are
+    reported as expired. Like profiles, lists are keyed by API URL, so
+    lists from different API base URLs are kept apart.
+    """
+
+    TABLE = "contributor_lists"
+    KEY = "repo_and_num"
+
+    def __init__(
+        self,
+        path,
+        ttl=DEFAULT_CONTRIBUTOR_LIST_TTL,
+        max_entries=DEFAULT_MAX_CONTRIBUTOR_LISTS,
+    ):
+        """Open (and create if needed) the cache database.
+
+        Args:
+            path - location of the SQLite database file
+            ttl - number of seconds a cached list stays fresh
+            max_entries - maximum number of lists to keep
+        """
+        super().__init__(path, max_entries)
+        self.ttl = ttl
+
+    @staticmethod
+    def make_key(url, max_num_contributors):
+        """Return the cache key of a repo's list, e.g. ".../repos/octo/repo#100"."""
+        # GitHub owner and repo names are case-insensitive
+        return "{}#{}".format(url.lower(), max_num_contributors)
+
+    def get(self, url, max_num_contributors):
+        """Return the cached contributor list, or None if not cached.
+
+        Args:
+            url - API URL of the repo, e.g. https://api.github.com/repos/octo/repo
+            max_num_contributors - maximum length the list was fetched with
+
+        Returns:
+            dict: contributors (a list of user names) and fetched_at
+                  (seconds since the epoch)
+        """
+        entry = self._select(
+            self.make_key(url, max_num_contributors), ["contributors", "fetched_at"]
+        )
+        if entry is not None:
+            entry["contributors"] = json.loads(entry["contributors"])
+        return entry
+
+    def is_expired(self, entry):
+        """Return whether a cached list is older than the TTL.
+
+        Args:
+            entry - a list returned by get()
+
+        Returns:
+            bool: True if the list should be fetched again
+        """
+        return time.time() - entry["fetched_at"] > self.ttl
+
+    def set(self, url, max_num_contributors, contributors):
+        """Store a freshly fetched contributor list.
+
+        Args:
+            url - API URL of the repo
+            max_num_contributors - maximum length the list was fetched with
+            contributors - list of user names
+        """
+        self._upsert(
+            self.make_key(url, max_num_contributors),
+            {"contributors": json.dumps(contributors)},
+        )
+
+
+def configure_cache(
+    cache_dir=None,
+    enabled=True,
+    profile_ttl=DEFAULT_PROFILE_TTL,
+    max_profiles=DEFAULT_MAX_PROFILES,
+    max_responses=DEFAULT_MAX_RESPONSES,
+    contributor_list_ttl=DEFAULT_CONTRIBUTOR_LIST_TTL,
+    max_contributor_lists=DEFAULT_MAX_CONTRIBUTOR_LISTS,
+):
+    """Change where and whether GitGeo caches GitHub data.
+
+    Args:
+        cache_dir - directory holding the cache (default: ~/.cache/gitgeo)
+        enabled - whether to use the cache at all
+        profile_ttl - number of seconds a cached profile stays fresh
+        max_profiles - maximum number of profiles to keep
+        max_responses - maximum number of API responses to keep
+        contributor_list_ttl - number of seconds a cached contributor list
+                               stays fresh
+        max_contributor_lists - maximum number of contributor lists to keep
+
+    Returns:
+        None
+    """
+    with _SHARED_CACHES_LOCK:
+        for shared_cache in _SHARED_CACHES.values():
+            shared_cache.close()
+        _SHARED_CACHES.clear()
+        CACHE_SETTINGS["cache_dir"] = Path(cache_dir or DEFAULT_CACHE_DIR)
+        CACHE_SETTINGS["enabled"] = enabled
+        CACHE_SETTINGS["profile_ttl"] = profile_ttl
+        CACHE_SETTINGS["max_profiles"] = max_profiles
+        CACHE_SETTINGS["max_responses"] = max_responses
+        CACHE_SETTINGS["contributor_list_ttl"] = contributor_list_ttl
+        CACHE_SETTINGS["max_contributor_lists"] = max_contributor_lists
+
+
+def get_cache_dir():
+    """Return the cache directory, or None if caching is disabled."""
+    if not CACHE_SETTINGS["enabled"]:
+        return None
+    return CACHE_SETTINGS["cache_dir"]
+
+
+def get_shared_cache(cache_class, **kwargs):
+    """Return the shared instance of a cache table, opening it on first use.
+
+    Args:
+        cache_class - an LruCacheTable subclass
+        kwargs - extra arguments used when opening the cache
+
+    Returns:
+        LruCacheTable: the cache, or None if caching is disabled
+    """
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return None
+
+    with _SHARED_CACHES_LOCK:
+        if cache_class not in _SHARED_CACHES:
+            _SHARED_CACHES[cache_class] = cache_class(
+                cache_dir / CACHE_FILENAME, **kwargs
+            )
+        return _SHARED_CACHES[cache_class]
+
+
+def get_profile_cache():
+    """Return the shared profile cache, or None if caching is disabled."""
+    return get_shared_cache(
+        ProfileCache,
+        ttl=CACHE_SETTINGS["profile_ttl"],
+        max_entries=CACHE_SETTINGS["max_profiles"],
+    )
+
+
+def get_response_cache():
+    """Return the shared response cache, or None if caching is disabled."""
+    return get_shared_cache(ResponseCache, max_entries=CACHE_SETTINGS["max_responses"])
+
+
+def get_contributor_list_cache():
+    """Return the shared contributor list cache, or None if caching is disabled."""
+    return get_shared_cache(
+        ContributorListCache,
+        ttl=CACHE_SETTINGS["contributor_list_ttl"],
+        max_entries=CACHE_SETTINGS["max_contributor_lists"],
+    )
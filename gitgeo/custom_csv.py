@@ -3,7 +3,377 @@
 # pylint: disable=too-many-arguments, bad-continuation
 
 import csv
+import importlib
+import os
 from pathlib import Path
+import threading
+
+import pandas as pd
+
+from gitgeo.geolocation import classify_locations
+
+RESULT_FIELDNAMES = ["software_name", "username", "location", "country"]
+DELTA_FIELDNAMES = [
+    "software_name",
+    "username",
+    "change",
+    "previous_location",
+    "location",
+    "country",
+]
+# number of rows a ResultWriter buffers before writing them to disk
+DEFAULT_FLUSH_EVERY = 1000
+# number of rows re-classified at a time, to bound memory on huge files
+RECLASSIFY_CHUNK_SIZE = 100000
+# formats results can be written in. The columnar ones are folders of
+# partitions, each written by one flush, and need pyarrow
+OUTPUT_FORMATS = ["csv", "parquet", "feather"]
+DEFAULT_OUTPUT_FORMAT = "csv"
+# number of rows per partition of columnar results
+DEFAULT_PARTITION_ROWS = 100000
+# columns with few distinct values, stored dictionary-encoded
+DICTIONARY_COLUMNS = ["software_name", "country"]
+
+
+def get_results_path(results_type, timestamp, output_format=DEFAULT_OUTPUT_FORMAT):
+    """Return the path of a results csv, creating the results folder.
+
+    Args:
+        results_type - a string indicating by contributor or by country
+        timestamp - datetime to create unique file name
+        output_format - "csv", "parquet" or "feather"
+
+    Returns:
+        Path: results/<results_type>_<timestamp>.<output_format>
+    """
+    filename = Path.cwd() / "results"
+    filename.mkdir(exist_ok=True)
+    return filename / (results_type + "_" + timestamp + "." + output_format)
+
+
+def get_output_format(filename):
+    """Return the format of results from their filename's suffix.
+
+    Args:
+        filename - name of results, e.g. multirepo_20210101-120000.parquet
+
+    Returns:
+        str: "csv", "parquet" or "feather"
+    """
+    suffix = Path(filename).suffix.lstrip(".")
+    return suffix if suffix in OUTPUT_FORMATS else DEFAULT_OUTPUT_FORMAT
+
+
+def import_pyarrow(module):
+    """Import a pyarrow module, explaining how to install pyarrow if missing.
+
+    Args:
+        module - name of the module, e.g. "parquet"
+
+    Returns:
+        module: e.g. pyarrow.parquet
+    """
+    try:
+        return importlib.import_module("pyarrow." + module)
+    except ImportError as error:
+        raise ImportError(
+            "parquet and feather results need pyarrow, "
+            "install it with: pip install gitgeo[columnar]"
+        ) from error
+
+
+class ResultWriter:
+    """Buffered writer of contributor rows to a results csv.
+
+    The file is opened once, rows are written in batches of flush_every,
+    and everything left is written when the writer is closed. Use as a
+    context manager. write() may be called from several threads at once.
+    """
+
+    output_format = "csv"
+
+    def __init__(
+        self,
+        results_type,
+        timestamp,
+        append=False,
+        flush_every=DEFAULT_FLUSH_EVERY,
+        on_flush=None,
+    ):
+        """Open the results csv.
+
+        A new file starts with the column names. With append=True an
+        existing file is added to instead of replaced.
+
+        Args:
+            results_type - a string indicating by contributor or by country
+            timestamp - datetime to create unique file name
+            append - whether to add rows to an existing csv
+            flush_every - number of rows to buffer before writing them out
+            on_flush - optional function called after rows reach the file,
+                       with the file size in bytes and the rows written
+        """
+        self.path = get_results_path(results_type, timestamp, self.output_format)
+        self.flush_every = flush_every
+        self.on_flush = on_flush
+        self._rows = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._open(append)
+
+    def _open(self, append):
+        """Open the results csv, writing the column names if it is new."""
+        write_header = not append or not self.path.exists()
+        # newline='' prevents spaces in between entries. Setting encoding to utf-8
+        # ensures that most (all?) characters can be read. "a" is for append.
+        self._file = open(  # pylint: disable=consider-using-with
+            self.path, "a" if append else "w", encoding="utf-8", newline=""
+        )
+        self._writer = csv.DictWriter(self._file, fieldnames=RESULT_FIELDNAMES)
+        if write_header:
+            self._writer.writeheader()
+
+    def write(self, software_name, username, location, country):
+        """Add one contributor row.
+
+        Args:
+            software_name - package name or github name
+            username - GitHub username
+            location - Geographic info from GitHub profile
+            country - country predicted by GitGeo
+
+        Returns:
+            None
+        """
+        row = {
+            # replace slashes to avoid incorrect creation of directories
+            "software_name": software_name.replace("/", "_"),
+            "username": username,
+            "location": location,
+            "country": country,
+        }
+        with self._lock:
+            self._rows.append(row)
+            if len(self._rows) >= self.flush_every:
+                self._flush()
+
+    def flush(self):
+        """Write all buffered rows to disk."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        """Write all buffered rows to disk. Must hold the lock."""
+        rows = self._rows
+        self._rows = []
+        offset = self._write_rows(rows)
+        if self.on_flush is not None:
+            self.on_flush(offset, rows)
+
+    def _write_rows(self, rows):
+        """Append rows to the csv.
+
+        Returns:
+            int: the size of the csv in bytes
+        """
+        self._writer.writerows(rows)
+        self._file.flush()
+        return os.fstat(self._file.fileno()).st_size
+
+    def _close_file(self):
+        """Close the csv."""
+        self._file.close()
+
+    def close(self):
+        """Write any buffered rows and close the file."""
+        with self._lock:
+            if not self._closed:
+                self._flush()
+                self._close_file()
+                self._closed = True
+
+    def __enter__(self):
+        """Return the writer itself."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close the writer, keeping rows written before any error."""
+        self.close()
+
+
+class ColumnarResultWriter(ResultWriter):
+    """Buffered writer of contributor rows to parquet or feather partitions.
+
+    Results are a folder, and each flush writes the buffered rows to a new
+    partition file in it, with software_name and country dictionary-encoded.
+    A partition is written under a temporary name and then renamed, so a
+    crash never leaves a partly written one behind.
+    """
+
+    def __init__(
+        self,
+        results_type,
+        timestamp,
+        output_format="parquet",
+        append=False,
+        flush_every=DEFAULT_PARTITION_ROWS,
+        on_flush=None,
+    ):
+        """Create the results folder.
+
+        Args:
+            results_type - a string indicating by contributor or by country
+            timestamp - datetime to create unique folder name
+            output_format - "parquet" or "feather"
+            append - whether to add partitions to existing results
+            flush_every - number of rows per partition
+            on_flush - optional function called after rows reach the disk,
+                       with the number of partitions and the rows written
+        """
+        self.output_format = output_format
+        self._pyarrow = import_pyarrow("lib")
+        self._format_module = import_pyarrow(
+            "parquet" if output_format == "parquet" else "feather"
+        )
+        self._num_partitions = 0
+        super().__init__(results_type, timestamp, append, flush_every, on_flush)
+
+    def _open(self, append):
+        """Create the results folder, emptying it unless appending."""
+        self.path.mkdir(exist_ok=True)
+        partitions = get_partition_paths(self.path)
+        if not append:
+            for partition in partitions:
+                partition.unlink()
+            partitions = []
+        self._num_partitions = len(partitions)
+
+    def get_partition_path(self, number):
+        """Return the path of a partition, e.g. <folder>/part-00000.parquet."""
+        return self.path / "part-{:05d}.{}".format(number, self.output_format)
+
+    def _write_rows(self, rows):
+        """Write rows to a new partition, if there are any.
+
+        Returns:
+            int: the number of partitions
+        """
+        if rows:
+            self._write_partition(rows)
+        return self._num_partitions
+
+    def _write_partition(self, rows):
+        """Write rows to the next partition file."""
+        pyarrow = self._pyarrow
+        columns = {}
+        for name in RESULT_FIELDNAMES:
+            # like the csv module, store a missing location as empty
+            values = ["" if row[name] is None else row[name] for row in rows]
+            column = pyarrow.array(values, pyarrow.string())
+            if name in DICTIONARY_COLUMNS:
+                column = column.dictionary_encode()
+            columns[name] = column
+        table = pyarrow.table(columns)
+
+        path = self.get_partition_path(self._num_partitions)
+        # names starting with a dot are skipped by readers
+        temporary_path = path.with_name("." + path.name + ".tmp")
+        if self.output_format == "parquet":
+            self._format_module.write_table(table, temporary_path)
+        else:
+            self._format_module.write_feather(table, temporary_path)
+        os.replace(temporary_path, path)
+        self._num_partitions += 1
+
+    def _close_file(self):
+        """Leave at least an empty partition, so that the columns are known."""
+        if not self._num_partitions:
+            self._write_partition([])
+
+
+def create_result_writer(
+    results_type, timestamp, output_format=DEFAULT_OUTPUT_FORMAT, **kwargs
+):
+    """Create a writer of results in a given format.
+
+    Args:
+        results_type - a string indicating by contributor or by country
+        timestamp - datetime to create unique file name
+        output_format - "csv", "parquet" or "feather"
+        kwargs - arguments for the writer, e.g. append or on_flush
+
+    Returns:
+        ResultWriter: a ResultWriter or ColumnarResultWriter
+    """
+    if output_format == "csv":
+        return ResultWriter(results_type, timestamp, **kwargs)
+    if output_format in OUTPUT_FORMATS:
+        return ColumnarResultWriter(results_type, timestamp, output_format, **kwargs)
+    raise ValueError("unknown output format: {}".format(output_format))
+
+
+def get_partition_paths(path):
+    """Return the partitions of columnar results, in the order written.
+
+    Args:
+        path - the results folder
+
+    Returns:
+        list: paths of the partition files
+    """
+    return sorted(
+        partition
+        for partition in Path(path).glob("part-*")
+        if not partition.name.startswith(".")
+    )
+
+
+def truncate_results(path, offset):
+    """Drop results written after a given point, e.g. after a crash.
+
+    Args:
+        path - a results csv or columnar results folder
+        offset - size of the csv, or number of partitions, to keep
+
+    Returns:
+        None
+    """
+    path = Path(path)
+    if not path.is_dir():
+        os.truncate(path, offset)
+        return
+    for partition in get_partition_paths(path)[offset:]:
+        partition.unlink()
+    for temporary in path.glob(".part-*.tmp"):
+        temporary.unlink()
+
+
+def read_columnar_results(path, columns, batch_size, software_name=None):
+    """Read some columns of columnar results, a batch of rows at a time.
+
+    Dictionary-encoded columns become pandas categoricals.
+
+    Args:
+        path - the results folder
+        columns - names of the columns to read
+        batch_size - maximum number of rows per batch
+        software_name - only read rows of this repo or package
+
+    Returns:
+        iterator: dataframes of up to batch_size rows
+    """
+    dataset_module = import_pyarrow("dataset")
+    dataset = dataset_module.dataset(
+        [str(partition) for partition in get_partition_paths(path)],
+        format=get_output_format(path),
+    )
+    row_filter = None
+    if software_name is not None:
+        row_filter = dataset_module.field("software_name") == software_name
+    for batch in dataset.to_batches(
+        columns=columns, filter=row_filter, batch_size=batch_size
+    ):
+        yield batch.to_pandas()
 
 
 def create_csv(results_type, timestamp):
@@ -17,15 +387,9 @@ def create_csv(results_type, timestamp):
     Returns:
         None
     """
-    filename = Path.cwd() / "results"
-    filename.mkdir(exist_ok=True)
-    filename /= results_type + "_" + timestamp + ".csv"
-
     # Create new csv file with column names
-    with open(filename, "w", encoding="utf-8", newline="") as file:
-        fieldnames = ["software_name", "username", "location", "country"]
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        writer.writeheader()
+    with ResultWriter(results_type, timestamp):
+        pass
 
 
 def add_committer_to_csv(
@@ -33,7 +397,8 @@ def add_committer_to_csv(
 ):
     """Write committer info to existing csv file.
 
-    Use to create dataset of location data for analysis.
+    Use to create dataset of location data for analysis. Opens the file
+    for a single row, so prefer a ResultWriter when writing many rows.
 
     Args:
         results_type - a string indicating by contributor or by country
@@ -46,21 +411,132 @@ def add_committer_to_csv(
     Returns:
         null
     """
-    # replace slashes to avoid incorrect creation of directories
-    software_name = software_name.replace("/", "_")
-    filename = Path.cwd() / "results"
-    filename.mkdir(exist_ok=True)
-    filename /= results_type + "_" + timestamp + ".csv"
-    # newline='' prevents spaces in between entries. Setting encoding to utf-8
-    # ensures that most (all?) characters can be read. "a" is for append.
-    with open(filename, "a", encoding="utf-8", newline="") as file:
-        fieldnames = ["software_name", "username", "location", "country"]
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        writer.writerow(
-            {
-                "software_name": software_name,
-                "username": username,
-                "location": location,
-                "country": country,
-            }
+    with ResultWriter(results_type, timestamp, append=True) as writer:
+        writer.write(software_name, username, location, country)
+
+
+def reclassify_csv(filename, chunk_size=RECLASSIFY_CHUNK_SIZE):
+    """Re-derive the country column of an existing results csv.
+
+    Use after the geography lists change, so that old scans can be
+    updated without fetching any locations again. The csv is read in
+    chunks, and each distinct location is classified only once. Parquet
+    and feather results are reclassified into the same format.
+
+    Args:
+        filename - name of a csv or columnar results in the results folder
+        chunk_size - number of rows to process at a time
+
+    Returns:
+        Path: the new results, named after the input with a _reclassified
+              suffix
+    """
+    input_path = Path.cwd() / "results" / filename
+    output_format = get_output_format(filename)
+    if output_format != "csv":
+        with ColumnarResultWriter(
+            input_path.stem, "reclassified", output_format, flush_every=chunk_size
+        ) as writer:
+            for batch in read_columnar_results(
+                input_path, RESULT_FIELDNAMES, chunk_size
+            ):
+                batch = batch.astype(str)
+                batch["country"] = classify_locations(batch["location"])
+                for row in batch.itertuples(index=False):
+                    writer.write(*row)
+        return writer.path
+
+    output_path = input_path.with_name(input_path.stem + "_reclassified.csv")
+
+    # keep_default_na=False keeps "None" countries from becoming NaN
+    chunks = pd.read_csv(
+        input_path,
+        dtype=str,
+        keep_default_na=False,
+        encoding="utf-8",
+        chunksize=chunk_size,
+    )
+    header = True
+    for chunk in chunks:
+        chunk["country"] = classify_locations(chunk["location"])
+        chunk.to_csv(
+            output_path,
+            mode="w" if header else "a",
+            header=header,
+            index=False,
+            encoding="utf-8",
         )
+        header = False
+
+    return output_path
+
+
+def read_results_csv(filename):
+    """Read every row of a results csv, or of parquet or feather results.
+
+    Args:
+        filename - name of a csv or columnar results in the results folder
+
+    Returns:
+        list: a dict per row, keyed by column name
+    """
+    path = Path.cwd() / "results" / filename
+    if get_output_format(filename) != "csv":
+        rows = []
+        for batch in read_columnar_results(
+            path, RESULT_FIELDNAMES, DEFAULT_PARTITION_ROWS
+        ):
+            rows.extend(batch.astype(str).to_dict("records"))
+        return rows
+    with open(path, encoding="utf-8", newline="") as file:
+        return list(csv.DictReader(file))
+
+
+def get_delta_path(results_path):
+    """Return the path of the delta report for a results csv."""
+    results_path = Path(results_path)
+    return results_path.with_name(results_path.stem + "_delta.csv")
+
+
+def write_delta_report(previous_rows, results_path):
+    """Write the changes between an earlier and a new results csv.
+
+    Each contributor that was added to or removed from a repo, or whose
+    location changed, gets one row with change set to "added", "removed"
+    or "location_changed".
+
+    Args:
+        previous_rows - rows of the earlier csv, from read_results_csv()
+        results_path - path of the new csv
+
+    Returns:
+        Path: the report, named after the new csv with a _delta suffix
+    """
+    previous = {(row["software_name"], row["username"]): row for row in previous_rows}
+    current = {
+        (row["software_name"], row["username"]): row
+        for row in read_results_csv(results_path)
+    }
+    delta_path = get_delta_path(results_path)
+    with open(delta_path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=DELTA_FIELDNAMES)
+        writer.writeheader()
+        for key, row in current.items():
+            if key not in previous:
+                change, previous_location = "added", ""
+            elif row["location"] != previous[key]["location"]:
+                change, previous_location = (
+                    "location_changed",
+                    previous[key]["location"],
+                )
+            else:
+                continue
+            writer.writerow(
+                dict(row, change=change, previous_location=previous_location)
+            )
+        for key, row in previous.items():
+            if key not in current:
+                writer.writerow(
+                    dict(row, change="removed", previous_location=row["location"])
+                )
+    return delta_path
@@ -1,59 +1,37 @@
-"""Geography lists used to map user location text to country."""
+"""Geography lists used to map user location text to country.
+
+The lists of countries, states and special cities are defined below. The
+larger tables built from world_cities.csv and country_codes.csv are parsed
+on first use (see load_geography_tables) and kept in a binary cache so
+that later runs skip parsing the CSV files.
+"""
 
 import csv
+import hashlib
+import os
 from pathlib import Path
+import pickle
+import sys
+import threading
 
-# static list of all cities mapped to countries
-# from https://datahub.io/core/world-cities\
-# ignore errors because of many unicode errors.
-with open(Path(__file__).with_name("world_cities.csv"), errors="ignore", newline="") as file:
-    reader = csv.reader(file)
-    city_country_list = list(reader)
-    city_country_dict = {}
-    metro_area_country_dict = {}
-    # TODO: If a city is in the list twice, the country should be ambiguous.
-    for row in city_country_list:
-        # key is city (row[0]), value is country (row[1])
-        city_country_dict[row[0]] = row[1]
-        # key is metro location (row[2]), value is country (row[1])
-        metro_area_country_dict[row[2]] = row[1]
-
-city_country_dict['British Columbia'] = 'Canada'
-city_country_dict['Ontario'] = 'Canada'
-city_country_dict['Quebec'] = 'Canada'
-city_country_dict['Manitoba'] = 'Canada'
-city_country_dict['Alberta'] = 'Canada'
-city_country_dict['New Brunswick'] = 'Canada'
-city_country_dict['Nova Scotia'] = 'Canada'
-city_country_dict['Nsw'] = 'Australia'
-city_country_dict['Qld'] = 'Australia'
-city_country_dict['New South Wales'] = 'Australia'
-city_country_dict['Queensland'] = 'Australia'
-city_country_dict['South Australia'] = 'Australia'
-city_country_dict['Tasmania'] = 'Australia'
-city_country_dict['Victoria'] = 'Australia'
-city_country_dict['Western Australia'] = 'Australia'
-
-CITY_COUNTRY_DICT = city_country_dict
-METRO_AREA_COUNTRY_DICT = metro_area_country_dict
-
-# list of country codes
-with open(Path(__file__).with_name("country_codes.csv"), errors="ignore", newline="") as file:
-    reader = csv.reader(file)
-    code_country_list = list(reader)
-    code_country_dict = {}
-    country_code_dict = {}
-    for row in code_country_list:
-        # key is country code (row[1]), value is country (row[0])
-        code_country_dict[row[1]] = row[0]
-        # key is country (row[0]), value is country code (row[1])
-        country_code_dict[row[0]] = row[1]
+from gitgeo.cache import get_cache_dir
 
+# bump whenever the tables built by parse_geography_tables() change shape
+GEOGRAPHY_TABLES_VERSION = 1
+GEOGRAPHY_TABLES_FILENAME = "geographies.pickle"
+# files whose contents determine the tables
+GEOGRAPHY_SOURCE_FILES = ["world_cities.csv", "country_codes.csv", "geographies_list.py"]
+# module attributes that are built on first use
+LAZY_TABLES = [
+    "CITY_COUNTRY_DICT",
+    "METRO_AREA_COUNTRY_DICT",
+    "CODE_COUNTRY_DICT",
+    "COUNTRY_CODE_DICT",
+    "CITY_COUNTRY_STRINGS",
+]
 
-CODE_COUNTRY_DICT = code_country_dict
-# we create the "inverse" of the other dict to use below to create pre-processed potentials mashups
-# of city,country and city,country_code to make matching stronger against user inputs
-COUNTRY_CODE_DICT = country_code_dict
+_TABLES = None
+_TABLES_LOCK = threading.Lock()
 
 # a list of all countries in the english language
 ALL_COUNTRIES = [
@@ -457,24 +435,196 @@ SPECIAL_CITIES = {
     'Russian Federation':'Russia'
 }
 
-# mashes together the common cities and countries/codes in a stable format,
-# so it's easier for us to try this match first
-CITY_COUNTRY_STRINGS = {}
-# Add ignore errors to deal with strange characters on windows machine
-with open(Path(__file__).with_name("world_cities.csv"), errors="ignore") as file:
-    # pylint: disable=bad-continuation
-    data = file.readlines()
-    for line in csv.reader(
-        data, quotechar='"', delimiter=",", quoting=csv.QUOTE_ALL, skipinitialspace=True
-    ):
-        city = line[0]
-        country = line[1]
-        location = (city + country).replace(",", "").replace(" ", "")
-        CITY_COUNTRY_STRINGS[location] = country
-
-        # in addition to generating city,country->country entries above, let's also generate
-        # city,country_code->country entries in another dict below
-        if country in COUNTRY_CODE_DICT.keys():
-            CITY_COUNTRY_STRINGS[
-                (city + COUNTRY_CODE_DICT[country]).replace(",", "").replace(" ", "")
-            ] = country
+
+def parse_geography_tables():
+    """Build the city, metro area and country code tables from the CSV files.
+
+    world_cities.csv is read in a single streaming pass. Country and metro
+    area names repeat across thousands of rows, so they are interned and
+    every table shares one copy of each name.
+
+    Returns:
+        dict: each table in LAZY_TABLES, keyed by name
+    """
+    # list of country codes
+    code_country_dict = {}
+    # we create the "inverse" of the other dict to use below to create pre-processed potentials mashups
+    # of city,country and city,country_code to make matching stronger against user inputs
+    country_code_dict = {}
+    with open(Path(__file__).with_name("country_codes.csv"), errors="ignore", newline="") as file:
+        for row in csv.reader(file):
+            country = sys.intern(row[0])
+            # key is country code (row[1]), value is country (row[0])
+            code_country_dict[row[1]] = country
+            # key is country (row[0]), value is country code (row[1])
+            country_code_dict[country] = row[1]
+
+    city_country_dict = {}
+    metro_area_country_dict = {}
+    # mashes together the common cities and countries/codes in a stable format,
+    # so it's easier for us to try this match first
+    city_country_strings = {}
+    # country (and country code) with commas and spaces removed, by country
+    compact_countries = {}
+    # static list of all cities mapped to countries
+    # from https://datahub.io/core/world-cities\
+    # ignore errors because of many unicode errors.
+    with open(Path(__file__).with_name("world_cities.csv"), errors="ignore", newline="") as file:
+        # TODO: If a city is in the list twice, the country should be ambiguous.
+        for city, country, metro_area, _ in csv.reader(file):
+            country = sys.intern(country)
+            # key is city, value is country
+            city_country_dict[city] = country
+            # key is metro location, value is country
+            metro_area_country_dict[sys.intern(metro_area)] = country
+
+            if country not in compact_countries:
+                code = country_code_dict.get(country)
+                compact_countries[country] = (
+                    compact_location(country),
+                    None if code is None else compact_location(code),
+                )
+            compact_country, compact_code = compact_countries[country]
+            compact_city = compact_location(city)
+            city_country_strings[compact_city + compact_country] = country
+            # in addition to generating city,country->country entries above, let's also generate
+            # city,country_code->country entries
+            if compact_code is not None:
+                city_country_strings[compact_city + compact_code] = country
+
+    city_country_dict['British Columbia'] = 'Canada'
+    city_country_dict['Ontario'] = 'Canada'
+    city_country_dict['Quebec'] = 'Canada'
+    city_country_dict['Manitoba'] = 'Canada'
+    city_country_dict['Alberta'] = 'Canada'
+    city_country_dict['New Brunswick'] = 'Canada'
+    city_country_dict['Nova Scotia'] = 'Canada'
+    city_country_dict['Nsw'] = 'Australia'
+    city_country_dict['Qld'] = 'Australia'
+    city_country_dict['New South Wales'] = 'Australia'
+    city_country_dict['Queensland'] = 'Australia'
+    city_country_dict['South Australia'] = 'Australia'
+    city_country_dict['Tasmania'] = 'Australia'
+    city_country_dict['Victoria'] = 'Australia'
+    city_country_dict['Western Australia'] = 'Australia'
+
+    return {
+        "CITY_COUNTRY_DICT": city_country_dict,
+        "METRO_AREA_COUNTRY_DICT": metro_area_country_dict,
+        "CODE_COUNTRY_DICT": code_country_dict,
+        "COUNTRY_CODE_DICT": country_code_dict,
+        "CITY_COUNTRY_STRINGS": city_country_strings,
+    }
+
+
+def compact_location(text):
+    """Remove commas and spaces, the form used by CITY_COUNTRY_STRINGS keys."""
+    return text.replace(",", "").replace(" ", "")
+
+
+def get_geography_tables_key():
+    """Identify the source files the tables are built from.
+
+    Returns:
+        list: the tables version, then the modification time, size and
+              sha256 digest of each file in GEOGRAPHY_SOURCE_FILES
+    """
+    key = [GEOGRAPHY_TABLES_VERSION]
+    for filename in GEOGRAPHY_SOURCE_FILES:
+        path = Path(__file__).with_name(filename)
+        stat = path.stat()
+        key.append(
+            (
+                filename,
+                stat.st_mtime_ns,
+                stat.st_size,
+                hashlib.sha256(path.read_bytes()).hexdigest(),
+            )
+        )
+    return key
+
+
+def read_cached_geography_tables(path, key):
+    """Return tables from the binary cache if they match the source files.
+
+    Args:
+        path - location of the cache file
+        key - result of get_geography_tables_key()
+
+    Returns:
+        dict: the cached tables, or None if missing, unreadable or stale
+    """
+    try:
+        with open(path, "rb") as file:
+            cached = pickle.load(file)
+    except Exception:  # pylint: disable=broad-except
+        # a missing or corrupt cache is rebuilt rather than failing the scan
+        return None
+    if not isinstance(cached, dict) or cached.get("key") != key:
+        return None
+    return cached["tables"]
+
+
+def write_cached_geography_tables(path, key, tables):
+    """Store tables in the binary cache, ignoring failures.
+
+    The file is written under a temporary name and moved into place so
+    that concurrent runs never read a partially written cache.
+
+    Args:
+        path - location of the cache file
+        key - result of get_geography_tables_key()
+        tables - result of parse_geography_tables()
+    """
+    temporary_path = path.with_name("{}.{}.tmp".format(path.name, os.getpid()))
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(temporary_path, "wb") as file:
+            pickle.dump(
+                {"key": key, "tables": tables}, file, protocol=pickle.HIGHEST_PROTOCOL
+            )
+        os.replace(temporary_path, path)
+    except OSError:
+        try:
+            temporary_path.unlink()
+        except OSError:
+            pass
+
+
+def load_geography_tables():
+    """Return the tables built from the CSV files, loading them on first use.
+
+    Tables are read from the binary cache in the GitGeo cache directory
+    when it matches the source files, and parsed from the CSV files (and
+    the cache rewritten) otherwise. Once loaded, the tables are also set
+    as module attributes so later lookups skip this function.
+
+    Returns:
+        dict: each table in LAZY_TABLES, keyed by name
+    """
+    global _TABLES  # pylint: disable=global-statement
+
+    if _TABLES is not None:
+        return _TABLES
+    with _TABLES_LOCK:
+        if _TABLES is None:
+            cache_dir = get_cache_dir()
+            tables = None
+            if cache_dir is not None:
+                path = Path(cache_dir) / GEOGRAPHY_TABLES_FILENAME
+                key = get_geography_tables_key()
+                tables = read_cached_geography_tables(path, key)
+            if tables is None:
+                tables = parse_geography_tables()
+                if cache_dir is not None:
+                    write_cached_geography_tables(path, key, tables)
+            globals().update(tables)
+            _TABLES = tables
+    return _TABLES
+
+
+def __getattr__(name):
+    """Build the CSV-derived tables the first time one is accessed."""
+    if name in LAZY_TABLES:
+        return load_geography_tables()[name]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -1,17 +1,98 @@
 """geolocation functionality."""
 
+from bisect import bisect_left
+from collections import OrderedDict
+import functools
+import hashlib
+import json
+import os
+from pathlib import Path
+import threading
+
+import pandas as pd
+
+from gitgeo import geographies_list
 from gitgeo.geographies_list import (
     ALL_COUNTRIES,
-    CITY_COUNTRY_DICT,
-    CODE_COUNTRY_DICT,
     STATE_ABBREV,
     STATE_NAMES,
-    CITY_COUNTRY_STRINGS,
-    METRO_AREA_COUNTRY_DICT,
     SPECIAL_CITIES,
 )
 
 
+class SubstringIndex:
+    """Suffix array answering "which key is the first to contain a text?".
+
+    Equivalent to looping over the keys and returning the first key for
+    which `text in key` is true, but takes a binary search instead of a
+    scan over every key.
+    """
+
+    # sorts after any character found in the geography tables
+    MAX_CHARACTER = "\U0010ffff"
+
+    def __init__(self, keys):
+        """Build the index.
+
+        Args:
+            keys: an ordered collection of strings
+        """
+        self.keys = list(keys)
+        suffixes = sorted(
+            (key[start:], key_position)
+            for key_position, key in enumerate(self.keys)
+            for start in range(len(key))
+        )
+        self.suffixes = [suffix for suffix, _ in suffixes]
+        self.suffix_key_positions = [key_position for _, key_position in suffixes]
+
+    def first_key_containing(self, text):
+        """Return the first key that contains text, or None if none does.
+
+        Args:
+            text: the substring to search for
+
+        Return:
+            str: a key
+        """
+        if not text:
+            # every string contains the empty string
+            return self.keys[0] if self.keys else None
+        # every suffix starting with text lies in this contiguous range
+        low = bisect_left(self.suffixes, text)
+        high = bisect_left(self.suffixes, text + self.MAX_CHARACTER, low)
+        if low == high:
+            return None
+        return self.keys[min(self.suffix_key_positions[low:high])]
+
+
+@functools.lru_cache(maxsize=None)
+def get_metro_area_index():
+    """Return the substring index of metro areas, building it on first use."""
+    return SubstringIndex(geographies_list.METRO_AREA_COUNTRY_DICT.keys())
+
+
+US_STATE_SUFFIXES = frozenset(STATE_NAMES) | frozenset(STATE_ABBREV)
+US_STATE_SUFFIX_LENGTHS = sorted({len(state) for state in US_STATE_SUFFIXES})
+
+
+def ends_with_us_state(location_string):
+    """Return whether a location ends with a US state name or abbreviation.
+
+    Args:
+        location_string: a text containing user-supplied location
+
+    Return:
+        bool: True if the location ends with a state
+    """
+    for length in US_STATE_SUFFIX_LENGTHS:
+        if length > len(location_string):
+            break
+        if location_string[-length:] in US_STATE_SUFFIXES:
+            return True
+    return False
+
+
 def levenshteinDistance(s1, s2):
     """Calculate Levenstein edit distance between two arbitary strings.
 
@@ -44,9 +125,143 @@ def levenshteinDistance(s1, s2):
     return distances[-1]
 
 
+def bounded_levenshtein_distance(s1, s2, limit=None):
+    """Calculate Levenshtein edit distance, giving up once it exceeds limit.
+
+    Uses the bit-parallel algorithm of Myers (1999) as adapted by Hyyrö
+    (2003): each column of the dynamic programming table is encoded in the
+    bits of a few integers, so the distance takes one pass over s2 instead
+    of len(s1) * len(s2) steps. The distance changes by at most one per
+    remaining character, which allows stopping early.
+
+    Args:
+        s1: an arbitrary string
+        s2: a second arbitrary string
+        limit: the largest distance of interest, or None for no limit
+
+    Return:
+        int: the edit distance, or limit + 1 if the distance exceeds limit
+    """
+    if len(s1) > len(s2):
+        s1, s2 = s2, s1
+
+    # the distance is at least the difference in length
+    if limit is not None and len(s2) - len(s1) > limit:
+        return limit + 1
+    if not s1:
+        return len(s2)
+
+    # bit i of a character's mask is set where that character occurs in s1
+    char_masks = {}
+    for position, char in enumerate(s1):
+        char_masks[char] = char_masks.get(char, 0) | (1 << position)
+    all_bits = (1 << len(s1)) - 1
+    last_bit = 1 << (len(s1) - 1)
+
+    # vertical deltas of the current column, +1 and -1 respectively
+    positive = all_bits
+    negative = 0
+    distance = len(s1)
+    remaining = len(s2)
+    for char in s2:
+        match = char_masks.get(char, 0)
+        vertical = match | negative
+        horizontal = (((match & positive) + positive) ^ positive) | match
+        positive_horizontal = negative | ~(horizontal | positive)
+        negative_horizontal = positive & horizontal
+        if positive_horizontal & last_bit:
+            distance += 1
+        elif negative_horizontal & last_bit:
+            distance -= 1
+        positive_horizontal = (positive_horizontal << 1) | 1
+        negative_horizontal <<= 1
+        positive = (negative_horizontal | ~(vertical | positive_horizontal)) & all_bits
+        negative = positive_horizontal & vertical & all_bits
+        remaining -= 1
+        if limit is not None and distance - remaining > limit:
+            return limit + 1
+
+    if limit is not None and distance > limit:
+        return limit + 1
+    return distance
+
+
+class BKTree:
+    """Burkhard-Keller tree for nearest neighbour search by edit distance.
+
+    Each child edge is labelled with the edit distance between the child's
+    word and its parent's word. The triangle inequality then rules out
+    whole subtrees during a search, so only a fraction of the words are
+    compared against the query.
+    """
+
+    def __init__(self, words):
+        """Build the tree.
+
+        Args:
+            words: an ordered collection of distinct strings
+        """
+        self.words = list(words)
+        # a node is a (word position, {edge distance: child node}) pair
+        self.root = None
+        for position, word in enumerate(self.words):
+            self._add(position, word)
+
+    def _add(self, position, word):
+        """Insert a word into the tree."""
+        if self.root is None:
+            self.root = (position, {})
+            return
+        node = self.root
+        while True:
+            distance = bounded_levenshtein_distance(word, self.words[node[0]])
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (position, {})
+                return
+            node = child
+
+    def nearest(self, query):
+        """Return the word closest to query.
+
+        Ties are broken in favour of the word that came first in the input.
+
+        Args:
+            query: the string to match
+
+        Return:
+            str: the closest word, or None if the tree is empty
+        """
+        if self.root is None:
+            return None
+        best_distance = float("inf")
+        best_position = None
+        nodes = [self.root]
+        while nodes:
+            position, children = nodes.pop()
+            # no need for the exact distance beyond what could improve the
+            # best match or reach any child
+            limit = None
+            if best_distance != float("inf"):
+                limit = best_distance + max(children, default=0)
+            distance = bounded_levenshtein_distance(query, self.words[position], limit)
+            if distance < best_distance or (
+                distance == best_distance and position < best_position
+            ):
+                best_distance, best_position = distance, position
+            for edge, child in children.items():
+                if abs(edge - distance) <= best_distance:
+                    nodes.append(child)
+        return self.words[best_position]
+
+
 def edit_distance_to_world(location):
     """Use Levenstein distance to approximate match to city+country strings.
 
+    The closest country is found with a BK-tree built on first use. When
+    several countries are equally close, the one listed first in the world
+    cities list wins.
+
     Args:
         location_string: a text containing user-supplied location
 
@@ -81,21 +296,268 @@ def edit_distance_to_world(location):
     if location in special_locations_international:
         return "None"
 
-    all_countries = set(CITY_COUNTRY_STRINGS.values())
-    MIN_DIST = 1000
-    min_country = None
-    for country in all_countries:
-        dist = levenshteinDistance(location, country)
-        if dist < MIN_DIST:
-            MIN_DIST = dist
-            min_country = country
-    return min_country
+    return get_world_country_tree().nearest(location)
+
+
+@functools.lru_cache(maxsize=None)
+def get_world_country_tree():
+    """Return the BK-tree of countries, building it on first use."""
+    # every country in the world cities list, in order of first appearance
+    return BKTree(dict.fromkeys(geographies_list.CITY_COUNTRY_STRINGS.values()))
+
+
+# maximum number of distinct location strings to remember
+DEFAULT_LOCATION_MEMO_SIZE = 100000
+LOCATION_MEMO_FILENAME = "locations.json"
+# files whose contents determine the answers of classify_location()
+CLASSIFIER_SOURCE_FILES = [
+    "geolocation.py",
+    "geographies_list.py",
+    "world_cities.csv",
+    "country_codes.csv",
+]
+
+
+class LocationMemo:
+    """Thread-safe, bounded LRU memo of location strings to countries.
+
+    Counts hits and misses so that callers can see how often
+    classification is skipped. A memo saved by an earlier run can be
+    attached with set_path(), and is only read on the first lookup that
+    misses, so runs that never classify a location never read it.
+    """
+
+    def __init__(self, maxsize=DEFAULT_LOCATION_MEMO_SIZE):
+        """Create an empty memo.
+
+        Args:
+            maxsize: maximum number of location strings to remember
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        # JSON file to read on the first miss, see set_path()
+        self.path = None
+        self._path_loaded = True
+        self._countries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of remembered location strings."""
+        return len(self._countries)
+
+    def get(self, location_string):
+        """Return the remembered country for a location, or None.
+
+        Args:
+            location_string: a text containing user-supplied location
+
+        Return:
+            str: a country, or None if the location is not remembered
+        """
+        with self._lock:
+            country = self._countries.get(location_string)
+            if country is None and not self._path_loaded:
+                self._path_loaded = True
+                self._read(self.path)
+                country = self._countries.get(location_string)
+            if country is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._countries.move_to_end(location_string)
+            return country
+
+    def set(self, location_string, country):
+        """Remember the country for a location.
+
+        Args:
+            location_string: a text containing user-supplied location
+            country: the country it was classified as
+        """
+        with self._lock:
+            self._countries[location_string] = country
+            self._countries.move_to_end(location_string)
+            self._evict()
+
+    def set_path(self, path):
+        """Read a memo written by save() on the first miss.
+
+        Args:
+            path: location of the JSON file, or None to read nothing
+        """
+        with self._lock:
+            self.path = path
+            self._path_loaded = path is None
+
+    def resize(self, maxsize):
+        """Change the maximum size, evicting entries if necessary.
+
+        Args:
+            maxsize: maximum number of location strings to remember
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def _evict(self):
+        """Forget least recently used locations beyond the maximum size."""
+        while len(self._countries) > self.maxsize:
+            self._countries.popitem(last=False)
+
+    def clear(self):
+        """Forget every location and reset the counters."""
+        with self._lock:
+            self._countries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return hit and miss counters.
+
+        Return:
+            dict: hits, misses, hit_rate, size and maxsize
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._countries),
+                "maxsize": self.maxsize,
+            }
+
+    def save(self, path):
+        """Write the memo to a JSON file, tagged with the classifier version.
+
+        Args:
+            path: location of the JSON file
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            data = {
+                "version": get_classifier_version(),
+                "countries": dict(self._countries),
+            }
+        # write to a temporary file first so a crash never leaves half a file
+        temporary_path = path.with_name(path.name + ".tmp")
+        with open(temporary_path, "w", encoding="utf-8") as memo_file:
+            json.dump(data, memo_file)
+        os.replace(temporary_path, path)
+
+    def load(self, path):
+        """Read a memo written by save(), unless it is outdated or missing.
+
+        Args:
+            path: location of the JSON file
+
+        Return:
+            bool: whether any entries were loaded
+        """
+        with self._lock:
+            return self._read(path)
+
+    def _read(self, path):
+        """Add the entries of a memo written by save().
+
+        Must be called while holding the lock.
+
+        Args:
+            path: location of the JSON file
+
+        Return:
+            bool: whether any entries were loaded
+        """
+        try:
+            with open(path, encoding="utf-8") as memo_file:
+                data = json.load(memo_file)
+        except (OSError, ValueError):
+            return False
+        # answers from an older classifier or geography list may be stale
+        if data.get("version") != get_classifier_version():
+            return False
+        for location_string, country in data["countries"].items():
+            self._countries[location_string] = country
+        self._evict()
+        return True
+
+
+def get_classifier_version():
+    """Return a fingerprint of the code and data used to classify locations.
+
+    Return:
+        str: a hex digest that changes whenever classification might change
+    """
+    digest = hashlib.sha256()
+    for filename in CLASSIFIER_SOURCE_FILES:
+        digest.update(Path(__file__).with_name(filename).read_bytes())
+    return digest.hexdigest()
+
+
+LOCATION_MEMO = LocationMemo()
 
 
 def get_country_from_location(location_string):
     """Return country (Hungary, United States, etc) from user location text.
 
+    Results are memoized in LOCATION_MEMO, so a location string that was
+    seen before is not classified again.
+
+    Args:
+        location_string: a text containing user-supplied location
+
+    Return:
+        str: a country
+    """
+    # an empty location, e.g. read back from a results csv, is no location
+    if location_string is None or not location_string.strip():
+        return "None"
+
+    country = LOCATION_MEMO.get(location_string)
+    if country is None:
+        country = classify_location(location_string)
+        LOCATION_MEMO.set(location_string, country)
+    return country
+
+
+def classify_locations(locations):
+    """Return countries for many location strings at once.
+
+    Each distinct location is classified once, and the results are mapped
+    back onto the input in one vectorized step. Missing locations (None,
+    NaN or empty strings, as read back from a results csv) become "None",
+    like get_country_from_location(None).
+
+    Args:
+        locations: a pandas Series or a list of user-supplied locations
+
+    Return:
+        pandas Series (if given a Series, with the same index) or list:
+        countries, in the same order as locations
+    """
+    is_series = isinstance(locations, pd.Series)
+    if not is_series:
+        locations = pd.Series(list(locations), dtype=object)
+
+    present_locations = locations[locations.notna() & (locations != "")]
+    countries = {
+        location: get_country_from_location(location)
+        for location in present_locations.unique()
+    }
+    result = locations.map(countries).fillna("None").rename("country")
+
+    if is_series:
+        return result
+    return result.tolist()
+
+
+def classify_location(location_string):
+    """Return country (Hungary, United States, etc) from user location text.
+
     This function implements an admittedly imprecise text matching method.
+    Use get_country_from_location() to benefit from memoization.
 
     Args:
         location_string: a text containing user-supplied location
@@ -156,19 +618,19 @@ def get_country_from_location(location_string):
     location_string = location_string.replace("≈Ñ", 'n')
 
     # sometimes they give an international state or metro area
-    if location_string in METRO_AREA_COUNTRY_DICT.keys():
-        return METRO_AREA_COUNTRY_DICT[location_string]
-    for metro in METRO_AREA_COUNTRY_DICT.keys():
-        if location_string in metro:
-            return METRO_AREA_COUNTRY_DICT[metro]
+    if location_string in geographies_list.METRO_AREA_COUNTRY_DICT.keys():
+        return geographies_list.METRO_AREA_COUNTRY_DICT[location_string]
+    metro = get_metro_area_index().first_key_containing(location_string)
+    if metro is not None:
+        return geographies_list.METRO_AREA_COUNTRY_DICT[metro]
 
     # check if city,country is recognized (global and USA) as major city
     stripped_location = location_string.replace(",", "").replace(
         " ", ""
     )  # remove both commas and spaces
 
-    if stripped_location in CITY_COUNTRY_STRINGS.keys():
-        return CITY_COUNTRY_STRINGS[stripped_location]
+    if stripped_location in geographies_list.CITY_COUNTRY_STRINGS.keys():
+        return geographies_list.CITY_COUNTRY_STRINGS[stripped_location]
 
     # one of the weird cities that has larger North American population than global population
     if location_string in SPECIAL_CITIES.keys():
@@ -176,12 +638,8 @@ def get_country_from_location(location_string):
 
 
     # if not international, likely to be USA: check if ends in a state
-    for state in STATE_NAMES:
-        if location_string.endswith(state):
-            return "United States"
-    for state in STATE_ABBREV:
-        if location_string.endswith(state):
-            return "United States"
+    if ends_with_us_state(location_string):
+        return "United States"
 
     # Loop through different typical separators of city, country, etc.
     for separator in [",", " "]:
@@ -196,13 +654,13 @@ def get_country_from_location(location_string):
 
             # Use returns as a way of exiting double loop
             # Mali has a city named San, which messes this up
-            if token in CITY_COUNTRY_DICT.keys() and token != "San" and token != "Bay":
-                return CITY_COUNTRY_DICT[token]
+            if token in geographies_list.CITY_COUNTRY_DICT.keys() and token != "San" and token != "Bay":
+                return geographies_list.CITY_COUNTRY_DICT[token]
             elif token in ALL_COUNTRIES:  # pylint: disable=no-else-return
                 return token
-            elif token in CODE_COUNTRY_DICT.keys():
-                return CODE_COUNTRY_DICT[token]
-            elif token in METRO_AREA_COUNTRY_DICT.keys():
-                return METRO_AREA_COUNTRY_DICT[token]
+            elif token in geographies_list.CODE_COUNTRY_DICT.keys():
+                return geographies_list.CODE_COUNTRY_DICT[token]
+            elif token in geographies_list.METRO_AREA_COUNTRY_DICT.keys():
+                return geographies_list.METRO_AREA_COUNTRY_DICT[token]
 
     return edit_distance_to_world(location_string)
@@ -1,45 +1,253 @@
 """GitHub API-related functionality."""
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
 import itertools
 import json
 import os
+import sys
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
 
 import requests
 
-# GITHUB USERNAME AND TOKEN SECTION - See next ~50 lines.
+from gitgeo.cache import (
+    get_contributor_list_cache,
+    get_profile_cache,
+    get_response_cache,
+)
+from gitgeo.http_session import get_session, MAX_RETRIES
+
+# GITHUB USERNAME AND TOKEN SECTION - See next ~150 lines.
 
 # access secret token for GitHub API to increase rate limit
 # see below for token-related functionality
 GITHUB_USERNAME = os.environ.get("GITHUB_USERNAME")
 
+# GitHub discourages many simultaneous requests with the same token, so cap
+# the number of requests in flight for each token
+MAX_CONCURRENT_REQUESTS_PER_TOKEN = 10
+# seconds to wait for a drained token when GitHub omits X-RateLimit-Reset
+DEFAULT_RATE_LIMIT_WAIT = 60
+# rate limit resource of REST requests; GraphQL queries count against the
+# separate "graphql" resource
+DEFAULT_RATE_LIMIT_RESOURCE = "core"
+GRAPHQL_RATE_LIMIT_RESOURCE = "graphql"
+
+
+class TokenPool:
+    """Thread-safe pool of GitHub tokens that tracks each token's rate limit.
+
+    GitHub keeps a separate budget per token for each API resource, e.g.
+    "core" for REST requests and "graphql" for GraphQL queries. Every
+    response updates the pool with the X-RateLimit-Remaining and
+    X-RateLimit-Reset headers of the resource named in its
+    X-RateLimit-Resource header. The pool always hands out the token with
+    the most remaining budget for the requested resource, preferring the
+    least recently used token on ties (so tokens with unknown budgets are
+    used in turn). When every token is drained, the pool waits until the
+    earliest reset instead of handing out a token that would only be
+    refused.
+    """
+
+    def __init__(self, tokens, max_in_flight=MAX_CONCURRENT_REQUESTS_PER_TOKEN):
+        """Create a pool.
+
+        Args:
+            tokens - a list of GitHub tokens (>=1)
+            max_in_flight - max number of requests in flight per token
+        """
+        self.max_in_flight = max_in_flight
+        self._condition = threading.Condition()
+        self._usage_counter = itertools.count()
+        self._usage = {token: {"in_flight": 0, "last_used": -1} for token in tokens}
+        # rate limit budgets keyed by (token, resource), added on first use
+        self._budgets = {}
+
+    def __len__(self):
+        """Return the number of tokens in the pool."""
+        return len(self._usage)
+
+    def is_authenticated(self):
+        """Return whether the pool holds at least one actual token."""
+        # the only token is None when GITHUB_TOKEN is not set
+        return any(self._usage)
+
+    def __iter__(self):
+        """Return the pool itself so that it can be used like an iterator."""
+        return self
+
+    def __next__(self):
+        """Return the token with the most remaining core budget.
+
+        Unlike token(), the returned token is not counted as in flight.
+        """
+        with self._condition:
+            token = self._wait_for_token(
+                DEFAULT_RATE_LIMIT_RESOURCE, ignore_in_flight=True
+            )
+            self._usage[token]["last_used"] = next(self._usage_counter)
+            return token
+
+    @contextmanager
+    def token(self, resource=DEFAULT_RATE_LIMIT_RESOURCE):
+        """Reserve the best available token for the duration of a request.
+
+        Waits while every token is drained or at its in-flight limit.
+
+        Args:
+            resource - the rate limit resource the request counts against
+
+        Yields:
+            str: a GitHub token
+        """
+        with self._condition:
+            token = self._wait_for_token(resource)
+            usage = self._usage[token]
+            usage["in_flight"] += 1
+            usage["last_used"] = next(self._usage_counter)
+            budget = self._get_budget(token, resource)
+            if budget["remaining"] is not None:
+                # reserve one request so concurrent callers see the decrease
+                budget["remaining"] -= 1
+        try:
+            yield token
+        finally:
+            with self._condition:
+                self._usage[token]["in_flight"] -= 1
+                self._condition.notify_all()
+
+    def update(self, token, headers, resource=DEFAULT_RATE_LIMIT_RESOURCE):
+        """Record the rate limit state reported in a response's headers.
+
+        Args:
+            token - the token the request was sent with
+            headers - the response headers
+            resource - the rate limit resource the request counted against,
+                       used when the response does not name one
+        """
+        remaining = headers.get("X-RateLimit-Remaining")
+        if remaining is None:
+            return
+        reset = headers.get("X-RateLimit-Reset")
+        if reset is None:
+            reset = time.time() + DEFAULT_RATE_LIMIT_WAIT
+        resource = headers.get("X-RateLimit-Resource") or resource
+        with self._condition:
+            budget = self._get_budget(token, resource)
+            budget["remaining"] = int(remaining)
+            budget["reset"] = float(reset)
+            self._condition.notify_all()
+
+    def mark_drained(self, token, reset=None, resource=DEFAULT_RATE_LIMIT_RESOURCE):
+        """Record that GitHub refused a request because a token is drained.
+
+        Args:
+            token - the drained token
+            reset - epoch time at which the token's budget resets, if known
+            resource - the rate limit resource that is drained
+        """
+        with self._condition:
+            budget = self._get_budget(token, resource)
+            budget["remaining"] = 0
+            budget["reset"] = float(reset or time.time() + DEFAULT_RATE_LIMIT_WAIT)
+
+    def _get_budget(self, token, resource):
+        """Return a token's budget for a resource, adding it if needed.
+
+        Must be called while holding the condition's lock.
+
+        Args:
+            token - a GitHub token
+            resource - a rate limit resource, e.g. "core" or "graphql"
+
+        Returns:
+            dict: the remaining budget and its reset time
+        """
+        return self._budgets.setdefault(
+            (token, resource), {"remaining": None, "reset": 0}
+        )
+
+    def _wait_for_token(self, resource, ignore_in_flight=False):
+        """Return the best token for a resource, waiting until one is usable.
+
+        Must be called while holding the condition's lock.
+
+        Args:
+            resource - the rate limit resource the request counts against
+            ignore_in_flight - whether to ignore the per-token request cap
+
+        Returns:
+            str: a GitHub token
+        """
+        while True:
+            now = time.time()
+            # the token itself may be None when GITHUB_TOKEN is not set
+            best_token = None
+            best_rank = None
+            earliest_reset = None
+            num_drained = 0
+            for token, usage in self._usage.items():
+                budget = self._get_budget(token, resource)
+                if budget["remaining"] is not None and budget["reset"] <= now:
+                    # the rate limit window has passed, budget is restored
+                    budget["remaining"] = None
+                if budget["remaining"] is not None and budget["remaining"] <= 0:
+                    num_drained += 1
+                    if earliest_reset is None or budget["reset"] < earliest_reset:
+                        earliest_reset = budget["reset"]
+                    continue
+                if not ignore_in_flight and usage["in_flight"] >= self.max_in_flight:
+                    continue
+                # unknown budgets rank above any known budget
+                remaining = budget["remaining"]
+                if remaining is None:
+                    remaining = float("inf")
+                rank = (remaining, -usage["last_used"])
+                if best_rank is None or rank > best_rank:
+                    best_token, best_rank = token, rank
+
+            if best_rank is not None:
+                return best_token
+
+            if num_drained == len(self._usage):
+                wait = max(earliest_reset - now, 0) + 1
+                print(
+                    "All GitHub tokens are rate limited for {}. "
+                    "Waiting {:.0f} seconds.".format(resource, wait),
+                    file=sys.stderr,
+                )
+                self._condition.wait(wait)
+            else:
+                # wait for an in-flight request to finish
+                self._condition.wait()
+
 
 def get_github_tokens(token_file="tokens.txt"):  # nosec
     """Retrieve GitHub token or tokens.
 
     Either retrieve tokens from the tokens.txt file or retrieve the
-    environmental variable. Then convert the results to a list that
-    cycles to enable the GitHub API calls to easily cycle through
-    tokens. The itertools.cycle data structure allows the use of
-    next() to retrieve the next item in the list, including allowing the
-    last list item to link to the first list item.
+    environmental variable. Then place the results in a TokenPool, which
+    picks the token with the most remaining rate limit budget for each
+    request. The pool also supports next(), which retrieves the best token
+    and cycles through tokens whose budgets are equal or unknown.
 
     Args:
         token_file - a txt document containing one token per line
 
     Returns:
-        cycle_token_list - a list of tokens (>=1) to cycle through
+        token_pool - a TokenPool of tokens (>=1)
 
     """
     token_list = read_in_github_token_list(token_file)
-    if token_list:
-        cycle_token_list = itertools.cycle(token_list)
-    else:
-        # place single environmental variable in list so that cycle
+    if not token_list:
+        # place single environmental variable in list so that the pool
         # functionality will still work properly
-        cycle_token_list = itertools.cycle([os.environ.get("GITHUB_TOKEN")])
+        token_list = [os.environ.get("GITHUB_TOKEN")]
 
-    # return iterable token list.
-    return cycle_token_list
+    return TokenPool(token_list)
 
 
 def read_in_github_token_list(file="tokens.txt"):
@@ -71,72 +279,482 @@ def read_in_github_token_list(file="tokens.txt"):
 # token-related functions are available above
 GITHUB_TOKENS = get_github_tokens()
 
+# default number of user profiles fetched at the same time
+DEFAULT_CONCURRENCY = 10
+
+DEFAULT_GITHUB_API_URL = "https://api.github.com"
+# base URL of the REST and GraphQL APIs, changed through set_github_api_url()
+# e.g. to point at a local mock server
+GITHUB_API_SETTINGS = {
+    "url": (os.environ.get("GITHUB_API_URL") or DEFAULT_GITHUB_API_URL).rstrip("/")
+}
+# ways of fetching user locations: one REST request per user, or GraphQL
+# queries that each resolve a batch of users
+BACKENDS = ["rest", "graphql"]
+DEFAULT_BACKEND = "rest"
+# GitHub limits a GraphQL query to 100 nodes per connection, keep within it
+GRAPHQL_BATCH_SIZE = 100
+
+
+def set_github_api_url(url):
+    """Send all later GitHub requests to another API base URL.
+
+    Args:
+        url: base URL of the API, e.g. http://localhost:8000
+
+    Returns:
+        None
+    """
+    GITHUB_API_SETTINGS["url"] = url.rstrip("/")
+
+
+def get_github_api_url(path):
+    """Return the URL of an API path, e.g. "/users/octocat"."""
+    return GITHUB_API_SETTINGS["url"] + path
+
+
+def get_retry_after(headers):
+    """Return the number of seconds a Retry-After header asks to wait.
+
+    Args:
+        headers: the response headers
+
+    Return:
+        float: seconds to wait, or DEFAULT_RATE_LIMIT_WAIT if the header is
+               neither a number of seconds nor an HTTP date
+    """
+    value = headers.get("Retry-After", "").strip()
+    try:
+        return float(max(int(value), 0))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return DEFAULT_RATE_LIMIT_WAIT
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
 
-def get_contributors(repo, max_num_contributors=100):
+def get_backend(backend):
+    """Return the backend to fetch locations with.
+
+    GitHub refuses every GraphQL query without a token, and fetching each
+    refused batch through REST afterwards would be slower than the REST
+    backend, so unauthenticated GraphQL runs switch to REST up front.
+
+    Args:
+        backend: "rest" or "graphql"
+
+    Return:
+        str: the requested backend, or "rest" if GraphQL cannot be used
+    """
+    if backend == "graphql" and not GITHUB_TOKENS.is_authenticated():
+        print(
+            "The GraphQL backend needs a GitHub token (GITHUB_TOKEN or "
+            "tokens.txt). Using the REST backend instead.",
+            file=sys.stderr,
+        )
+        return "rest"
+    return backend
+
+
+def request_github(url, etag=None, last_modified=None, payload=None):
+    """Send an authenticated request to the GitHub API.
+
+    If validators from an earlier response are given, the request is sent
+    as a conditional request. GitHub answers it with 304 Not Modified,
+    which does not count against the rate limit, when nothing changed.
+    Requests refused because a token is drained are retried with another
+    token, waiting for a rate limit reset if necessary. Requests refused by
+    GitHub's secondary rate limits (429, or 403 with Retry-After) are
+    retried after the Retry-After delay, up to MAX_RETRIES times. The
+    session itself never retries a 429, so that no request is repeated
+    with a drained token.
+    All requests share one pooled, keep-alive HTTP session.
+
+    Args:
+        url: a GitHub API URL
+        etag: ETag header of an earlier response to the same URL
+        last_modified: Last-Modified header of an earlier response
+        payload: a JSON body to POST, e.g. a GraphQL query, instead of a GET
+
+    Return:
+        requests.Response: the API response
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    # GraphQL queries are the only POST requests and have their own budget
+    if payload is None:
+        resource = DEFAULT_RATE_LIMIT_RESOURCE
+    else:
+        resource = GRAPHQL_RATE_LIMIT_RESOURCE
+
+    num_retries = 0
+    while True:
+        # use the token with the most remaining rate limit budget
+        with GITHUB_TOKENS.token(resource) as github_token:
+            # convert username and token to strings per requests's specifications
+            auth = (str(GITHUB_USERNAME), str(github_token))
+            if payload is None:
+                response = get_session().get(url, headers=headers, auth=auth)
+            else:
+                response = get_session().post(url, json=payload, auth=auth)
+            GITHUB_TOKENS.update(github_token, response.headers, resource)
+
+        # a drained token is refused with 403 (or 429); retry with another
+        # token, or after the earliest reset if every token is drained
+        if (
+            response.status_code in (403, 429)
+            and response.headers.get("X-RateLimit-Remaining") == "0"
+        ):
+            GITHUB_TOKENS.mark_drained(
+                github_token,
+                response.headers.get("X-RateLimit-Reset"),
+                response.headers.get("X-RateLimit-Resource") or resource,
+            )
+            continue
+
+        # secondary rate limits (e.g. too many concurrent requests) ask the
+        # client to wait for Retry-After seconds; give up after a few tries
+        # and hand the refusal back like any other failed request
+        if (
+            response.status_code == 429
+            or (response.status_code == 403 and "Retry-After" in response.headers)
+        ) and num_retries < MAX_RETRIES:
+            num_retries += 1
+            time.sleep(get_retry_after(response.headers))
+            continue
+
+        return response
+
+
+def get_contributors(repo, max_num_contributors=100, concurrency=DEFAULT_CONCURRENCY):
     """Generate list of up to top 500 contributors for a repo.
 
     Create list of contributors for a repo. The GitHub API will return up
     to the top 500 contributors for a repo. The list will be organized by
-    the contributors with the most commits in descending order.
+    the contributors with the most commits in descending order. Pages
+    fetched before are requested conditionally and, if unchanged, read
+    from the local response cache.
+
+    The first page is fetched on its own. Its Link header names the last
+    page, and the pages in between are then fetched concurrently.
+
+    Complete lists are also cached per repo and max_num_contributors for
+    a day, so that scanning a repo again soon afterwards sends no request.
 
     Args:
         repo: a GitHub repo url
         max_num_contributors: the maximum number of contributors to return
                               if available
+        concurrency: the maximum number of pages to fetch at the same time
 
     Return:
         list: committer handles
     """
-    committers = []
+    list_cache = get_contributor_list_cache()
+    repo_url = get_github_api_url("/repos/" + repo)
+    if list_cache is not None:
+        cached_list = list_cache.get(repo_url, max_num_contributors)
+        if cached_list is not None and not list_cache.is_expired(cached_list):
+            return cached_list["contributors"]
+
+    committers, complete = fetch_contributors(repo, max_num_contributors, concurrency)
+    # never cache a list cut short by a failed request
+    if list_cache is not None and complete:
+        list_cache.set(repo_url, max_num_contributors, committers)
+    return committers
+
+
+def fetch_contributors(repo, max_num_contributors, concurrency):
+    """Fetch the pages of a repo's contributor list.
+
+    Args:
+        repo: a GitHub repo url
+        max_num_contributors: the maximum number of contributors to return
+        concurrency: the maximum number of pages to fetch at the same time
+
+    Return:
+        tuple: list of committer handles, and whether every page request
+               succeeded
+    """
     max_num_pages = int(max_num_contributors / 100)
+    committers, links, complete = get_contributor_page(repo, 1)
+
+    # determine if pagination has ended or not. If there are more pages
+    # to return, the API JSON will include a 'next' field
+    if max_num_pages < 2 or "next" not in links:
+        return committers, complete
+
+    last_page = get_page_number(links.get("last", {}).get("url"))
+    if last_page is None or concurrency <= 1:
+        # the loop handles pagination associated with the GitHub API
+        for page in range(2, max_num_pages + 1):
+            page_committers, links, page_ok = get_contributor_page(repo, page)
+            committers.extend(page_committers)
+            complete = complete and page_ok
+            if "next" not in links:
+                break
+        return committers, complete
+
+    pages = range(2, min(last_page, max_num_pages) + 1)
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(pages))) as executor:
+        # executor.map returns pages in page order, not completion order
+        for page_committers, _, page_ok in executor.map(
+            lambda page: get_contributor_page(repo, page), pages
+        ):
+            complete = complete and page_ok
+            # the list may have shrunk since the first page was fetched
+            if not page_committers:
+                break
+            committers.extend(page_committers)
+
+    return committers, complete
+
+
+def get_contributor_page(repo, page):
+    """Fetch one page of up to 100 contributors for a repo.
 
-    # the loop handles pagination associated with the GitHub API
-    for page in range(1, max_num_pages + 1):
-        # cycle through GitHub tokens
-        github_token = next(GITHUB_TOKENS)
-        response = requests.get(
-            "https://api.github.com/repos/"
-            + repo
-            + "/contributors?page="
-            + str(page)
-            + "&per_page=100",
-            # convert username and token to strings per requests's specifications
-            auth=(str(GITHUB_USERNAME), str(github_token)),
+    Args:
+        repo: a GitHub repo url
+        page: the page number, starting at 1
+
+    Return:
+        tuple: list of committer handles, dict of the page's links keyed by
+               rel, and whether the request succeeded
+    """
+    url = get_github_api_url(
+        "/repos/" + repo + "/contributors?page=" + str(page) + "&per_page=100"
+    )
+    response_cache = get_response_cache()
+    cached_response = None
+    if response_cache is not None:
+        cached_response = response_cache.get(url)
+
+    if cached_response is not None:
+        response = request_github(
+            url, cached_response["etag"], cached_response["last_modified"]
         )
+    else:
+        response = request_github(url)
+
+    if response.status_code == 304 and cached_response is not None:
+        # unchanged since last scan: serve the stored page
+        repo_items = json.loads(cached_response["body"])
+        links = {}
+        if cached_response["link"]:
+            for link in requests.utils.parse_header_links(cached_response["link"]):
+                links[link.get("rel") or link.get("url")] = link
+    elif response.ok:
+        repo_items = json.loads(response.text or response.content)
+        links = response.links
+        if response_cache is not None:
+            response_cache.set(
+                url,
+                response.text,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+                link=response.headers.get("Link"),
+            )
+    else:
+        return [], response.links, False
 
-        if response.ok:
-            repo_items = json.loads(response.text or response.content)
-            for item in repo_items:
-                committers.append(item["login"])
+    return [item["login"] for item in repo_items], links, True
 
-        # determine if pagination has ended or not. If there are more pages
-        # to return, the API JSON will include a 'next' field
-        if "next" not in response.links:
-            break
 
-    return committers
+def get_page_number(url):
+    """Return the page query parameter of a URL, or None if it has none.
+
+    Args:
+        url: a paginated GitHub API URL, or None
+
+    Return:
+        int: the page number
+    """
+    if url is None:
+        return None
+    pages = parse_qs(urlparse(url).query).get("page")
+    if not pages or not pages[0].isdigit():
+        return None
+    return int(pages[0])
 
 
 def get_contributor_location(user):
     """Return geographic location, if present on github page, of user.
 
+    Profiles fetched recently are served from the local profile cache
+    instead of the GitHub API. Expired profiles are requested
+    conditionally, and reused if GitHub reports them unchanged.
+
     Args:
         user: the GitHub user name
 
     Return:
         str: a geographic location
     """
-    # cycle through GitHub tokens
-    github_token = next(GITHUB_TOKENS)
-    response = requests.get(
-        "https://api.github.com/users/" + user,
-        # convert username and token to strings per requests's specifications
-        auth=(str(GITHUB_USERNAME), str(github_token)),
-    )
+    profile_cache = get_profile_cache()
+    user_url = get_github_api_url("/users/" + user)
+    cached_profile = None
+    if profile_cache is not None:
+        cached_profile = profile_cache.get(user_url)
+
+    if cached_profile is not None:
+        if not profile_cache.is_expired(cached_profile):
+            return cached_profile["location"]
+        response = request_github(
+            user_url, cached_profile["etag"], cached_profile["last_modified"]
+        )
+    else:
+        response = request_github(user_url)
 
     user_location = ""
-    if response.ok:
+    if response.status_code == 304 and cached_profile is not None:
+        # unchanged since last fetch: keep the cached location fresh
+        user_location = cached_profile["location"]
+        profile_cache.set(
+            user_url,
+            user_location,
+            cached_profile["etag"],
+            cached_profile["last_modified"],
+        )
+    elif response.ok:
         user_info = json.loads(response.text or response.content)
         user_location = user_info["location"]
+        if profile_cache is not None:
+            profile_cache.set(
+                user_url,
+                user_location,
+                response.headers.get("ETag"),
+                response.headers.get("Last-Modified"),
+            )
 
     return user_location
+
+
+def get_contributor_locations_graphql(users, concurrency=DEFAULT_CONCURRENCY):
+    """Return geographic locations of users, resolved in GraphQL batches.
+
+    Each GraphQL query asks for up to GRAPHQL_BATCH_SIZE users at once using
+    aliased user(login:) fields, so a 500-contributor repo needs 5 requests
+    instead of 500. Users found in the local profile cache are not queried.
+    Users GraphQL cannot resolve, such as GitHub App bots, are fetched
+    through the REST API instead.
+
+    Args:
+        users: a list of GitHub user names
+        concurrency: the maximum number of queries to send at the same time
+
+    Return:
+        dict: geographic location keyed by user name
+    """
+    locations = {}
+    profile_cache = get_profile_cache()
+    users_to_query = []
+    for user in dict.fromkeys(users):  # remove duplicates, keep order
+        cached_profile = None
+        if profile_cache is not None:
+            cached_profile = profile_cache.get(get_github_api_url("/users/" + user))
+        if cached_profile is not None and not profile_cache.is_expired(cached_profile):
+            locations[user] = cached_profile["location"]
+        else:
+            users_to_query.append(user)
+
+    batches = [
+        users_to_query[index : index + GRAPHQL_BATCH_SIZE]
+        for index in range(0, len(users_to_query), GRAPHQL_BATCH_SIZE)
+    ]
+    if concurrency > 1 and len(batches) > 1:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(batches))) as executor:
+            batch_results = list(executor.map(query_user_locations, batches))
+    else:
+        batch_results = [query_user_locations(batch) for batch in batches]
+
+    for batch_result in batch_results:
+        locations.update(batch_result)
+
+    return locations
+
+
+def query_user_locations(users):
+    """Resolve the locations of up to GRAPHQL_BATCH_SIZE users in one query.
+
+    Args:
+        users: a list of GitHub user names
+
+    Return:
+        dict: geographic location keyed by user name
+    """
+    # e.g. query($login0: String!) { user0: user(login: $login0) { location } }
+    query = "query({}) {{ {} }}".format(
+        ", ".join("$login{}: String!".format(index) for index in range(len(users))),
+        " ".join(
+            "user{0}: user(login: $login{0}) {{ location }}".format(index)
+            for index in range(len(users))
+        ),
+    )
+    variables = {"login{}".format(index): user for index, user in enumerate(users)}
+    response = request_github(
+        get_github_api_url("/graphql"),
+        payload={"query": query, "variables": variables},
+    )
+
+    user_infos = {}
+    if response.ok:
+        user_infos = json.loads(response.text or response.content).get("data") or {}
+
+    profile_cache = get_profile_cache()
+    locations = {}
+    for index, user in enumerate(users):
+        user_info = user_infos.get("user{}".format(index))
+        if user_info is None:
+            # not resolvable through GraphQL, fall back to REST
+            locations[user] = get_contributor_location(user)
+        else:
+            locations[user] = user_info["location"]
+            if profile_cache is not None:
+                profile_cache.set(
+                    get_github_api_url("/users/" + user), user_info["location"]
+                )
+
+    return locations
+
+
+def get_contributor_locations(
+    users, concurrency=DEFAULT_CONCURRENCY, backend=DEFAULT_BACKEND
+):
+    """Return geographic locations, if present on github pages, of users.
+
+    With the REST backend, fetch user profiles concurrently with a bounded
+    pool of threads. The pool is never larger than the per-token
+    concurrency limit multiplied by the number of available tokens. With
+    the GraphQL backend, resolve users in batches instead, unless there is
+    no GitHub token to send the queries with.
+
+    Args:
+        users: a list of GitHub user names
+        concurrency: the maximum number of requests to send at the same time
+        backend: "rest" or "graphql"
+
+    Return:
+        list: geographic locations, in the same order as users
+    """
+    users = list(users)
+    if get_backend(backend) == "graphql":
+        locations = get_contributor_locations_graphql(users, concurrency)
+        return [locations[user] for user in users]
+
+    max_workers = min(
+        concurrency, len(GITHUB_TOKENS) * GITHUB_TOKENS.max_in_flight, len(users)
+    )
+
+    # no need for threads when only one request can run at a time
+    if max_workers <= 1:
+        return [get_contributor_location(user) for user in users]
+
+    # executor.map returns results in input order, not completion order
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(get_contributor_location, users))
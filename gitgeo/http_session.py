@@ -0,0 +1,84 @@
+"""Shared HTTP session used for all GitHub and PyPI requests."""
+
+import threading
+
+import requests
+from urllib3.util.retry import Retry
+
+from gitgeo.transport import create_default_transport
+
+# number of hosts to keep connection pools for
+POOL_CONNECTIONS = 4
+# number of keep-alive connections per host, enough for concurrent fetching
+POOL_MAXSIZE = 32
+# retry transient server errors with exponential backoff
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 0.5
+# 429 Too Many Requests is left to github.request_github(), which switches
+# to another token instead of waiting with a drained one
+RETRY_STATUS_CODES = [500, 502, 503, 504]
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+def create_session(pool_maxsize=POOL_MAXSIZE, max_retries=MAX_RETRIES):
+    """Create a requests session with connection pooling and retries.
+
+    The session keeps connections alive between requests, so each host
+    costs one TLS handshake per connection instead of one per request.
+    Responses with a status code in RETRY_STATUS_CODES are retried with
+    exponential backoff, honouring any Retry-After header.
+
+    Args:
+        pool_maxsize - number of connections to keep open per host
+        max_retries - number of times to retry a failed request
+
+    Returns:
+        requests.Session: a configured session
+    """
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS_CODES,
+        # GraphQL queries are POSTs but safe to repeat
+        allowed_methods=frozenset(["GET", "HEAD", "POST"]),
+        respect_retry_after_header=True,
+        # hand the last response back instead of raising
+        raise_on_status=False,
+    )
+    # a plain HTTPAdapter unless a record or replay transport is configured
+    adapter = create_default_transport(
+        pool_connections=POOL_CONNECTIONS, pool_maxsize=pool_maxsize, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate", "User-Agent": "gitgeo"})
+    return session
+
+
+def get_session():
+    """Return the shared session, creating it on first use."""
+    global _SESSION  # pylint: disable=global-statement
+
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            _SESSION = create_session()
+        return _SESSION
+
+
+def set_session(session):
+    """Replace the shared session, e.g. with a fake one in tests.
+
+    Args:
+        session - an object with requests.Session's get and post methods,
+                  or None to create a fresh default session on next use
+
+    Returns:
+        None
+    """
+    global _SESSION  # pylint: disable=global-statement
+
+    with _SESSION_LOCK:
+        _SESSION = session
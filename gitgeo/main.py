@@ -1,12 +1,34 @@
 """Identify committer geographies associated with python package."""
 
 import argparse
+import sys
 
-from gitgeo.github import get_contributors
-from gitgeo.mapping import make_map
+from gitgeo.cache import configure_cache, DEFAULT_PROFILE_TTL, get_cache_dir
+from gitgeo.custom_csv import (
+    DEFAULT_OUTPUT_FORMAT,
+    get_delta_path,
+    OUTPUT_FORMATS,
+    reclassify_csv,
+)
+from gitgeo.geolocation import (
+    DEFAULT_LOCATION_MEMO_SIZE,
+    LOCATION_MEMO,
+    LOCATION_MEMO_FILENAME,
+)
+from gitgeo.github import (
+    BACKENDS,
+    DEFAULT_BACKEND,
+    DEFAULT_CONCURRENCY,
+    get_contributors,
+    GITHUB_API_SETTINGS,
+    set_github_api_url,
+)
+from gitgeo.mapping import make_map, make_per_repo_maps
 from gitgeo.multi_repo_scan import scan_multiple_repos
 from gitgeo.printers import print_by_country, print_by_contributor
 from gitgeo.pypi import get_pypi_data, extract_github_owner_and_repo
+from gitgeo.transport import configure_transport, TRANSPORT_MODES, TRANSPORT_SETTINGS
+from gitgeo.world_geometry import DEFAULT_MAP_RESOLUTION, MAP_RESOLUTIONS
 
 
 def parse_arguments():  # pragma: no cover
@@ -20,6 +42,20 @@ def parse_arguments():  # pragma: no cover
         action="store_true",
         help="Scan multiple repos from input file.",
     )
+    parser.add_argument(
+        "--resume",
+        dest="resume",
+        action="store",
+        type=str,
+        help="Resume an interrupted multirepo scan, given its results csv.",
+    )
+    parser.add_argument(
+        "--incremental",
+        dest="incremental",
+        action="store",
+        type=str,
+        help="Rescan multiple repos, reusing an earlier multirepo results csv.",
+    )
     parser.add_argument(
         "--multirepo_map",
         dest="multirepo_map",
@@ -27,6 +63,26 @@ def parse_arguments():  # pragma: no cover
         type=str,
         help="Convert mutlirepo scan file into map.",
     )
+    parser.add_argument(
+        "--per-repo",
+        dest="per_repo",
+        action="store_true",  # when per-repo is not called, default is false
+        help="With --multirepo_map, make one map per repo.",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        dest="processes",
+        help="Specify number of processes rendering per-repo maps.",
+    )
+    parser.add_argument(
+        "--reclassify",
+        dest="reclassify",
+        action="store",
+        type=str,
+        help="Re-derive the country column of a results csv.",
+    )
     parser.add_argument(
         "--summary",
         dest="summary",
@@ -39,12 +95,26 @@ def parse_arguments():  # pragma: no cover
         action="store_true",  # when output_csv is not called, default is false
         help="Output results in csv.",
     )
+    parser.add_argument(
+        "--output-format",
+        choices=OUTPUT_FORMATS,
+        default=DEFAULT_OUTPUT_FORMAT,
+        dest="output_format",
+        help="Specify format of result files, parquet and feather need pyarrow.",
+    )
     parser.add_argument(
         "--map",
         dest="map",
         action="store_true",  # when map is not called, default is false
         help="Display country by country results in map.",
     )
+    parser.add_argument(
+        "--map-resolution",
+        choices=MAP_RESOLUTIONS,
+        default=DEFAULT_MAP_RESOLUTION,
+        dest="map_resolution",
+        help="Specify detail of country borders in maps.",
+    )
     parser.add_argument(
         "--num",
         choices=range(100, 501, 100),  # 501 so that upper limit is 500
@@ -53,10 +123,77 @@ def parse_arguments():  # pragma: no cover
         dest="num",
         help="Specify max number of contributors per repo.",
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        dest="concurrency",
+        help="Specify max number of contributor locations to fetch at once.",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default=DEFAULT_BACKEND,
+        dest="backend",
+        help="Specify how to fetch contributor locations from GitHub.",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        help="Specify directory for the local GitHub profile cache.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="no_cache",
+        action="store_true",  # when no-cache is not called, default is false
+        help="Always fetch GitHub profiles instead of using the local cache.",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        default=DEFAULT_PROFILE_TTL,
+        type=int,
+        dest="cache_ttl",
+        help="Specify number of seconds a cached GitHub profile stays fresh.",
+    )
+    parser.add_argument(
+        "--location-memo-size",
+        default=DEFAULT_LOCATION_MEMO_SIZE,
+        type=int,
+        dest="location_memo_size",
+        help="Specify max number of location classifications to remember.",
+    )
+    parser.add_argument(
+        "--api-url",
+        default=GITHUB_API_SETTINGS["url"],
+        dest="api_url",
+        help="Specify GitHub API base URL, e.g. of a local mock server.",
+    )
+    parser.add_argument(
+        "--transport",
+        choices=TRANSPORT_MODES,
+        default=TRANSPORT_SETTINGS["mode"],
+        dest="transport",
+        help="Use the network, record traffic to cassettes or replay them.",
+    )
+    parser.add_argument(
+        "--cassette-dir",
+        default=TRANSPORT_SETTINGS["cassette_dir"],
+        dest="cassette_dir",
+        help="Specify directory of recorded GitHub and PyPI traffic.",
+    )
+    parser.add_argument(
+        "--replay-latency",
+        type=float,
+        default=TRANSPORT_SETTINGS["latency"],
+        dest="replay_latency",
+        help="Specify seconds to wait before each replayed response.",
+    )
     return parser.parse_args()
 
 
-def scan_single_package(pkg, summary, num=100):
+def scan_single_package(
+    pkg, summary, num=100, concurrency=DEFAULT_CONCURRENCY, backend=DEFAULT_BACKEND
+):
     """Print location results for single package.
 
     Printing can either be by contributor or by country.
@@ -65,24 +202,42 @@ def scan_single_package(pkg, summary, num=100):
         pkg - name of python package on PyPI
         summary - whether to summarize answers by country or not
         num - max number of contributors to analyze
+        concurrency - max number of contributor locations to fetch at once
+        backend - how to fetch contributor locations, "rest" or "graphql"
 
     Returns:
         null
     """
     pypi_data = get_pypi_data(pkg)
-    contributors = get_contributors(pypi_data["github_owner_and_repo"], num)
+    contributors = get_contributors(
+        pypi_data["github_owner_and_repo"], num, concurrency
+    )
     print("-----------------")
     print("PACKAGE: {}".format(pkg))
     print("GITHUB REPO: {}".format(pypi_data["github_owner_and_repo"]))
     print("-----------------")
 
     if summary:
-        print_by_country(contributors)
+        print_by_country(contributors, concurrency, backend)
     else:
-        print_by_contributor(pkg, contributors, pypi_data=pypi_data)
+        print_by_contributor(
+            pkg,
+            contributors,
+            pypi_data=pypi_data,
+            concurrency=concurrency,
+            backend=backend,
+        )
 
 
-def scan_single_repo(repo, summary, output_csv, num=100):
+def scan_single_repo(
+    repo,
+    summary,
+    output_csv,
+    num=100,
+    concurrency=DEFAULT_CONCURRENCY,
+    backend=DEFAULT_BACKEND,
+    output_format=DEFAULT_OUTPUT_FORMAT,
+):
     """Print location results for single GitHub repository.
 
     Printing can either be by contributor or by country.
@@ -93,36 +248,122 @@ def scan_single_repo(repo, summary, output_csv, num=100):
         summary - whether to print results by country, i.e. summary.
         output_csv - whether to store output in csv (default: false)
         num - max number of contributors to analyze
+        concurrency - max number of contributor locations to fetch at once
+        backend - how to fetch contributor locations, "rest" or "graphql"
+        output_format - format of the output, "csv", "parquet" or "feather"
 
     Returns:
         null
     """
     repo_ending_string = extract_github_owner_and_repo(repo)
-    contributors = get_contributors(repo_ending_string, num)
+    contributors = get_contributors(repo_ending_string, num, concurrency)
     print("-----------------")
     print("GITHUB REPO: {}".format(repo_ending_string))
     print("-----------------")
 
     if summary:
-        print_by_country(contributors)
+        print_by_country(contributors, concurrency, backend)
     else:
-        print_by_contributor(repo_ending_string, contributors, output_csv)
+        print_by_contributor(
+            repo_ending_string,
+            contributors,
+            output_csv,
+            concurrency=concurrency,
+            backend=backend,
+            output_format=output_format,
+        )
+
+
+def print_location_memo_stats():
+    """Print how often location classification was skipped, if it was used.
+
+    Returns:
+        null
+    """
+    stats = LOCATION_MEMO.stats()
+    if not stats["hits"] + stats["misses"]:
+        return
+    # keep results on stdout free of diagnostics
+    print(
+        "LOCATION MEMO: {hits} hits, {misses} misses ({hit_rate:.0%} hit rate), "
+        "{size}/{maxsize} entries".format(**stats),
+        file=sys.stderr,
+    )
 
 
 def main(): # pragma: no cover
     args = parse_arguments()
+    configure_cache(
+        cache_dir=args.cache_dir,
+        enabled=not args.no_cache,
+        profile_ttl=args.cache_ttl,
+    )
+    configure_transport(args.transport, args.cassette_dir, args.replay_latency)
+    set_github_api_url(args.api_url)
+
+    # reuse location classifications remembered from earlier runs; they are
+    # read on the first classification, so runs that classify nothing skip it
+    LOCATION_MEMO.resize(args.location_memo_size)
+    cache_dir = get_cache_dir()
+    if cache_dir is not None:
+        LOCATION_MEMO.set_path(cache_dir / LOCATION_MEMO_FILENAME)
+
+    try:
+        run_scan(args)
+        print_location_memo_stats()
+    finally:
+        if cache_dir is not None and LOCATION_MEMO.misses:
+            LOCATION_MEMO.save(cache_dir / LOCATION_MEMO_FILENAME)
 
+
+def run_scan(args):  # pragma: no cover
+    """Run the scan selected by the command line arguments."""
     if args.package:
-        scan_single_package(args.package, args.summary, args.num)
+        scan_single_package(
+            args.package, args.summary, args.num, args.concurrency, args.backend
+        )
     elif args.repo:
         if args.map:
-            make_map(repo=args.repo, num=args.num)
+            make_map(
+                repo=args.repo,
+                num=args.num,
+                concurrency=args.concurrency,
+                backend=args.backend,
+                resolution=args.map_resolution,
+            )
         else:
-            scan_single_repo(args.repo, args.summary, args.output_csv, args.num)
-    elif args.multirepo:
-        scan_multiple_repos(num=args.num)
+            scan_single_repo(
+                args.repo,
+                args.summary,
+                args.output_csv,
+                args.num,
+                args.concurrency,
+                args.backend,
+                args.output_format,
+            )
+    elif args.multirepo or args.resume or args.incremental:
+        results_path = scan_multiple_repos(
+            num=args.num,
+            concurrency=args.concurrency,
+            backend=args.backend,
+            resume=args.resume,
+            previous=args.incremental,
+            output_format=args.output_format,
+        )
+        if args.incremental:
+            print("MERGED RESULTS: {}".format(results_path))
+            print("DELTA REPORT: {}".format(get_delta_path(results_path)))
     elif args.multirepo_map:
-        make_map(csv=args.multirepo_map)
+        if args.per_repo:
+            map_folder = make_per_repo_maps(
+                args.multirepo_map, args.map_resolution, args.processes
+            )
+            print("MAPS: {}".format(map_folder))
+        else:
+            make_map(csv=args.multirepo_map, resolution=args.map_resolution)
+    elif args.reclassify:
+        print("RECLASSIFIED RESULTS: {}".format(reclassify_csv(args.reclassify)))
+
 
 if __name__ == "__main__":
     main()
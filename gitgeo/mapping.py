@@ -6,6 +6,7 @@
 # pylint: disable=invalid-name
 
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 import json
 from pathlib import Path
 import time
@@ -13,12 +14,29 @@ import time
 import folium
 import pandas as pd
 
+from gitgeo.custom_csv import get_output_format, read_columnar_results
 from gitgeo.geolocation import get_country_from_location
-from gitgeo.github import get_contributors, get_contributor_location
+from gitgeo.github import (
+    DEFAULT_BACKEND,
+    DEFAULT_CONCURRENCY,
+    get_contributors,
+    get_contributor_locations,
+)
 from gitgeo.pypi import extract_github_owner_and_repo
+from gitgeo.world_geometry import DEFAULT_MAP_RESOLUTION, load_world_geometry
 
+# rows of a results csv read at a time when counting contributors by country
+CSV_CHUNKSIZE = 100000
 
-def make_map(repo=None, csv=None, num=100):
+
+def make_map(
+    repo=None,
+    csv=None,
+    num=100,
+    concurrency=DEFAULT_CONCURRENCY,
+    backend=DEFAULT_BACKEND,
+    resolution=DEFAULT_MAP_RESOLUTION,
+):
     """Create a world map of contributor locations.
 
     Create a chloropleth world map that displays the number of contributors
@@ -28,6 +46,10 @@ def make_map(repo=None, csv=None, num=100):
         repo - a full GitHub URL
         csv - a filename of a csv in the results folder
         num - number of contributors to analyze per repo
+        concurrency - max number of contributor locations to fetch at once
+        backend - how to fetch contributor locations, "rest" or "graphql"
+        resolution - detail of the country borders, "low", "medium", "high"
+                     or "full"
 
     Returns:
         null
@@ -36,15 +58,44 @@ def make_map(repo=None, csv=None, num=100):
     # generate pandas dataframe of countries and contributor count
     # if input is repo, create dataframe from repo from scatch
     if repo:
-        df, total_num_of_contributors = get_dataframe_from_repo(repo, num)
+        df, total_num_of_contributors = get_dataframe_from_repo(
+            repo, num, concurrency, backend
+        )
         title = repo
     # if input is a csv, create dataframe from csv
     elif csv:
         df, total_num_of_contributors = get_dataframe_from_csv(csv)
         title = csv
 
+    # save with cross-platform, timestamped filename
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    map_filename = Path.cwd() / "results"
+    map_filename.mkdir(exist_ok=True)
+    map_filename /= "map" + "_" + timestamp + ".html"
+    render_map(df, total_num_of_contributors, title, map_filename, resolution)
+
+
+def render_map(
+    df,
+    total_num_of_contributors,
+    title,
+    map_filename,
+    resolution=DEFAULT_MAP_RESOLUTION,
+):
+    """Render a chloropleth world map of contributors by country to html.
+
+    Args:
+        df - a dataframe of contributors by country
+        total_num_of_contributors - total number of contributors
+        title - what the contributors contributed to, e.g. a repo URL
+        map_filename - path of the html file to save
+        resolution - detail of the country borders, see world_geometry
+
+    Returns:
+        Path: the saved html file
+    """
     # add countributor count to world.json
-    world_json = add_contributor_count_to_json(df)
+    world_json = add_contributor_count_to_json(df, resolution)
 
     m = folium.Map(location=[0, 0], zoom_start=1.5)
 
@@ -71,8 +122,9 @@ def make_map(repo=None, csv=None, num=100):
         attr="Mapping via Folium. Data from GitGeo.",
     ).add_to(m)
 
-    # add title to map and also number of contributors with no location
-    num_contributors_no_location = df[df.country == "None"].contributor_count.values[0]
+    # add title to map and also number of contributors with no location,
+    # which may be none at all in a single repo of a multirepo csv
+    num_contributors_no_location = int(df[df.country == "None"].contributor_count.sum())
     title_html = """
              <h3 align="center" style="font-size:16px"><b>{}</b></h3>
              """.format(
@@ -92,15 +144,62 @@ def make_map(repo=None, csv=None, num=100):
     # add ability to turn layers on and off
     folium.LayerControl().add_to(m)
 
-    # save with cross-platform, timestamped filename
-    timestamp = time.strftime("%Y%m%d-%H%M%S")
-    map_filename = Path.cwd() / "results"
-    map_filename.mkdir(exist_ok=True)
-    map_filename /= "map" + "_" + timestamp + ".html"
     m.save(str(map_filename))
+    return Path(map_filename)
+
+
+def make_per_repo_maps(csv, resolution=DEFAULT_MAP_RESOLUTION, processes=1):
+    """Create a world map of contributor locations for each repo in a csv.
+
+    The csv is read once, in chunks, and grouped by software_name, and all
+    maps are saved to one timestamped folder in the results folder, named
+    after the repo. The world geometry is parsed once per process and
+    shared by all maps rendered in it.
+
+    Args:
+        csv - a filename of a multirepo csv in the results folder
+        resolution - detail of the country borders, see world_geometry
+        processes - number of processes rendering maps at the same time
+
+    Returns:
+        Path: the folder holding the maps
+    """
+    repo_counters = {}
+    for chunk in read_results_chunks(csv, ["software_name", "country"]):
+        country_counts = chunk.groupby(
+            ["software_name", "country"], observed=True, sort=False
+        ).size()
+        for (software_name, country), count in country_counts.items():
+            repo_counters.setdefault(software_name, Counter())[country] += int(count)
+
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    map_folder = Path.cwd() / "results" / ("maps" + "_" + timestamp)
+    map_folder.mkdir(parents=True, exist_ok=True)
+
+    dfs, totals, titles, map_filenames = [], [], [], []
+    for software_name, country_counter in repo_counters.items():
+        dfs.append(
+            pd.DataFrame.from_records(
+                country_counter.most_common(),
+                columns=["country", "contributor_count"],
+            )
+        )
+        totals.append(sum(country_counter.values()))
+        titles.append(software_name)
+        map_filenames.append(map_folder / (software_name + ".html"))
+
+    args = (dfs, totals, titles, map_filenames, [resolution] * len(dfs))
+    if processes > 1 and len(dfs) > 1:
+        # each process parses the world geometry once, for all its maps
+        with ProcessPoolExecutor(max_workers=min(processes, len(dfs))) as executor:
+            list(executor.map(render_map, *args, chunksize=8))
+    else:
+        list(map(render_map, *args))
+
+    return map_folder
 
 
-def add_contributor_count_to_json(df):
+def add_contributor_count_to_json(df, resolution=DEFAULT_MAP_RESOLUTION):
     """Create world json with a contributor count field.
 
     To compensate for inability of folium chloropleth to access the dataframe
@@ -110,40 +209,51 @@ def add_contributor_count_to_json(df):
 
     Args:
         df - a dataframe
+        resolution - detail of the country borders, see world_geometry
 
     Returns:
         json_data - a json object containing a contributor_count field
     """
-    with open(Path(__file__).with_name("world.json")) as original_json_file:
-        # load json file into an object
-        data = json.load(original_json_file)
-        for obj in data["features"]:
-            # check if country is in dataframe
-            country = obj["properties"]["sovereignt"]
-            is_country_in_dataframe = country in df["country"].unique()
-            if is_country_in_dataframe:
-                # extract number of contributors associated with particular country
-                # extract value from series and convert to int
-                contributor_count = int(
-                    df[df.country == country].contributor_count.values[0]
-                )
-                obj["properties"]["contributor_count"] = contributor_count
-            else:
-                # if country not in contributors data frame, this means the
-                # country had zero contributors
-                obj["properties"]["contributor_count"] = 0
-
-        # convert data to json object
-        json_data = json.dumps(data)
-        return json_data
-
-
-def get_dataframe_from_repo(repo, num=100):
+    # count by country, looked up once per feature instead of filtering
+    # the dataframe for each of them
+    contributor_counts = {}
+    for country, contributor_count in zip(df["country"], df["contributor_count"]):
+        contributor_counts.setdefault(country, int(contributor_count))
+
+    # new features around the shared geometry, which is never copied.
+    # countries not in the dataframe had zero contributors
+    data = {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "properties": dict(
+                    feature["properties"],
+                    contributor_count=contributor_counts.get(
+                        feature["properties"]["sovereignt"], 0
+                    ),
+                ),
+                "geometry": feature["geometry"],
+            }
+            for feature in load_world_geometry(resolution)["features"]
+        ],
+    }
+
+    # convert data to json object, without whitespace as it ends up in the map
+    json_data = json.dumps(data, separators=(",", ":"))
+    return json_data
+
+
+def get_dataframe_from_repo(
+    repo, num=100, concurrency=DEFAULT_CONCURRENCY, backend=DEFAULT_BACKEND
+):
     """Create pandas dataframe of contributors by country.
 
     Args:
         repo - a full GitHub repo URL
         num - number of contributors to analyze per repo
+        concurrency - max number of contributor locations to fetch at once
+        backend - how to fetch contributor locations, "rest" or "graphql"
 
     Returns:
         df - a pandas dataframe of contributors by country
@@ -151,13 +261,13 @@ def get_dataframe_from_repo(repo, num=100):
     """
     # get contributors
     repo_ending_string = extract_github_owner_and_repo(repo)
-    contributors = get_contributors(repo_ending_string, num)
+    contributors = get_contributors(repo_ending_string, num, concurrency)
     num_contributors = len(contributors)
 
     # get count of countries
     country_list = []
-    for contributor in contributors:
-        location = get_contributor_location(contributor)
+    locations = get_contributor_locations(contributors, concurrency, backend)
+    for location in locations:
         country = get_country_from_location(location)
         country_list.append(country)
     country_counter = Counter(country_list)
@@ -170,33 +280,91 @@ def get_dataframe_from_repo(repo, num=100):
     return df, num_contributors
 
 
-def get_dataframe_from_csv(filename):
+def read_csv_chunks(filename, columns, chunksize=CSV_CHUNKSIZE):
+    """Read some columns of a results csv, a chunk of rows at a time.
+
+    Columns are read as categoricals, so a repo or country name repeated
+    on many rows is held once per chunk instead of once per row.
+
+    Args:
+        filename - filename of a csv in the results folder
+        columns - names of the columns to read
+        chunksize - number of rows per chunk
+
+    Returns:
+        iterator: dataframes of up to chunksize rows
+    """
+    # file must be in the results folder
+    return pd.read_csv(
+        Path.cwd() / "results" / filename,
+        usecols=columns,
+        dtype="category",
+        keep_default_na=False,  # the country "None" is not missing data
+        chunksize=chunksize,
+    )
+
+
+def read_results_chunks(filename, columns, software_name=None, chunksize=CSV_CHUNKSIZE):
+    """Read some columns of results, a chunk of rows at a time.
+
+    Reads a csv, or parquet or feather results, by the filename's suffix.
+
+    Args:
+        filename - filename of results in the results folder
+        columns - names of the columns to read
+        software_name - only read rows of this repo or package
+        chunksize - number of rows per chunk
+
+    Returns:
+        iterator: dataframes of up to chunksize rows
+    """
+    if get_output_format(filename) != "csv":
+        # columnar results filter rows while reading them
+        yield from read_columnar_results(
+            Path.cwd() / "results" / filename, columns, chunksize, software_name
+        )
+        return
+
+    csv_columns = list(columns)
+    if software_name is not None and "software_name" not in csv_columns:
+        csv_columns.append("software_name")
+    for chunk in read_csv_chunks(filename, csv_columns, chunksize):
+        if software_name is not None:
+            chunk = chunk[chunk["software_name"] == software_name]
+        yield chunk
+
+
+def get_dataframe_from_csv(filename, software_name=None, chunksize=CSV_CHUNKSIZE):
     """Create pandas dataframe of contributors by country.
 
     Read in a csv from the results folder and convert to a dataframe
-    that tabluates developer count by country.
+    that tabluates developer count by country. The csv is read in chunks
+    and only the columns needed, so memory use does not grow with its size.
+    Parquet and feather results are read the same way.
 
     Args:
         filename - filename to input
+        software_name - only count contributors to this repo or package,
+                        e.g. "iqtlabs_gitgeo"
+        chunksize - number of rows to read at a time
 
     Returns:
         aggregated_df - a pandas dataframe of contributors by country
         num_contributors - total number of contributors
     """
-    # file must be in the results folder
-    df = pd.read_csv(Path.cwd() / "results" / filename)
-    num_contributors = len(df)
-
-    # create by-country count dict and then convert to pandas dataframe
-    country_dict = df["country"].value_counts().to_dict()
-    aggregated_df = pd.DataFrame.from_dict(
-        country_dict, orient="index", columns=["contributor_count"]
+    num_contributors = 0
+    country_counter = Counter()
+    for chunk in read_results_chunks(filename, ["country"], software_name, chunksize):
+        num_contributors += len(chunk)
+        # categoricals count every category, also those not in this chunk
+        for country, count in chunk["country"].value_counts(sort=False).items():
+            if count:
+                country_counter[country] += int(count)
+
+    # convert counter to pandas dataframe, in the same structure as
+    # get_dataframe_from_repo creates
+    aggregated_df = pd.DataFrame.from_records(
+        country_counter.most_common(), columns=["country", "contributor_count"]
     )
 
-    # to ensure compatiblity with the dataframe structure created by
-    # get_dataframe_from_repo, do a few minor changes to dataframe
-    aggregated_df["country"] = aggregated_df.index
-    aggregated_df = aggregated_df.reset_index(drop=True)
-    aggregated_df = aggregated_df[["country", "contributor_count"]]
-
     return aggregated_df, num_contributors
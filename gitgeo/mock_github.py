@@ -0,0 +1,414 @@
+"""Local stand-in for the GitHub API, for load and scaling benchmarks.
+
+Serves the endpoints GitGeo uses, with synthetic users whose locations are
+drawn from world_cities.csv:
+
+    GET  /repos/{owner}/{repo}/contributors   paginated, with Link headers
+    GET  /users/{login}
+    POST /graphql                             aliased user(login:) queries
+
+Responses carry ETags and rate limit headers like GitHub's. Requests over
+the rate limit are refused with 403, and so are requests over the optional
+per-client concurrency limit, which are told to come back after a
+Retry-After delay. Start it from the command line and point GitGeo at it:
+
+    python -m gitgeo.mock_github --port 8000 --latency 0.05
+    gitgeo --api-url http://localhost:8000 --no-cache --multirepo
+"""
+
+import argparse
+import csv
+from collections import Counter
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from pathlib import Path
+import random
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_NUM_USERS = 10000
+DEFAULT_MAX_CONTRIBUTORS = 500
+DEFAULT_RATE_LIMIT = 5000
+DEFAULT_RATE_LIMIT_WINDOW = 60 * 60  # one hour, like GitHub's
+# share of synthetic users without a location on their profile
+EMPTY_LOCATION_SHARE = 0.3
+MAX_PER_PAGE = 100
+
+
+def load_city_locations():
+    """Return "City, Country" strings for every row of world_cities.csv."""
+    with open(
+        Path(__file__).with_name("world_cities.csv"), errors="ignore", newline=""
+    ) as file:
+        return [row[0] + ", " + row[1] for row in csv.reader(file)]
+
+
+class MockGitHubServer:
+    """Threaded HTTP server imitating the parts of the GitHub API GitGeo uses.
+
+    Users and repos are generated deterministically from the seed, so two
+    servers with the same settings give the same answers. Use as a context
+    manager, or call start() and stop().
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        num_users=DEFAULT_NUM_USERS,
+        max_contributors=DEFAULT_MAX_CONTRIBUTORS,
+        latency=0.0,
+        rate_limit=DEFAULT_RATE_LIMIT,
+        rate_limit_window=DEFAULT_RATE_LIMIT_WINDOW,
+        max_concurrent=None,
+        seed=0,
+    ):
+        """Generate the synthetic users and set up the server.
+
+        Args:
+            host - address to listen on
+            port - port to listen on, 0 to pick a free one
+            num_users - number of synthetic users
+            max_contributors - maximum number of contributors of a repo
+            latency - seconds to wait before answering each request
+            rate_limit - requests allowed per client in each window
+            rate_limit_window - seconds until a client's budget resets
+            max_concurrent - requests a client may have in flight at once,
+                             or None for no limit
+            seed - seed for generating users and repos
+        """
+        self.num_users = num_users
+        self.max_contributors = max_contributors
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.max_concurrent = max_concurrent
+        self.seed = seed
+
+        generator = random.Random(seed)
+        cities = load_city_locations()
+        self.logins = ["user{}".format(index) for index in range(num_users)]
+        self.locations = {
+            login: (
+                ""
+                if generator.random() < EMPTY_LOCATION_SHARE
+                else generator.choice(cities)
+            )
+            for login in self.logins
+        }
+        # number of requests served, by endpoint, e.g. "users"
+        self.request_counts = Counter()
+        self._lock = threading.Lock()
+        self._budgets = {}
+        self._in_flight = Counter()
+
+        self._server = ThreadingHTTPServer((host, port), MockGitHubHandler)
+        self._server.daemon_threads = True
+        self._server.mock = self
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base URL of the server, e.g. http://127.0.0.1:8000."""
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def get_contributors(self, repo):
+        """Return the contributors of a repo, most commits first.
+
+        Args:
+            repo - owner/name of the repo
+
+        Returns:
+            list: user names
+        """
+        generator = random.Random("{}:{}".format(self.seed, repo.lower()))
+        num_contributors = generator.randint(1, self.max_contributors)
+        return generator.sample(self.logins, min(num_contributors, self.num_users))
+
+    def acquire(self, client):
+        """Count a request against a client's rate limit and concurrency.
+
+        Like GitHub, the mock does not charge conditional requests answered
+        with 304 Not Modified, those are given back with refund().
+
+        Args:
+            client - identifies the client, e.g. its Authorization header
+
+        Returns:
+            dict: remaining and reset of the client's budget, and whether
+                  the request is refused for the rate limit or concurrency
+        """
+        now = time.time()
+        with self._lock:
+            budget = self._budgets.get(client)
+            if budget is None or budget["reset"] <= now:
+                budget = {
+                    "remaining": self.rate_limit,
+                    "reset": int(now + self.rate_limit_window),
+                }
+                self._budgets[client] = budget
+            state = dict(budget, rate_limited=False, too_concurrent=False)
+            if budget["remaining"] <= 0:
+                state["rate_limited"] = True
+            elif (
+                self.max_concurrent is not None
+                and self._in_flight[client] >= self.max_concurrent
+            ):
+                state["too_concurrent"] = True
+            else:
+                budget["remaining"] -= 1
+                state["remaining"] = budget["remaining"]
+                self._in_flight[client] += 1
+        return state
+
+    def refund(self, client):
+        """Give back the request acquire() counted against a client's budget.
+
+        Args:
+            client - identifies the client, e.g. its Authorization header
+
+        Returns:
+            int: the client's remaining budget
+        """
+        with self._lock:
+            budget = self._budgets[client]
+            budget["remaining"] = min(budget["remaining"] + 1, self.rate_limit)
+            return budget["remaining"]
+
+    def count_request(self, endpoint):
+        """Count a request served by an endpoint, e.g. "users"."""
+        with self._lock:
+            self.request_counts[endpoint] += 1
+
+    def release(self, client):
+        """Mark a client's request accepted by acquire() as answered."""
+        with self._lock:
+            self._in_flight[client] -= 1
+
+    def serve_forever(self):
+        """Serve requests on the calling thread until stop() is called."""
+        self._server.serve_forever()
+
+    def start(self):
+        """Serve requests on a background thread.
+
+        Returns:
+            str: the base URL of the server
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        """Stop serving and close the listening socket."""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        """Start the server."""
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        """Stop the server."""
+        self.stop()
+
+
+class MockGitHubHandler(BaseHTTPRequestHandler):
+    """Answers one request to a MockGitHubServer."""
+
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, don't hold the body back
+    # waiting for the client to acknowledge the headers
+    disable_nagle_algorithm = True
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Answer contributor list and user profile requests."""
+        self.handle_api_request()
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Answer GraphQL queries."""
+        self.handle_api_request()
+
+    def handle_api_request(self):
+        """Apply latency and limits, then route the request."""
+        mock = self.server.mock
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if mock.latency:
+            time.sleep(mock.latency)
+
+        client = self.headers.get("Authorization") or self.client_address[0]
+        self.rate_limit_client = client
+        state = mock.acquire(client)
+        headers = {
+            "X-RateLimit-Limit": str(mock.rate_limit),
+            "X-RateLimit-Remaining": str(state["remaining"]),
+            "X-RateLimit-Reset": str(state["reset"]),
+        }
+        if state["rate_limited"]:
+            self.send_json(
+                403, {"message": "API rate limit exceeded"}, headers, etag=False
+            )
+            return
+        if state["too_concurrent"]:
+            headers["Retry-After"] = "1"
+            self.send_json(
+                403,
+                {"message": "You have exceeded a secondary rate limit."},
+                headers,
+                etag=False,
+            )
+            return
+        try:
+            self.route(body, headers)
+        finally:
+            mock.release(client)
+
+    def route(self, body, headers):
+        """Send the answer for the requested endpoint.
+
+        Args:
+            body - the request body
+            headers - rate limit headers to send with the answer
+        """
+        mock = self.server.mock
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split("/") if part]
+
+        if self.command == "POST" and parts == ["graphql"]:
+            mock.count_request("graphql")
+            variables = json.loads(body or b"{}").get("variables") or {}
+            data = {}
+            for name, login in variables.items():
+                alias = "user" + name[len("login") :]
+                if login in mock.locations:
+                    data[alias] = {"location": mock.locations[login] or None}
+                else:
+                    data[alias] = None
+            self.send_json(200, {"data": data}, headers)
+
+        elif (
+            self.command == "GET"
+            and len(parts) == 4
+            and parts[0] == "repos"
+            and parts[3] == "contributors"
+        ):
+            mock.count_request("contributors")
+            query = parse_qs(url.query)
+            page = int(query.get("page", ["1"])[0])
+            per_page = min(int(query.get("per_page", ["30"])[0]), MAX_PER_PAGE)
+            contributors = mock.get_contributors(parts[1] + "/" + parts[2])
+            last_page = max(1, -(-len(contributors) // per_page))
+            start = (page - 1) * per_page
+            items = [
+                {"login": login, "type": "User"}
+                for login in contributors[start : start + per_page]
+            ]
+            links = []
+            if page < last_page:
+                links.append(self.page_link(url, page + 1, per_page, "next"))
+                links.append(self.page_link(url, last_page, per_page, "last"))
+            if links:
+                headers["Link"] = ", ".join(links)
+            self.send_json(200, items, headers)
+
+        elif self.command == "GET" and len(parts) == 2 and parts[0] == "users":
+            mock.count_request("users")
+            login = parts[1]
+            if login in mock.locations:
+                self.send_json(
+                    200,
+                    {"login": login, "location": mock.locations[login] or None},
+                    headers,
+                )
+            else:
+                self.send_json(404, {"message": "Not Found"}, headers)
+
+        else:
+            self.send_json(404, {"message": "Not Found"}, headers)
+
+    def page_link(self, url, page, per_page, rel):
+        """Return a Link header entry pointing at another page."""
+        return '<{}{}?page={}&per_page={}>; rel="{}"'.format(
+            self.server.mock.url, url.path, page, per_page, rel
+        )
+
+    def send_json(self, status_code, document, headers, etag=True):
+        """Send a JSON document, or 304 if the client's copy is current.
+
+        Args:
+            status_code - HTTP status code
+            document - object to send as JSON
+            headers - extra response headers
+            etag - whether to send an ETag and honour If-None-Match
+        """
+        body = json.dumps(document).encode("utf-8")
+        if etag:
+            headers["ETag"] = '"{}"'.format(hashlib.sha256(body).hexdigest()[:32])
+            if self.headers.get("If-None-Match") == headers["ETag"]:
+                status_code, body = 304, b""
+                headers["X-RateLimit-Remaining"] = str(
+                    self.server.mock.refund(self.rate_limit_client)
+                )
+        self.send_response(status_code)
+        headers["Content-Type"] = "application/json; charset=utf-8"
+        headers["Content-Length"] = str(len(body))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Keep benchmarks quiet instead of logging every request."""
+
+
+def main():  # pragma: no cover
+    """Run a mock server until interrupted."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--num-users", type=int, default=DEFAULT_NUM_USERS)
+    parser.add_argument(
+        "--max-contributors", type=int, default=DEFAULT_MAX_CONTRIBUTORS
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds to wait per request."
+    )
+    parser.add_argument("--rate-limit", type=int, default=DEFAULT_RATE_LIMIT)
+    parser.add_argument(
+        "--rate-limit-window", type=int, default=DEFAULT_RATE_LIMIT_WINDOW
+    )
+    parser.add_argument(
+        "--max-concurrent",
+        type=int,
+        help="Requests a client may have in flight before getting a 403.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockGitHubServer(
+        args.host,
+        args.port,
+        args.num_users,
+        args.max_contributors,
+        args.latency,
+        args.rate_limit,
+        args.rate_limit_window,
+        args.max_concurrent,
+        args.seed,
+    )
+    print("MOCK GITHUB API: {}".format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
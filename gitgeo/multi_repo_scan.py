@@ -1,48 +1,490 @@
 """Functionality for scanning multiple repos."""
 
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import functools
+import itertools
+import json
+from pathlib import Path
+import threading
 import time
 
-from gitgeo.custom_csv import create_csv, add_committer_to_csv
+from gitgeo.cache import CACHE_SETTINGS, get_profile_cache
+from gitgeo.custom_csv import (
+    create_result_writer,
+    DEFAULT_OUTPUT_FORMAT,
+    get_output_format,
+    get_results_path,
+    read_results_csv,
+    truncate_results,
+    write_delta_report,
+)
 from gitgeo.geolocation import get_country_from_location
-from gitgeo.github import get_contributors, get_contributor_location
+from gitgeo.github import (
+    DEFAULT_BACKEND,
+    DEFAULT_CONCURRENCY,
+    get_backend,
+    get_contributors,
+    get_contributor_location,
+    get_contributor_locations_graphql,
+    get_github_api_url,
+    GITHUB_TOKENS,
+    GRAPHQL_BATCH_SIZE,
+)
 from gitgeo.pypi import extract_github_owner_and_repo
 
+MULTIREPO_RESULTS_TYPE = "multirepo"
+CHECKPOINT_SUFFIX = ".checkpoint"
 
-def scan_multiple_repos(input_file="repos.txt", num=100):
+
+def read_repo_list(input_file):
+    """Read the repos to scan from a file with one repo per line.
+
+    Args:
+        input_file - file containing repo list
+
+    Returns:
+        list: owner/name strings, skipping blank lines
+    """
+    with open(input_file, "r") as input_repos:
+        # strip blank space before extracting owner and repo name
+        return [
+            extract_github_owner_and_repo(repo.strip())
+            for repo in input_repos
+            if repo.strip()
+        ]
+
+
+class MultiRepoScanner:
+    """Scan many repos at once on one bounded pool of worker threads.
+
+    Contributor lists of upcoming repos and the profiles of their
+    contributors are fetched by the same workers, so the pool stays busy
+    across repo boundaries. Each login is looked up only once per scan,
+    however many repos it contributes to. Results still come back in repo
+    order.
+
+    Locations known from an earlier scan count as fetched at the time of
+    that scan. They are reused without a lookup while the scan is younger
+    than the profile TTL, unless the profile cache holds a newer entry.
+    """
+
+    def __init__(
+        self,
+        num=100,
+        concurrency=DEFAULT_CONCURRENCY,
+        backend=DEFAULT_BACKEND,
+        known_locations=None,
+        known_at=None,
+    ):
+        """Set up the scanner.
+
+        Args:
+            num - max number of contributors to analyze per repo
+            concurrency - max number of requests to send at the same time
+            backend - how to fetch contributor locations, "rest" or "graphql"
+            known_locations - optional dict of locations by login, e.g. from
+                              an earlier scan's csv
+            known_at - time (seconds since the epoch) the known locations
+                       were fetched, or None to never reuse them
+        """
+        self.num = num
+        self.backend = get_backend(backend)
+        self.known_locations = known_locations or {}
+        self.known_at = known_at
+        # never more workers than the tokens can serve at once
+        self.max_workers = max(
+            1, min(concurrency, len(GITHUB_TOKENS) * GITHUB_TOKENS.max_in_flight)
+        )
+        self._executor = None
+        self._skip = frozenset()
+        self._lock = threading.Lock()
+        # future resolving to a dict of locations by login, keyed by login
+        self._location_futures = {}
+
+    def scan(self, repos, skip=frozenset()):
+        """Yield the location of every contributor of every repo.
+
+        Contributor lists are fetched for up to max_workers repos ahead of
+        the repo whose results are being yielded.
+
+        Args:
+            repos - iterable of owner/name strings
+            skip - (repo, contributor) pairs to leave out, e.g. because an
+                   earlier, interrupted scan already wrote them
+
+        Yields:
+            tuple: repo, contributor and location, in repo order
+        """
+        self._skip = skip
+        repos = iter(repos)
+        pending = deque()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            self._executor = executor
+            try:
+                for repo in itertools.islice(repos, self.max_workers):
+                    pending.append((repo, self._submit_repo(repo)))
+                while pending:
+                    repo, contributors_future = pending.popleft()
+                    for next_repo in itertools.islice(repos, 1):
+                        pending.append((next_repo, self._submit_repo(next_repo)))
+                    contributors = self._remaining(repo, contributors_future.result())
+                    # the callback may not have run yet when result() returns
+                    self._schedule_locations(contributors)
+                    for contributor in contributors:
+                        location_future = self._location_futures[contributor]
+                        yield repo, contributor, location_future.result()[contributor]
+            finally:
+                # stop queued work when the scan fails or is abandoned
+                with self._lock:
+                    self._executor = None
+                for _, contributors_future in pending:
+                    contributors_future.cancel()
+                for location_future in self._location_futures.values():
+                    location_future.cancel()
+
+    def _submit_repo(self, repo):
+        """Queue a repo's contributor list, then its contributors' profiles."""
+        # repos are already fetched in parallel, so fetch their pages one by
+        # one to keep the number of requests in flight within concurrency
+        future = self._executor.submit(get_contributors, repo, self.num, 1)
+        future.add_done_callback(functools.partial(self._on_contributors, repo))
+        return future
+
+    def _on_contributors(self, repo, future):
+        """Queue profile lookups as soon as a contributor list arrives."""
+        if not future.cancelled() and future.exception() is None:
+            self._schedule_locations(self._remaining(repo, future.result()))
+
+    def _remaining(self, repo, contributors):
+        """Return the contributors of a repo that are not to be skipped."""
+        return [
+            contributor
+            for contributor in contributors
+            if (repo, contributor) not in self._skip
+        ]
+
+    def _schedule_locations(self, contributors):
+        """Queue profile lookups for logins not already looked up.
+
+        Args:
+            contributors - a list of GitHub user names
+        """
+        with self._lock:
+            if self._executor is None:
+                return
+            new_logins = []
+            for login in dict.fromkeys(contributors):
+                if login in self._location_futures:
+                    continue
+                known_location = self._get_known_location(login)
+                if known_location is None:
+                    new_logins.append(login)
+                else:
+                    self._location_futures[login] = future = Future()
+                    future.set_result(known_location)
+            if self.backend == "graphql":
+                batches = [
+                    new_logins[index : index + GRAPHQL_BATCH_SIZE]
+                    for index in range(0, len(new_logins), GRAPHQL_BATCH_SIZE)
+                ]
+                for batch in batches:
+                    future = self._executor.submit(
+                        get_contributor_locations_graphql, batch, 1
+                    )
+                    for login in batch:
+                        self._location_futures[login] = future
+            else:
+                for login in new_logins:
+                    self._location_futures[login] = self._executor.submit(
+                        fetch_location, login
+                    )
+
+    def _get_known_location(self, login):
+        """Return a location that can be used without a lookup, if any.
+
+        Args:
+            login - GitHub user name
+
+        Returns:
+            dict: the location from known_locations keyed by login, or None
+                  if the login is unknown, the earlier scan is older than
+                  the profile TTL or the profile cache has a newer entry
+        """
+        if login not in self.known_locations or self.known_at is None:
+            return None
+        if time.time() - self.known_at > CACHE_SETTINGS["profile_ttl"]:
+            return None
+        profile_cache = get_profile_cache()
+        if profile_cache is not None:
+            cached_profile = profile_cache.get(get_github_api_url("/users/" + login))
+            if (
+                cached_profile is not None
+                and cached_profile["fetched_at"] > self.known_at
+            ):
+                return None
+        return {login: self.known_locations[login]}
+
+
+class ScanCheckpoint:
+    """Append-only journal of the progress of a multirepo scan.
+
+    Every time the results csv is flushed, one JSON line is appended with
+    the csv size (or number of partitions), the (repo, contributor) pairs
+    the flush wrote and the repos whose rows are now all in the csv. After
+    a crash, the journal tells which work to skip and where the last
+    complete row ends.
+    """
+
+    def __init__(self, path):
+        """Set up a journal, without reading or creating it yet.
+
+        Args:
+            path - location of the journal file
+        """
+        self.path = Path(path)
+        # csv size, or number of partitions of columnar results, after the
+        # last recorded flush, None if nothing recorded
+        self.offset = None
+        self.done_pairs = set()
+        self.done_repos = set()
+        self._pending_pairs = deque()
+        self._pending_repos = []
+        self._file = None
+
+    def load(self):
+        """Read the progress recorded by an earlier scan.
+
+        A partly written last line, left by a crash, is ignored.
+
+        Returns:
+            bool: whether a journal was found
+        """
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    self.offset = entry["offset"]
+                    self.done_pairs.update(tuple(pair) for pair in entry["pairs"])
+                    self.done_repos.update(entry["done"])
+        except FileNotFoundError:
+            return False
+        return True
+
+    def add(self, repo, contributor):
+        """Note a row about to be written to the csv.
+
+        Args:
+            repo - owner/name of the repo
+            contributor - GitHub user name
+        """
+        self._pending_pairs.append((repo, contributor))
+
+    def repo_done(self, repo):
+        """Note that every row of a repo has been written to the csv.
+
+        Args:
+            repo - owner/name of the repo
+        """
+        self._pending_repos.append(repo)
+
+    def record(self, offset, rows):
+        """Journal a csv flush. Pass as a ResultWriter's on_flush.
+
+        Args:
+            offset - size of the csv, or number of partitions of columnar
+                     results, after the flush
+            rows - the rows the flush wrote, in the order they were added
+        """
+        pairs = [self._pending_pairs.popleft() for _ in rows]
+        if not pairs and not self._pending_repos and offset == self.offset:
+            return
+        self.start()
+        entry = {"offset": offset, "pairs": pairs, "done": self._pending_repos}
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        self.offset = offset
+        self._pending_repos = []
+
+    def start(self):
+        """Create the journal, if needed, and open it for appending.
+
+        A scan killed before its first flush then still leaves a journal,
+        and resuming it starts the scan over.
+        """
+        if self._file is None:
+            self._file = open(  # pylint: disable=consider-using-with
+                self.path, "a", encoding="utf-8"
+            )
+
+    def close(self):
+        """Close the journal file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        """Close and delete the journal, e.g. once the scan has finished."""
+        self.close()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def fetch_location(login):
+    """Return a user's location in a dict keyed by login."""
+    return {login: get_contributor_location(login)}
+
+
+def scan_multiple_repos(
+    input_file="repos.txt",
+    num=100,
+    concurrency=DEFAULT_CONCURRENCY,
+    backend=DEFAULT_BACKEND,
+    resume=None,
+    previous=None,
+    output_format=DEFAULT_OUTPUT_FORMAT,
+):
     """Create csv of data for multiple repos.
 
     Scan through repos provided in repos.txt and create a single csv that
     stores all contributor-related data for each contributor in each repo.
+    Repos are scanned concurrently, but rows are written in the order of
+    repos.txt. Progress is journaled next to the csv, so that a scan that
+    dies can be resumed, and the journal is deleted once the scan finishes.
+
+    Given the csv of an earlier scan, the scan is incremental: its locations
+    count as fetched at the time in its name and are reused while younger
+    than the profile TTL, so only new logins and expired entries are
+    fetched. Repos of the earlier csv that are not in repos.txt are copied
+    over unchanged, and the changes are written to a delta report (see
+    write_delta_report).
 
     Args:
         input_file - file containing repo list
         num - max number of contributors to analyze per repo
+        concurrency - max number of requests to send at the same time
+        backend - how to fetch contributor locations, "rest" or "graphql"
+        resume - name of the csv, in the results folder, of an interrupted
+                 multirepo scan to finish instead of starting a new one
+        previous - name of the csv, in the results folder, of an earlier
+                   scan to rescan incrementally
+        output_format - "csv", "parquet" or "feather". A resumed scan keeps
+                        the format it was started with
 
     Returns:
-        None
+        Path: the csv, or the folder of parquet or feather results
     """
-    # create csv to store multi-repo scan results
-    timestamp = time.strftime("%Y%m%d-%H%M%S")
-    create_csv("multirepo", timestamp)
+    if resume is None:
+        # create csv to store multi-repo scan results
+        timestamp = time.strftime("%Y%m%d-%H%M%S")
+    else:
+        timestamp = get_multirepo_timestamp(resume)
+        output_format = get_output_format(resume)
+    results_path = get_results_path(MULTIREPO_RESULTS_TYPE, timestamp, output_format)
+    checkpoint = ScanCheckpoint(results_path.with_suffix(CHECKPOINT_SUFFIX))
+    if resume is not None:
+        if not checkpoint.load():
+            raise FileNotFoundError(
+                "no checkpoint to resume from: {}".format(checkpoint.path)
+            )
+        if checkpoint.offset is not None:
+            # drop rows written after the last journaled flush
+            truncate_results(results_path, checkpoint.offset)
 
-    # open file that contains repos to scan and append contributors for each
-    # repo to csv. Also, repos.txt must contain repo names, one repo per line.
-    with open(input_file, "r") as input_repos:
-        for repo in input_repos:
-            # Skip blank lines
-            if repo == "":
-                continue
-            # strip blank space before extracting owner and repo name
-            repo_ending_string = extract_github_owner_and_repo(repo.strip())
-            contributors = get_contributors(repo_ending_string, num)
-            for contributor in contributors:
-                location = get_contributor_location(contributor)
+    # repos.txt must contain repo names, one repo per line.
+    all_repos = read_repo_list(input_file)
+    repos = [repo for repo in all_repos if repo not in checkpoint.done_repos]
+    previous_rows = [] if previous is None else read_results_csv(previous)
+    # earlier rows of repos not being rescanned, keyed by csv software_name
+    carried_over_rows = {}
+    skipped_names = {repo.replace("/", "_") for repo in all_repos}
+    skipped_names.update(checkpoint.done_repos)
+    for row in previous_rows:
+        if row["software_name"] not in skipped_names:
+            carried_over_rows.setdefault(row["software_name"], []).append(row)
+    scanner = MultiRepoScanner(
+        num,
+        concurrency,
+        backend,
+        known_locations={
+            # a csv stores a missing location as an empty string
+            row["username"]: row["location"] or None
+            for row in previous_rows
+        },
+        known_at=None if previous is None else get_multirepo_scan_time(previous),
+    )
+    try:
+        checkpoint.start()
+        with create_result_writer(
+            MULTIREPO_RESULTS_TYPE,
+            timestamp,
+            output_format,
+            append=checkpoint.offset is not None,
+            on_flush=checkpoint.record,
+        ) as writer:
+            current_repo = None
+            for repo, contributor, location in scanner.scan(
+                repos, checkpoint.done_pairs
+            ):
+                if repo != current_repo:
+                    if current_repo is not None:
+                        checkpoint.repo_done(current_repo)
+                    current_repo = repo
                 country = get_country_from_location(location)
-                add_committer_to_csv(
-                    "multirepo",
-                    repo_ending_string,
-                    timestamp,
-                    contributor,
-                    location,
-                    country,
-                )
+                checkpoint.add(repo, contributor)
+                writer.write(repo, contributor, location, country)
+            if current_repo is not None:
+                checkpoint.repo_done(current_repo)
+            for software_name, rows in carried_over_rows.items():
+                for row in rows:
+                    checkpoint.add(software_name, row["username"])
+                    writer.write(
+                        software_name, row["username"], row["location"], row["country"]
+                    )
+                checkpoint.repo_done(software_name)
+    finally:
+        checkpoint.close()
+    checkpoint.remove()
+    if previous is not None:
+        write_delta_report(previous_rows, results_path)
+    return results_path
+
+
+def get_multirepo_timestamp(filename):
+    """Return the timestamp part of a multirepo csv name.
+
+    Args:
+        filename - name of a multirepo csv, e.g. multirepo_20210101-120000.csv
+
+    Returns:
+        str: the timestamp, e.g. 20210101-120000
+    """
+    stem = Path(filename).stem
+    prefix = MULTIREPO_RESULTS_TYPE + "_"
+    if not stem.startswith(prefix):
+        raise ValueError("not a multirepo scan csv: {}".format(filename))
+    return stem[len(prefix) :]
+
+
+def get_multirepo_scan_time(filename):
+    """Return the time a multirepo scan started, from the name of its csv.
+
+    Args:
+        filename - name of a multirepo csv, e.g. multirepo_20210101-120000.csv
+
+    Returns:
+        float: seconds since the epoch, or None if the name has no
+               timestamp
+    """
+    try:
+        # timestamps are written in local time by time.strftime()
+        return time.mktime(
+            time.strptime(get_multirepo_timestamp(filename), "%Y%m%d-%H%M%S")
+        )
+    except ValueError:
+        return None
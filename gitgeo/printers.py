@@ -3,18 +3,26 @@
 from collections import Counter
 import time
 
-from gitgeo.custom_csv import create_csv, add_committer_to_csv
-from gitgeo.github import get_contributor_location
+from gitgeo.custom_csv import create_result_writer, DEFAULT_OUTPUT_FORMAT
+from gitgeo.github import (
+    DEFAULT_BACKEND,
+    DEFAULT_CONCURRENCY,
+    get_contributor_locations,
+)
 from gitgeo.geolocation import get_country_from_location
 
 
-def print_by_country(contributors):
+def print_by_country(
+    contributors, concurrency=DEFAULT_CONCURRENCY, backend=DEFAULT_BACKEND
+):
     """Print contributors aggregated by country.
 
     Print contributor county by country to terminal window.
 
     Args:
         contributors: a list of contributors
+        concurrency: max number of contributor locations to fetch at once
+        backend: how to fetch contributor locations, "rest" or "graphql"
 
     Returns:
     null
@@ -22,8 +30,8 @@ def print_by_country(contributors):
     print("COUNTRY | # OF CONTRIBUTORS")
     print("---------------------------")
     country_list = []
-    for contributor in contributors:
-        location = get_contributor_location(contributor)
+    locations = get_contributor_locations(contributors, concurrency, backend)
+    for location in locations:
         country = get_country_from_location(location)
         country_list.append(country)
 
@@ -32,7 +40,15 @@ def print_by_country(contributors):
         print(country, count)
 
 
-def print_by_contributor(software_name, contributors, output_csv=False, pypi_data=None):
+def print_by_contributor(
+    software_name,
+    contributors,
+    output_csv=False,
+    pypi_data=None,
+    concurrency=DEFAULT_CONCURRENCY,
+    backend=DEFAULT_BACKEND,
+    output_format=DEFAULT_OUTPUT_FORMAT,
+):
     """Print location results by contributor.
 
     Print contributors and countries to terminal window. If output csv is set
@@ -43,32 +59,41 @@ def print_by_contributor(software_name, contributors, output_csv=False, pypi_dat
         contributors - a list of contributors
         output_csv - whether to output a csv.
         pypi_data - a pypi data object.
+        concurrency - max number of contributor locations to fetch at once
+        backend - how to fetch contributor locations, "rest" or "graphql"
+        output_format - format of the output, "csv", "parquet" or "feather"
 
     Returns:
         null
     """
     # create csv if output_csv specified
+    writer = None
     if output_csv:
         # unique current time timestamp to create unique filename
         timestamp = time.strftime("%Y%m%d-%H%M%S")
-        create_csv("contributor", timestamp)
+        writer = create_result_writer("contributor", timestamp, output_format)
 
-    print("CONTRIBUTOR, LOCATION")
-    if pypi_data is not None:
-        print("* indicates PyPI maintainer")
-    print("---------------------")
-    for contributor in contributors:
-        location = get_contributor_location(contributor)
-        country = get_country_from_location(location)
-        if output_csv:
-            add_committer_to_csv(
-                "contributor", software_name, timestamp, contributor, location, country
-            )
-        try:
-            # Check if pypi_data is not None, indicating a PyPI package scan
-            if pypi_data is not None and contributor in pypi_data["pypi_maintainers"]:
-                print(contributor, "*", "|", location, "|", country)
-            else:
-                print(contributor, "|", location, "|", country)
-        except UnicodeEncodeError:
-            print(contributor, "| error")
+    try:
+        print("CONTRIBUTOR, LOCATION")
+        if pypi_data is not None:
+            print("* indicates PyPI maintainer")
+        print("---------------------")
+        locations = get_contributor_locations(contributors, concurrency, backend)
+        for contributor, location in zip(contributors, locations):
+            country = get_country_from_location(location)
+            if writer is not None:
+                writer.write(software_name, contributor, location, country)
+            try:
+                # Check if pypi_data is not None, indicating a PyPI package scan
+                if (
+                    pypi_data is not None
+                    and contributor in pypi_data["pypi_maintainers"]
+                ):
+                    print(contributor, "*", "|", location, "|", country)
+                else:
+                    print(contributor, "|", location, "|", country)
+            except UnicodeEncodeError:
+                print(contributor, "| error")
+    finally:
+        if writer is not None:
+            writer.close()
@@ -4,7 +4,8 @@ import sys
 import urllib
 
 from bs4 import BeautifulSoup
-import requests
+
+from gitgeo.http_session import get_session
 
 
 def get_pypi_data(pkg):
@@ -19,7 +20,7 @@ def get_pypi_data(pkg):
     # Retrieve PyPI package JSON data
     try:
         pkg_url = "https://pypi.org/pypi/" + pkg + "/json"
-        response = requests.get(pkg_url)
+        response = get_session().get(pkg_url)
         pypi_pkg_json = response.json()
     except urllib.error.HTTPError:
         print("ERROR: No such package on PyPI")
@@ -118,7 +119,7 @@ def get_pypi_maintainers(pkg):
     """
     # Scrape regular PyPI package site
     url = "https://pypi.org/project/" + pkg
-    html = requests.get(url)
+    html = get_session().get(url)
     soup = BeautifulSoup(html.content, "html.parser")
     elements = soup.findAll("span", {"class": "sidebar-section__user-gravatar-text"})
     # Strip white space from all elements
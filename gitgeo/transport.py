@@ -0,0 +1,263 @@
+"""Record and replay transports for GitHub and PyPI traffic.
+
+A transport is a requests adapter mounted on the shared HTTP session. In
+record mode, requests go to the network as usual and every request and
+response pair is written to a cassette directory. In replay mode, responses
+are served from the cassette directory without touching the network, which
+makes scans and benchmarks deterministic and lets them run offline.
+"""
+
+import base64
+import hashlib
+import json
+import os
+from pathlib import Path
+import threading
+import time
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+TRANSPORT_MODES = ["live", "record", "replay"]
+DEFAULT_TRANSPORT_MODE = "live"
+DEFAULT_CASSETTE_DIR = Path("cassettes")
+
+# transport settings, taken from the environment and changed through
+# configure_transport()
+TRANSPORT_SETTINGS = {
+    "mode": os.environ.get("GITGEO_TRANSPORT") or DEFAULT_TRANSPORT_MODE,
+    "cassette_dir": Path(os.environ.get("GITGEO_CASSETTE_DIR") or DEFAULT_CASSETTE_DIR),
+    "latency": float(os.environ.get("GITGEO_REPLAY_LATENCY") or 0),
+}
+# response headers that describe the encoded body, which is stored decoded
+DROPPED_HEADERS = ["content-encoding", "content-length", "transfer-encoding"]
+
+
+class CassetteMissError(requests.exceptions.ConnectionError):
+    """Raised in replay mode for a request that was never recorded."""
+
+
+class Cassette:
+    """Directory of recorded request and response pairs.
+
+    Each pair is a JSON file named after a hash of the request method, URL
+    and body. Request headers, including credentials, are never stored.
+    """
+
+    def __init__(self, directory):
+        """Set up a cassette, without creating the directory yet.
+
+        Args:
+            directory - directory holding the recorded pairs
+        """
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+
+    def get_path(self, request):
+        """Return the file that holds the recording of a request.
+
+        Args:
+            request - a requests.PreparedRequest
+
+        Returns:
+            Path: e.g. <directory>/api.github.com/<sha256>.json
+        """
+        body = request.body or b""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        digest = hashlib.sha256(
+            request.method.encode("utf-8") + b" " + request.url.encode("utf-8")
+        )
+        digest.update(b"\n" + body)
+        host = requests.utils.urlparse(request.url).netloc or "unknown"
+        return self.directory / host / (digest.hexdigest() + ".json")
+
+    def load(self, request):
+        """Return the recorded response to a request, or None if not recorded.
+
+        Args:
+            request - a requests.PreparedRequest
+
+        Returns:
+            dict: status_code, headers and body of the response
+        """
+        try:
+            with open(self.get_path(request), encoding="utf-8") as file:
+                return json.load(file)["response"]
+        except FileNotFoundError:
+            return None
+
+    def save(self, request, response):
+        """Record a request and its response.
+
+        A 304 Not Modified answer never replaces a full recorded response,
+        because replay can derive it from the recorded ETag.
+
+        Args:
+            request - a requests.PreparedRequest
+            response - the requests.Response received for it
+        """
+        path = self.get_path(request)
+        content = response.content or b""
+        try:
+            body = {"body": content.decode("utf-8")}
+        except UnicodeDecodeError:
+            body = {"body_base64": base64.b64encode(content).decode("ascii")}
+        recording = {
+            "request": {"method": request.method, "url": request.url},
+            "response": dict(
+                body,
+                status_code=response.status_code,
+                headers={
+                    name: value
+                    for name, value in response.headers.items()
+                    if name.lower() not in DROPPED_HEADERS
+                },
+            ),
+        }
+        with self._lock:
+            if response.status_code == 304 and path.exists():
+                return
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temporary_path = path.with_suffix(".tmp")
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                json.dump(recording, file, indent=1, sort_keys=True)
+            os.replace(temporary_path, path)
+
+
+class RecordingAdapter(HTTPAdapter):
+    """Adapter that sends requests to the network and records them."""
+
+    def __init__(self, cassette, **kwargs):
+        """Create the adapter.
+
+        Args:
+            cassette - the Cassette to record to
+            kwargs - arguments for requests' HTTPAdapter, e.g. max_retries
+        """
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        """Send a request and record the response."""
+        response = super().send(request, **kwargs)
+        self.cassette.save(request, response)
+        return response
+
+
+class ReplayAdapter(BaseAdapter):
+    """Adapter that answers requests from a cassette, never the network."""
+
+    def __init__(self, cassette, latency=0.0):
+        """Create the adapter.
+
+        Args:
+            cassette - the Cassette to replay from
+            latency - seconds to wait before each response, to simulate
+                      network round trips
+        """
+        super().__init__()
+        self.cassette = cassette
+        self.latency = latency
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        """Return the recorded response to a request.
+
+        A conditional request whose If-None-Match matches the recorded ETag
+        is answered with 304 Not Modified, as GitHub would.
+        """
+        recording = self.cassette.load(request)
+        if recording is None:
+            raise CassetteMissError(
+                "no recording of {} {} in {}".format(
+                    request.method, request.url, self.cassette.directory
+                ),
+                request=request,
+            )
+        if self.latency:
+            time.sleep(self.latency)
+
+        headers = CaseInsensitiveDict(recording["headers"])
+        etag = request.headers.get("If-None-Match")
+        if etag is not None and etag == headers.get("ETag"):
+            return self.build_response(request, 304, headers, b"")
+        if "body_base64" in recording:
+            content = base64.b64decode(recording["body_base64"])
+        else:
+            content = recording["body"].encode("utf-8")
+        return self.build_response(request, recording["status_code"], headers, content)
+
+    def build_response(self, request, status_code, headers, content):
+        """Build a requests.Response as if it came from the network."""
+        response = requests.models.Response()
+        response.status_code = status_code
+        response.headers = headers
+        response._content = content  # pylint: disable=protected-access
+        response.encoding = requests.utils.get_encoding_from_headers(headers)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        """Nothing to close, no connections are opened."""
+
+
+def create_transport(mode, cassette_dir=DEFAULT_CASSETTE_DIR, latency=0.0, **kwargs):
+    """Create the adapter for a transport mode.
+
+    Args:
+        mode - "live", "record" or "replay"
+        cassette_dir - directory of recorded request and response pairs
+        latency - seconds to wait before each replayed response
+        kwargs - arguments for requests' HTTPAdapter in live and record mode
+
+    Returns:
+        requests.adapters.BaseAdapter: the adapter to mount on a session
+    """
+    if mode == "record":
+        return RecordingAdapter(Cassette(cassette_dir), **kwargs)
+    if mode == "replay":
+        return ReplayAdapter(Cassette(cassette_dir), latency)
+    if mode == "live":
+        return HTTPAdapter(**kwargs)
+    raise ValueError("unknown transport mode: {}".format(mode))
+
+
+def configure_transport(mode, cassette_dir=DEFAULT_CASSETTE_DIR, latency=0.0):
+    """Select the transport of HTTP sessions created from now on.
+
+    Call before the first request, or reset the shared session afterwards
+    with http_session.set_session(None).
+
+    Args:
+        mode - "live", "record" or "replay"
+        cassette_dir - directory of recorded request and response pairs
+        latency - seconds to wait before each replayed response
+
+    Returns:
+        None
+    """
+    if mode not in TRANSPORT_MODES:
+        raise ValueError("unknown transport mode: {}".format(mode))
+    TRANSPORT_SETTINGS["mode"] = mode
+    TRANSPORT_SETTINGS["cassette_dir"] = Path(cassette_dir)
+    TRANSPORT_SETTINGS["latency"] = latency
+
+
+def create_default_transport(**kwargs):
+    """Create the adapter for the transport selected by configure_transport.
+
+    Args:
+        kwargs - arguments for requests' HTTPAdapter in live and record mode
+
+    Returns:
+        requests.adapters.BaseAdapter: the adapter to mount on a session
+    """
+    return create_transport(
+        TRANSPORT_SETTINGS["mode"],
+        TRANSPORT_SETTINGS["cassette_dir"],
+        TRANSPORT_SETTINGS["latency"],
+        **kwargs
+    )
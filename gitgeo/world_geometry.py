@@ -0,0 +1,329 @@
+"""Simplified world geometry for contributor maps.
+
+world.json holds the country outlines with several dozen properties each,
+of which maps only need the country name. The outlines are simplified ahead
+of time into a few resolution levels, stored together in
+world_simplified.json, and a level is parsed at most once per process.
+
+Simplification is topology-aware: borders shared by neighbouring countries
+are simplified once and used for both, so no gaps or overlaps open up
+between them. Rebuild the file after changing world.json with:
+
+    python -m gitgeo.world_geometry
+"""
+
+from collections import defaultdict
+import functools
+import json
+from pathlib import Path
+
+WORLD_GEOMETRY_VERSION = 1
+WORLD_GEOMETRY_FILENAME = "world_simplified.json"
+SOURCE_GEOMETRY_FILENAME = "world.json"
+# the properties maps use, see mapping.make_map
+KEPT_PROPERTIES = ["sovereignt"]
+# tolerance of the Douglas-Peucker simplification and number of decimals
+# kept of each coordinate, both in degrees, by resolution level
+RESOLUTION_LEVELS = {
+    "low": {"tolerance": 0.3, "precision": 2},
+    "medium": {"tolerance": 0.1, "precision": 2},
+    "high": {"tolerance": 0.02, "precision": 3},
+    "full": {"tolerance": 0.0, "precision": 5},
+}
+MAP_RESOLUTIONS = list(RESOLUTION_LEVELS)
+DEFAULT_MAP_RESOLUTION = "medium"
+
+
+def get_polygons(geometry):
+    """Return the polygons of a Polygon or MultiPolygon geometry.
+
+    Args:
+        geometry - a GeoJSON geometry object
+
+    Returns:
+        list: polygons, each a list of rings of [longitude, latitude] pairs
+    """
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    return geometry["coordinates"]
+
+
+def quantize_ring(ring, precision):
+    """Round the points of a closed ring and drop repeated points.
+
+    Args:
+        ring - list of [longitude, latitude] pairs, first equal to last
+        precision - number of decimals to keep
+
+    Returns:
+        list: (longitude, latitude) tuples, without the closing point
+    """
+    points = []
+    for longitude, latitude in ring:
+        point = (round(longitude, precision), round(latitude, precision))
+        if not points or point != points[-1]:
+            points.append(point)
+    while len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    return points
+
+
+def get_segment_distance(point, start, end):
+    """Return the distance from a point to the segment from start to end."""
+    x, y = point
+    x1, y1 = start
+    dx, dy = end[0] - x1, end[1] - y1
+    length = dx * dx + dy * dy
+    if length:
+        share = max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / length))
+        x1, y1 = x1 + share * dx, y1 + share * dy
+    return ((x - x1) ** 2 + (y - y1) ** 2) ** 0.5
+
+
+def douglas_peucker(points, tolerance):
+    """Simplify a line, keeping its first and last point.
+
+    Args:
+        points - list of (longitude, latitude) tuples
+        tolerance - largest distance a dropped point may have from the
+                    simplified line
+
+    Returns:
+        list: the points that are kept, in order
+    """
+    if len(points) < 3 or tolerance <= 0:
+        return list(points)
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    # explicit stack instead of recursion, long coastlines are deep
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        farthest, max_distance = None, tolerance
+        for index in range(first + 1, last):
+            distance = get_segment_distance(points[index], points[first], points[last])
+            if distance > max_distance:
+                farthest, max_distance = index, distance
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def find_junctions(rings):
+    """Find the points where rings start or stop sharing a border.
+
+    A point on a border between two countries is a junction when the
+    border ends there, i.e. when the set of rings passing through it
+    differs from the set passing through a neighbouring point.
+
+    Args:
+        rings - list of rings of (longitude, latitude) tuples
+
+    Returns:
+        set: the junction points
+    """
+    rings_by_point = defaultdict(set)
+    for ring_index, ring in enumerate(rings):
+        for point in ring:
+            rings_by_point[point].add(ring_index)
+
+    junctions = set()
+    for ring in rings:
+        for index, point in enumerate(ring):
+            sharing = rings_by_point[point]
+            if len(sharing) < 2:
+                continue
+            previous_point = ring[index - 1]
+            next_point = ring[(index + 1) % len(ring)]
+            if (
+                len(sharing) > 2
+                or rings_by_point[previous_point] != sharing
+                or rings_by_point[next_point] != sharing
+            ):
+                junctions.add(point)
+    return junctions
+
+
+def simplify_ring(ring, junctions, tolerance, simplified_chains):
+    """Simplify a closed ring without moving its junctions.
+
+    The ring is cut into chains at its junctions and each chain is
+    simplified on its own. A chain shared with a neighbouring ring is
+    simplified only once, whichever ring comes first.
+
+    Args:
+        ring - list of (longitude, latitude) tuples, without closing point
+        junctions - set of points that must be kept
+        tolerance - Douglas-Peucker tolerance
+        simplified_chains - dict of chains simplified so far, shared by
+                            all rings
+
+    Returns:
+        list: the simplified ring, closed, or None if it collapsed
+    """
+    fixed = [index for index, point in enumerate(ring) if point in junctions]
+    if not fixed:
+        # an island, fix its first point and the point farthest from it
+        start = ring[0]
+        farthest = max(
+            range(len(ring)),
+            key=lambda index: get_segment_distance(ring[index], start, start),
+        )
+        fixed = sorted({0, farthest})
+
+    simplified = []
+    for position, first in enumerate(fixed):
+        last = fixed[(position + 1) % len(fixed)]
+        if last > first:
+            chain = ring[first : last + 1]
+        else:
+            chain = ring[first:] + ring[: last + 1]
+        # simplify a chain the same way in whichever direction it is walked
+        reverse = chain[::-1] < chain
+        key = tuple(chain[::-1] if reverse else chain)
+        if key not in simplified_chains:
+            simplified_chains[key] = douglas_peucker(key, tolerance)
+        kept = simplified_chains[key]
+        simplified.extend((kept[::-1] if reverse else kept)[:-1])
+
+    if len(set(simplified)) < 3:
+        return None
+    return [list(point) for point in simplified + simplified[:1]]
+
+
+def simplify_world_geometry(data, tolerance, precision):
+    """Simplify the outlines of all countries together.
+
+    Args:
+        data - a GeoJSON FeatureCollection of country outlines
+        tolerance - Douglas-Peucker tolerance in degrees
+        precision - number of decimals to keep of each coordinate
+
+    Returns:
+        dict: a GeoJSON FeatureCollection with only KEPT_PROPERTIES
+    """
+    features = [
+        (
+            feature,
+            [
+                [quantize_ring(ring, precision) for ring in polygon]
+                for polygon in get_polygons(feature["geometry"])
+            ],
+        )
+        for feature in data["features"]
+    ]
+    junctions = find_junctions(
+        [ring for _, polygons in features for polygon in polygons for ring in polygon]
+    )
+
+    simplified_chains = {}
+    simplified_features = []
+    for feature, polygons in features:
+        simplified_polygons = []
+        for polygon in polygons:
+            rings = [
+                (
+                    simplify_ring(ring, junctions, tolerance, simplified_chains)
+                    if len(ring) >= 3
+                    else None
+                )
+                for ring in polygon
+            ]
+            # a collapsed outer ring takes its holes with it
+            if rings[0] is not None:
+                simplified_polygons.append([ring for ring in rings if ring is not None])
+        if not simplified_polygons:
+            # never lose a whole country, keep its largest polygon as is
+            largest = max(polygons, key=lambda polygon: len(polygon[0]))
+            simplified_polygons = [
+                [[list(point) for point in ring + ring[:1]] for ring in largest]
+            ]
+
+        if len(simplified_polygons) == 1:
+            geometry = {"type": "Polygon", "coordinates": simplified_polygons[0]}
+        else:
+            geometry = {"type": "MultiPolygon", "coordinates": simplified_polygons}
+        simplified_features.append(
+            {
+                "type": "Feature",
+                "properties": {
+                    name: feature["properties"][name] for name in KEPT_PROPERTIES
+                },
+                "geometry": geometry,
+            }
+        )
+    return {"type": "FeatureCollection", "features": simplified_features}
+
+
+def build_world_geometry(source=None, destination=None):
+    """Simplify world.json at every resolution level and save the result.
+
+    Args:
+        source - path of the full resolution GeoJSON, world.json by default
+        destination - path to save to, world_simplified.json by default
+
+    Returns:
+        dict: feature collections by resolution level
+    """
+    source = source or Path(__file__).with_name(SOURCE_GEOMETRY_FILENAME)
+    destination = destination or Path(__file__).with_name(WORLD_GEOMETRY_FILENAME)
+    with open(source) as file:
+        data = json.load(file)
+
+    levels = {
+        resolution: simplify_world_geometry(
+            data, settings["tolerance"], settings["precision"]
+        )
+        for resolution, settings in RESOLUTION_LEVELS.items()
+    }
+    with open(destination, "w") as file:
+        json.dump(
+            {"version": WORLD_GEOMETRY_VERSION, "levels": levels},
+            file,
+            separators=(",", ":"),
+        )
+    return levels
+
+
+@functools.lru_cache(maxsize=None)
+def read_world_geometry_file():
+    """Return the parsed world_simplified.json, reading it only once."""
+    with open(Path(__file__).with_name(WORLD_GEOMETRY_FILENAME)) as file:
+        data = json.load(file)
+    if data.get("version") != WORLD_GEOMETRY_VERSION:
+        raise ValueError(
+            "{} is outdated, rebuild it with python -m gitgeo.world_geometry".format(
+                WORLD_GEOMETRY_FILENAME
+            )
+        )
+    return data["levels"]
+
+
+def load_world_geometry(resolution=DEFAULT_MAP_RESOLUTION):
+    """Return the world's country outlines at a resolution level.
+
+    The returned object is shared by all callers, copy it before changing it.
+
+    Args:
+        resolution - one of MAP_RESOLUTIONS
+
+    Returns:
+        dict: a GeoJSON FeatureCollection
+    """
+    if resolution not in RESOLUTION_LEVELS:
+        raise ValueError("unknown map resolution: {}".format(resolution))
+    return read_world_geometry_file()[resolution]
+
+
+if __name__ == "__main__":  # pragma: no cover
+    for name, collection in build_world_geometry().items():
+        num_points = sum(
+            len(ring)
+            for feature in collection["features"]
+            for polygon in get_polygons(feature["geometry"])
+            for ring in polygon
+        )
+        print("{}: {} points".format(name, num_points))
@@ -11,7 +11,7 @@ setup(
     keywords="open_source github",
     author="John Speed Meyers",
     author_email="54914994+jspeed-meyers@users.noreply.github.com",
-    python_requires=">=3.6",
+    python_requires=">=3.7",
     url="https://github.com/IQTLabs/GitGeo",
     license="Apache",
     classifiers=[
@@ -25,6 +25,8 @@ setup(
     ],
     packages=find_packages(),
     install_requires=install_requires,
+    # parquet and feather results
+    extras_require={"columnar": ["pyarrow"]},
     include_package_data=True,
     tests_require=["pytest"],
     entry_points={"console_scripts": ["gitgeo = gitgeo.main:main"]},
@@ -0,0 +1,46 @@
+"""Pytest configuration for GitGeo tests."""
+
+import pytest
+
+from gitgeo.cache import configure_cache
+from gitgeo.http_session import set_session
+from gitgeo.transport import configure_transport, TRANSPORT_MODES, TRANSPORT_SETTINGS
+
+
+def pytest_addoption(parser):
+    """Add options to run the tests against recorded GitHub and PyPI traffic."""
+    parser.addoption(
+        "--transport",
+        choices=TRANSPORT_MODES,
+        default=TRANSPORT_SETTINGS["mode"],
+        help="Use the network, record traffic to cassettes or replay them.",
+    )
+    parser.addoption(
+        "--cassette-dir",
+        default=TRANSPORT_SETTINGS["cassette_dir"],
+        help="Directory of recorded GitHub and PyPI traffic.",
+    )
+    parser.addoption(
+        "--replay-latency",
+        type=float,
+        default=TRANSPORT_SETTINGS["latency"],
+        help="Seconds to wait before each replayed response.",
+    )
+
+
+def pytest_configure(config):
+    """Select the transport before any test sends a request."""
+    configure_transport(
+        config.getoption("--transport"),
+        config.getoption("--cassette-dir"),
+        config.getoption("--replay-latency"),
+    )
+    set_session(None)
+
+
+@pytest.fixture(autouse=True, scope="session")
+def session_cache(tmp_path_factory):
+    """Keep the GitGeo cache of all tests out of the user's cache directory."""
+    configure_cache(cache_dir=tmp_path_factory.mktemp("cache"))
+    yield
+    configure_cache()
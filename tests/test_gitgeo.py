@@ -2,33 +2,97 @@
 
 # pylint: disable=no-self-use, too-many-locals
 
+from concurrent.futures import ThreadPoolExecutor
 import csv
 import glob
+import json
 import os
+import shutil
 import textwrap
+import time
 from pathlib import Path
 
 import pandas as pd
 import pytest
+import requests
 
-from gitgeo.custom_csv import create_csv, add_committer_to_csv
-from gitgeo.geolocation import get_country_from_location
+from gitgeo.cache import (
+    CACHE_SETTINGS,
+    configure_cache,
+    get_contributor_list_cache,
+    get_profile_cache,
+    ProfileCache,
+)
+from gitgeo.custom_csv import (
+    add_committer_to_csv,
+    create_csv,
+    create_result_writer,
+    get_delta_path,
+    read_results_csv,
+    reclassify_csv,
+    ResultWriter,
+    truncate_results,
+)
+from gitgeo.geographies_list import (
+    get_geography_tables_key,
+    load_geography_tables,
+    parse_geography_tables,
+    read_cached_geography_tables,
+    write_cached_geography_tables,
+)
+from gitgeo.geolocation import (
+    BKTree,
+    bounded_levenshtein_distance,
+    classify_locations,
+    ends_with_us_state,
+    get_country_from_location,
+    levenshteinDistance,
+    LocationMemo,
+    SubstringIndex,
+)
+from gitgeo.http_session import (
+    create_session,
+    get_session,
+    MAX_RETRIES,
+    set_session,
+)
+from gitgeo.transport import (
+    CassetteMissError,
+    configure_transport,
+    TRANSPORT_SETTINGS,
+)
+from gitgeo import github
 from gitgeo.github import (
+    DEFAULT_RATE_LIMIT_WAIT,
     get_contributors,
     get_contributor_location,
+    get_contributor_locations,
+    get_github_api_url,
     get_github_tokens,
+    get_retry_after,
     read_in_github_token_list,
+    request_github,
+    TokenPool,
 )
 from gitgeo.main import scan_single_package, scan_single_repo
+from gitgeo.mock_github import MockGitHubServer
 from gitgeo.mapping import (
     get_dataframe_from_csv,
     get_dataframe_from_repo,
     add_contributor_count_to_json,
     make_map,
+    make_per_repo_maps,
 )
-from gitgeo.multi_repo_scan import scan_multiple_repos
+from gitgeo import multi_repo_scan
+from gitgeo.multi_repo_scan import MultiRepoScanner, scan_multiple_repos
 from gitgeo.printers import print_by_contributor, print_by_country
 from gitgeo.pypi import get_pypi_data, extract_github_owner_and_repo
+from gitgeo.world_geometry import (
+    get_polygons,
+    load_world_geometry,
+    MAP_RESOLUTIONS,
+    simplify_world_geometry,
+)
 
 
 class TestPypiFunctionality:  # pragma: no cover
@@ -105,6 +169,159 @@ class TestGitHubFunctionality:  # pragma: no cover
         """Unit test for get_contributor_location()."""
         assert get_contributor_location("anarkiwi") == "Wellington, New Zealand"
 
+    def test_get_contributor_locations_keeps_input_order(self, monkeypatch):
+        """Unit test for get_contributor_locations() with a fake fetcher."""
+        monkeypatch.setattr(github, "get_contributor_location", lambda user: user[::-1])
+        users = ["user" + str(index) for index in range(50)]
+        locations = get_contributor_locations(users, concurrency=8)
+        assert locations == [user[::-1] for user in users]
+        assert get_contributor_locations([], concurrency=8) == []
+
+    def test_get_contributor_locations_graphql(self, monkeypatch):
+        """Unit test for the GraphQL backend of get_contributor_locations()."""
+        previous_settings = dict(CACHE_SETTINGS)
+        configure_cache(enabled=False)
+        queries = []
+
+        def fake_post(url, **kwargs):  # pylint: disable=unused-argument
+            queries.append(kwargs["json"])
+            data = {}
+            for alias, login in kwargs["json"]["variables"].items():
+                index = alias[len("login") :]
+                # GraphQL cannot resolve app bots, return null like GitHub
+                if not login.endswith("[bot]"):
+                    data["user" + index] = {"location": login.upper()}
+            return make_response(200, json.dumps({"data": data}))
+
+        set_session(FakeSession(post=fake_post))
+        monkeypatch.setattr(github, "GITHUB_TOKENS", TokenPool(["test_token"]))
+        monkeypatch.setattr(github, "get_contributor_location", lambda user: None)
+        users = ["user" + str(index) for index in range(250)] + ["renovate[bot]"]
+        try:
+            locations = get_contributor_locations(users, backend="graphql")
+        finally:
+            configure_cache(**previous_settings)
+            set_session(None)
+        assert len(queries) == 3  # batches of 100, 100 and 51 users
+        assert locations[:2] == ["USER0", "USER1"]
+        assert locations[-1] is None  # fetched through REST instead
+
+    def test_get_contributor_locations_graphql_without_token(self, monkeypatch, capsys):
+        """Unit test that GraphQL without a token uses the REST backend."""
+        monkeypatch.setattr(github, "GITHUB_TOKENS", TokenPool([None]))
+        monkeypatch.setattr(github, "get_contributor_location", lambda user: user)
+        set_session(FakeSession())  # no GraphQL query allowed
+        try:
+            locations = get_contributor_locations(["a", "b"], backend="graphql")
+        finally:
+            set_session(None)
+        assert locations == ["a", "b"]
+        assert "needs a GitHub token" in capsys.readouterr().err
+
+    def test_substring_index(self):
+        """Unit test for SubstringIndex matching a linear scan."""
+        keys = ["Greater London", "London", "Ontario", "Lon", ""]
+        index = SubstringIndex(keys)
+        for text in ["London", "Lon", "on", "ario", "Ontario", "x", "", "Greater"]:
+            expected = next((key for key in keys if text in key), None)
+            assert index.first_key_containing(text) == expected
+
+    def test_ends_with_us_state(self):
+        """Unit test for ends_with_us_state()."""
+        assert ends_with_us_state("Naperville, IL")
+        assert ends_with_us_state("Seattle, Washington")
+        assert ends_with_us_state("Washington, DC")
+        assert not ends_with_us_state("Lisbon, Portugal")
+        assert not ends_with_us_state("")
+
+    def test_bounded_levenshtein_distance(self):
+        """Unit test for bounded_levenshtein_distance()."""
+        pairs = [
+            ("", ""),
+            ("", "Peru"),
+            ("Kitten", "Sitting"),
+            ("Bras√≠lia", "Brazil"),
+            ("Wellington New Zealand", "New Zealand"),
+        ]
+        for s1, s2 in pairs:
+            distance = levenshteinDistance(s1, s2)
+            assert bounded_levenshtein_distance(s1, s2) == distance
+            assert bounded_levenshtein_distance(s2, s1, distance) == distance
+            if distance > 0:
+                assert bounded_levenshtein_distance(s1, s2, distance - 1) == distance
+
+    def test_bk_tree_nearest(self):
+        """Unit test for BKTree.nearest() matching a linear scan."""
+        words = ["Peru", "Chad", "Oman", "Iran", "Iraq", "Mali", "Niger", "Nigeria"]
+        tree = BKTree(words)
+        for query in ["Per", "Irak", "Nigerian", "Omen", "Xyz", "Chad"]:
+            expected = min(words, key=lambda word: levenshteinDistance(query, word))
+            assert tree.nearest(query) == expected
+
+    def test_location_memo(self, tmp_path):
+        """Unit test for LocationMemo eviction, counters and persistence."""
+        memo = LocationMemo(maxsize=2)
+        memo.set("Berlin, Germany", "Germany")
+        memo.set("China", "China")
+        assert memo.get("Berlin, Germany") == "Germany"
+        memo.set("San Francisco, CA", "United States")  # evicts "China"
+        assert memo.get("China") is None
+        assert memo.stats()["hits"] == 1
+        assert memo.stats()["misses"] == 1
+        assert memo.stats()["hit_rate"] == 0.5
+
+        memo.save(tmp_path / "locations.json")
+        reloaded_memo = LocationMemo()
+        assert reloaded_memo.load(tmp_path / "locations.json")
+        assert reloaded_memo.get("San Francisco, CA") == "United States"
+        assert not reloaded_memo.load(tmp_path / "missing.json")
+
+    def test_location_memo_reads_path_on_first_miss(self, monkeypatch, tmp_path):
+        """Unit test that LocationMemo.set_path() defers reading the file."""
+        memo = LocationMemo()
+        memo.set("China", "China")
+        memo.save(tmp_path / "locations.json")
+        reads = []
+        monkeypatch.setattr(
+            LocationMemo, "_read", lambda self, path: reads.append(path) or False
+        )
+        lazy_memo = LocationMemo()
+        lazy_memo.set_path(tmp_path / "locations.json")
+        assert not reads
+        lazy_memo.get("Peru")
+        lazy_memo.get("Chad")
+        assert reads == [tmp_path / "locations.json"]
+
+        monkeypatch.undo()
+        lazy_memo = LocationMemo()
+        lazy_memo.set_path(tmp_path / "locations.json")
+        assert lazy_memo.get("China") == "China"
+        assert lazy_memo.stats()["hits"] == 1
+
+    def test_geography_tables_cache(self, tmp_path):
+        """Unit test for the binary cache of the geography tables."""
+        tables = parse_geography_tables()
+        assert tables == load_geography_tables()
+        key = get_geography_tables_key()
+        path = tmp_path / "geographies.pickle"
+        assert read_cached_geography_tables(path, key) is None
+        write_cached_geography_tables(path, key, tables)
+        assert read_cached_geography_tables(path, key) == tables
+        # a change to any source file invalidates the cache
+        assert read_cached_geography_tables(path, key[:-1]) is None
+        path.write_bytes(b"corrupt")
+        assert read_cached_geography_tables(path, key) is None
+
+    def test_classify_locations(self):
+        """Unit test for classify_locations() on lists and Series."""
+        locations = ["Lisbon", None, "Berlin, DE", "Lisbon", "", "USA"]
+        expected = ["Portugal", "None", "Germany", "Portugal", "None", "United States"]
+        assert classify_locations(locations) == expected
+        series = pd.Series(locations, index=range(10, 16))
+        output = classify_locations(series)
+        assert output.tolist() == expected
+        assert output.index.tolist() == list(range(10, 16))
+
     def test_get_country_from_location_standard_order_with_comma(self):
         """test get_country_from_location on standard order pairs with comma."""
         assert get_country_from_location("Wellington, New Zealand") == "New Zealand"
@@ -255,6 +472,41 @@ class TestGitHubFunctionality:  # pragma: no cover
         token2 = next(tokens)
         assert token2 == "test_token_2"
 
+    def test_token_pool_prefers_remaining_budget(self):
+        """Unit test that TokenPool picks the token with the most budget."""
+        pool = TokenPool(["token_a", "token_b"])
+        pool.update("token_a", {"X-RateLimit-Remaining": "10"})
+        pool.update("token_b", {"X-RateLimit-Remaining": "4000"})
+        with pool.token() as token:
+            assert token == "token_b"
+        # a drained token is skipped until its rate limit resets
+        pool.update("token_b", {"X-RateLimit-Remaining": "0"})
+        assert next(pool) == "token_a"
+
+    def test_token_pool_tracks_resources(self):
+        """Unit test that TokenPool keeps core and graphql budgets apart."""
+        pool = TokenPool(["token_a", "token_b"])
+        pool.update("token_a", {"X-RateLimit-Remaining": "4000"})
+        pool.update("token_b", {"X-RateLimit-Remaining": "10"})
+        pool.update(
+            "token_a",
+            {"X-RateLimit-Remaining": "0", "X-RateLimit-Resource": "graphql"},
+        )
+        pool.update("token_b", {"X-RateLimit-Remaining": "100"}, "graphql")
+        with pool.token() as token:
+            assert token == "token_a"
+        with pool.token("graphql") as token:
+            assert token == "token_b"
+
+    def test_token_pool_waits_for_reset(self):
+        """Unit test that TokenPool sleeps when every token is drained."""
+        pool = TokenPool(["token_a"])
+        reset = time.time() + 0.1
+        pool.mark_drained("token_a", reset)
+        with pool.token() as token:
+            assert token == "token_a"
+        assert time.time() >= reset
+
     def test_read_in_github_token_list(self):
         """Unit test for read_in_github_token_list()."""
         tokens = read_in_github_token_list(Path(__file__).with_name("test_tokens.txt"))
@@ -262,6 +514,362 @@ class TestGitHubFunctionality:  # pragma: no cover
         assert tokens[1] == "test_token_2"
 
 
+def make_response(status_code, body="", headers=None):
+    """Build a requests.Response without touching the network."""
+    response = requests.models.Response()
+    response.status_code = status_code
+    response._content = body.encode("utf-8")  # pylint: disable=protected-access
+    response.headers.update(headers or {})
+    return response
+
+
+class FakeSession:  # pylint: disable=too-few-public-methods
+    """Stand-in for the shared HTTP session that never touches the network."""
+
+    def __init__(self, get=None, post=None):
+        self.get = get or self.refuse
+        self.post = post or self.refuse
+
+    @staticmethod
+    def refuse(url, **kwargs):
+        """Fail the test if a request is made."""
+        raise AssertionError("unexpected request to " + url)
+
+
+@pytest.fixture
+def temporary_cache(tmp_path):
+    """Point the GitGeo cache at a temporary directory for one test."""
+    previous_settings = dict(CACHE_SETTINGS)
+    configure_cache(cache_dir=tmp_path)
+    yield tmp_path
+    configure_cache(**previous_settings)
+
+
+class TestHttpSession:
+    """Unit tests related to the shared HTTP session."""
+
+    def test_create_session(self, monkeypatch):
+        """Unit test for create_session()."""
+        # also when the suite runs against recorded traffic
+        monkeypatch.setitem(TRANSPORT_SETTINGS, "mode", "live")
+        session = create_session(pool_maxsize=5)
+        adapter = session.get_adapter("https://api.github.com")
+        assert adapter.max_retries.total > 0
+        assert 502 in adapter.max_retries.status_forcelist
+        # request_github() handles rate limiting with the token pool
+        assert 429 not in adapter.max_retries.status_forcelist
+        assert "gzip" in session.headers["Accept-Encoding"]
+
+    def test_set_session(self):
+        """Unit test for set_session() and get_session()."""
+        fake_session = FakeSession()
+        set_session(fake_session)
+        assert get_session() is fake_session
+        set_session(None)
+        assert get_session() is not fake_session
+        assert get_session() is get_session()
+
+    def test_request_github_secondary_rate_limit(self, monkeypatch):
+        """Unit test that request_github() gives up on repeated Retry-After."""
+        sleeps = []
+        monkeypatch.setattr(github.time, "sleep", sleeps.append)
+        refusal = make_response(403, headers={"Retry-After": "soon"})
+        set_session(FakeSession(get=lambda url, **kwargs: refusal))
+        try:
+            response = request_github("https://api.github.com/users/octocat")
+        finally:
+            set_session(None)
+        assert response.status_code == 403
+        assert len(sleeps) == MAX_RETRIES
+        assert get_retry_after({"Retry-After": "2"}) == 2
+        assert get_retry_after({"Retry-After": "soon"}) == DEFAULT_RATE_LIMIT_WAIT
+
+    def test_request_github_switches_token_on_429(self, monkeypatch):
+        """Unit test that request_github() swaps a drained token after a 429."""
+        monkeypatch.setattr(github, "GITHUB_TOKENS", TokenPool(["token_a", "token_b"]))
+        monkeypatch.setattr(github.time, "sleep", pytest.fail)
+        sent_tokens = []
+
+        def fake_get(url, auth=None, **kwargs):  # pylint: disable=unused-argument
+            sent_tokens.append(auth[1])
+            if auth[1] == "token_a":
+                return make_response(429, headers={"X-RateLimit-Remaining": "0"})
+            return make_response(200, '{"location": "Berlin"}')
+
+        set_session(FakeSession(get=fake_get))
+        try:
+            response = request_github("https://api.github.com/users/octocat")
+        finally:
+            set_session(None)
+        assert response.status_code == 200
+        assert sent_tokens == ["token_a", "token_b"]
+
+    def test_record_and_replay_transport(self, monkeypatch, tmp_path):
+        """Unit test for recording traffic to a cassette and replaying it."""
+        url = "https://api.github.com/users/octocat"
+        network_response = make_response(
+            200, '{"location": "Berlin"}', {"ETag": '"v1"', "Content-Length": "22"}
+        )
+        monkeypatch.setattr(
+            requests.adapters.HTTPAdapter,
+            "send",
+            lambda adapter, request, **kwargs: network_response,
+        )
+        saved_settings = dict(TRANSPORT_SETTINGS)
+        try:
+            configure_transport("record", tmp_path)
+            session = create_session()
+            session.get(url, headers={"Authorization": "token secret"})
+            (recording,) = tmp_path.glob("api.github.com/*.json")
+            assert "secret" not in recording.read_text()
+
+            monkeypatch.undo()  # no network from here on
+            configure_transport("replay", tmp_path)
+            session = create_session()
+            response = session.get(url)
+            assert response.status_code == 200
+            assert response.json() == {"location": "Berlin"}
+            assert session.get(url, headers={"If-None-Match": '"v1"'}).status_code == 304
+            with pytest.raises(CassetteMissError):
+                session.get(url + "?page=2")
+        finally:
+            configure_transport(**saved_settings)
+
+
+class TestProfileCache:
+    """Unit tests related to the local GitHub profile cache."""
+
+    def test_profile_cache_get_and_set(self, tmp_path):
+        """Unit test for ProfileCache.get() and ProfileCache.set()."""
+        cache = ProfileCache(tmp_path / "cache.sqlite3")
+        url = "https://api.github.com/users/anarkiwi"
+        assert cache.get(url) is None
+        cache.set(url, "Wellington, New Zealand", '"etag"')
+        # logins are case-insensitive
+        entry = cache.get("https://api.github.com/users/Anarkiwi")
+        assert entry["location"] == "Wellington, New Zealand"
+        assert entry["etag"] == '"etag"'
+        assert not cache.is_expired(entry)
+        cache.close()
+
+        # entries persist between runs
+        cache = ProfileCache(tmp_path / "cache.sqlite3", ttl=-1)
+        entry = cache.get(url)
+        assert entry["location"] == "Wellington, New Zealand"
+        assert cache.is_expired(entry)
+        cache.close()
+
+    def test_profile_cache_evicts_least_recently_used(self, tmp_path):
+        """Unit test for ProfileCache eviction."""
+        cache = ProfileCache(tmp_path / "cache.sqlite3", max_entries=2)
+        cache.set("https://api.github.com/users/user1", "Lisbon")
+        cache.set("https://api.github.com/users/user2", "Berlin")
+        # user2 is now the least recently used
+        cache.get("https://api.github.com/users/user1")
+        cache.set("https://api.github.com/users/user3", None)
+        assert len(cache) == 2
+        assert cache.get("https://api.github.com/users/user2") is None
+        assert cache.get("https://api.github.com/users/user1")["location"] == "Lisbon"
+        assert cache.get("https://api.github.com/users/user3")["location"] is None
+        cache.close()
+
+    def test_get_contributor_location_uses_cache(
+        self, temporary_cache
+    ):  # pylint: disable=redefined-outer-name, unused-argument
+        """Unit test that get_contributor_location() skips cached users."""
+        get_profile_cache().set(
+            get_github_api_url("/users/cached-user"), "Lisbon, Portugal"
+        )
+        set_session(FakeSession())  # no network allowed
+        try:
+            assert get_contributor_location("cached-user") == "Lisbon, Portugal"
+        finally:
+            set_session(None)
+
+    def test_caches_are_kept_per_api_url(
+        self, monkeypatch, temporary_cache
+    ):  # pylint: disable=redefined-outer-name, unused-argument
+        """Unit test that two API base URLs do not share cache entries."""
+        requested_urls = []
+
+        def fake_get(url, **kwargs):  # pylint: disable=unused-argument
+            requested_urls.append(url)
+            if "/users/" in url:
+                return make_response(200, '{"login": "octocat", "location": "Mock"}')
+            return make_response(200, '[{"login": "user1"}]')
+
+        get_profile_cache().set(get_github_api_url("/users/octocat"), "Berlin")
+        get_contributor_list_cache().set(
+            get_github_api_url("/repos/octo/repo"), 100, ["octocat"]
+        )
+        monkeypatch.setitem(github.GITHUB_API_SETTINGS, "url", "http://127.0.0.1:8000")
+        set_session(FakeSession(get=fake_get))
+        try:
+            assert get_contributor_location("octocat") == "Mock"
+            assert get_contributors("octo/repo") == ["user1"]
+        finally:
+            set_session(None)
+        assert all(url.startswith("http://127.0.0.1:8000/") for url in requested_urls)
+        assert len(requested_urls) == 2
+
+        monkeypatch.undo()
+        set_session(FakeSession())  # entries of the real API are untouched
+        try:
+            assert get_contributor_location("octocat") == "Berlin"
+            assert get_contributors("octo/repo") == ["octocat"]
+        finally:
+            set_session(None)
+
+    def test_conditional_requests(
+        self, temporary_cache
+    ):  # pylint: disable=redefined-outer-name, unused-argument
+        """Unit test that unchanged pages and profiles are served from cache."""
+        sent_headers = []
+
+        def fake_get(url, headers=None, **kwargs):  # pylint: disable=unused-argument
+            sent_headers.append(headers)
+            if headers.get("If-None-Match") == '"v1"':
+                return make_response(304)
+            if "/users/" in url:
+                body = '{"login": "octocat", "location": "Berlin"}'
+            else:
+                body = '[{"login": "octocat"}]'
+            return make_response(200, body, {"ETag": '"v1"'})
+
+        set_session(FakeSession(get=fake_get))
+        try:
+            # expire contributor lists immediately so that pages are revalidated
+            get_contributor_list_cache().ttl = -1
+            assert get_contributors("octo/repo") == ["octocat"]
+            assert get_contributors("octo/repo") == ["octocat"]
+            assert sent_headers[1] == {"If-None-Match": '"v1"'}
+
+            # expire the profile immediately so that it is revalidated
+            get_profile_cache().ttl = -1
+            assert get_contributor_location("octocat") == "Berlin"
+            assert get_contributor_location("octocat") == "Berlin"
+            assert sent_headers[3] == {"If-None-Match": '"v1"'}
+        finally:
+            set_session(None)
+
+    def test_contributor_list_cache(
+        self, temporary_cache
+    ):  # pylint: disable=redefined-outer-name, unused-argument
+        """Unit test that fresh contributor lists are reused without requests."""
+        requested_urls = []
+
+        def fake_get(url, **kwargs):  # pylint: disable=unused-argument
+            requested_urls.append(url)
+            if "/Octo/" in url:
+                return make_response(404, '{"message": "Not Found"}')
+            return make_response(200, '[{"login": "octocat"}]')
+
+        set_session(FakeSession(get=fake_get))
+        try:
+            assert get_contributors("octo/repo") == ["octocat"]
+            assert get_contributors("Octo/Repo") == ["octocat"]
+            assert len(requested_urls) == 1
+            get_contributors("octo/repo", 200)  # another length, another entry
+            assert len(requested_urls) == 2
+            assert len(get_contributor_list_cache()) == 2
+        finally:
+            set_session(None)
+
+    def test_get_contributors_fetches_pages_concurrently(
+        self, temporary_cache
+    ):  # pylint: disable=redefined-outer-name, unused-argument
+        """Unit test that get_contributors() stops at the last page."""
+        requested_pages = []
+        page_url = "https://api.github.com/repos/octo/repo/contributors?page={}"
+
+        def fake_get(url, **kwargs):  # pylint: disable=unused-argument
+            page = int(url.split("page=")[1].split("&")[0])
+            requested_pages.append(page)
+            logins = range((page - 1) * 100, min(page * 100, 250))
+            body = json.dumps([{"login": "user{}".format(login)} for login in logins])
+            link = '<{}>; rel="last"'.format(page_url.format(3))
+            if page < 3:
+                link += ', <{}>; rel="next"'.format(page_url.format(page + 1))
+            return make_response(200, body, {"Link": link})
+
+        set_session(FakeSession(get=fake_get))
+        try:
+            contributors = get_contributors("octo/repo", 500, concurrency=4)
+            assert contributors == ["user{}".format(login) for login in range(250)]
+            assert sorted(requested_pages) == [1, 2, 3]
+            assert get_contributors("octo/repo", 200, concurrency=1) == contributors[:200]
+        finally:
+            set_session(None)
+
+
+class TestMockGitHub:
+    """Unit tests that run GitGeo against the local mock GitHub API."""
+
+    @pytest.fixture
+    def mock_api(self, monkeypatch, temporary_cache):
+        """Serve a mock GitHub API and send GitGeo's requests to it."""
+        # pylint: disable=redefined-outer-name, unused-argument
+        # the mock server is local, never replay it from a cassette
+        monkeypatch.setitem(TRANSPORT_SETTINGS, "mode", "live")
+        # GraphQL queries need a token, any token will do for the mock
+        monkeypatch.setattr(github, "GITHUB_TOKENS", TokenPool(["mock_token"]))
+        previous_url = github.GITHUB_API_SETTINGS["url"]
+        with MockGitHubServer(num_users=500, max_contributors=250) as server:
+            github.set_github_api_url(server.url)
+            set_session(None)
+            try:
+                yield server
+            finally:
+                github.set_github_api_url(previous_url)
+                set_session(None)
+
+    def test_get_contributors(self, mock_api):
+        """Unit test for paging through the mock's contributor lists."""
+        # pylint: disable=redefined-outer-name
+        for repo in ["octo/repo", "octo/other"]:
+            contributors = get_contributors(repo, 300, concurrency=4)
+            assert contributors == mock_api.get_contributors(repo)
+            assert get_contributors(repo, 100) == contributors[:100]
+
+    def test_get_contributor_locations(self, mock_api):
+        """Unit test that REST and GraphQL backends give the mock's locations."""
+        # pylint: disable=redefined-outer-name
+        users = mock_api.logins[:120]
+        # like GitHub, the mock sends null for an empty location
+        expected = [mock_api.locations[user] or None for user in users]
+        assert get_contributor_locations(users, 8) == expected
+        configure_cache(enabled=False)
+        assert get_contributor_locations(users, 8, backend="graphql") == expected
+        assert mock_api.request_counts["graphql"] == 2
+
+    def test_rate_limit(self):
+        """Unit test that the mock refuses requests over the rate limit."""
+        with MockGitHubServer(num_users=10, rate_limit=1) as server:
+            session = requests.Session()
+            url = server.url + "/users/user0"
+            response = session.get(url)
+            assert response.status_code == 200
+            assert response.headers["X-RateLimit-Remaining"] == "0"
+            response = session.get(url, headers={"If-None-Match": response.headers["ETag"]})
+            assert response.status_code == 403
+            assert session.get(server.url + "/nothing").status_code == 403
+
+    def test_rate_limit_not_modified(self):
+        """Unit test that the mock does not charge 304 Not Modified answers."""
+        with MockGitHubServer(num_users=10, rate_limit=2) as server:
+            session = requests.Session()
+            url = server.url + "/users/user0"
+            response = session.get(url)
+            assert response.headers["X-RateLimit-Remaining"] == "1"
+            etag = response.headers["ETag"]
+            for _ in range(3):
+                response = session.get(url, headers={"If-None-Match": etag})
+                assert response.status_code == 304
+                assert response.headers["X-RateLimit-Remaining"] == "1"
+            assert session.get(url).headers["X-RateLimit-Remaining"] == "0"
+            assert server.request_counts["users"] == 5
+
+
 class TestCsvFunctionality:  # pragma: no cover
     """Unit tests related to CSV functionality"""
 
@@ -277,18 +885,116 @@ class TestCsvFunctionality:  # pragma: no cover
         )
         os.remove(os.path.join("results", "contributors_1.csv"))  # remove file
 
+    def test_result_writer(self):
+        """Unit test for ResultWriter buffering, threading and appending."""
+        with ResultWriter("contributors", "2", flush_every=10) as writer:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                for index in range(25):
+                    executor.submit(
+                        writer.write, "iqtlabs/gitgeo", str(index), "Lisbon", "Portugal"
+                    )
+            # the last five rows are still buffered
+            with open(writer.path, newline="", encoding="utf-8") as file:
+                assert len(list(csv.reader(file))) == 21
+        with ResultWriter("contributors", "2", append=True) as writer:
+            writer.write("iqtlabs/gitgeo", "25", "", "None")
+        with open(writer.path, newline="", encoding="utf-8") as file:
+            rows = list(csv.reader(file))
+        os.remove(writer.path)
+        assert rows[0] == ["software_name", "username", "location", "country"]
+        assert len(rows) == 27
+        assert sorted(int(row[1]) for row in rows[1:]) == list(range(26))
+        assert rows[-1] == ["iqtlabs_gitgeo", "25", "", "None"]
+
+    @pytest.mark.parametrize("output_format", ["parquet", "feather"])
+    def test_columnar_result_writer(self, monkeypatch, tmp_path, output_format):
+        """Unit test for writing and reading partitioned columnar results."""
+        pytest.importorskip("pyarrow")
+        monkeypatch.chdir(tmp_path)
+        offsets = []
+        with create_result_writer(
+            "multirepo",
+            "1",
+            output_format,
+            flush_every=2,
+            on_flush=lambda offset, rows: offsets.append(offset),
+        ) as writer:
+            writer.write("octo/one", "alice", "Lisbon", "Portugal")
+            writer.write("octo/two", "bob", None, "None")
+            writer.write("octo/one", "carol", "Paris", "France")
+            writer.write("octo/one", "dave", "Porto", "Portugal")
+            writer.write("octo/two", "erin", "Lyon", "France")
+        filename = "multirepo_1." + output_format
+        assert writer.path == tmp_path / "results" / filename
+        assert offsets == [1, 2, 3]
+        assert len(list(writer.path.glob("part-*"))) == 3
+
+        rows = read_results_csv(filename)
+        assert rows[1] == {
+            "software_name": "octo_two",
+            "username": "bob",
+            "location": "",
+            "country": "None",
+        }
+        df, num_contributors = get_dataframe_from_csv(filename, "octo_one")
+        assert df.values.tolist() == [["Portugal", 2], ["France", 1]]
+        assert num_contributors == 3
+
+        # as after a crash following the first flush
+        truncate_results(writer.path, 1)
+        with create_result_writer(
+            "multirepo", "1", output_format, append=True
+        ) as writer:
+            writer.write("octo/three", "frank", "Oslo", "Norway")
+        assert [row["username"] for row in read_results_csv(filename)] == [
+            "alice",
+            "bob",
+            "frank",
+        ]
+
+    @pytest.mark.parametrize("output_format", ["parquet", "feather"])
+    def test_reclassify_columnar(self, monkeypatch, tmp_path, output_format):
+        """Unit test for reclassify_csv() with parquet and feather results."""
+        pytest.importorskip("pyarrow")
+        monkeypatch.chdir(tmp_path)
+        with create_result_writer("multirepo", "1", output_format) as writer:
+            writer.write("octo/one", "alice", "Lisbon", "Atlantis")
+            writer.write("octo/one", "bob", "", "Atlantis")
+        output_path = reclassify_csv(writer.path.name)
+        assert output_path.name == "multirepo_1_reclassified." + output_format
+        assert [
+            (row["username"], row["location"], row["country"])
+            for row in read_results_csv(output_path.name)
+        ] == [("alice", "Lisbon", "Portugal"), ("bob", "", "None")]
+
+    def test_reclassify_csv(self):
+        """Unit test for reclassify_csv()."""
+        output_path = reclassify_csv("test_multirepo.csv")
+        with open(output_path, newline="", encoding="utf-8") as output_file:
+            rows = list(csv.reader(output_file))
+        os.remove(output_path)
+        assert rows[0] == ["software_name", "username", "location", "country"]
+        assert rows[1] == ["iqtlabs_gitgeo", "jspeed-meyers", "", "None"]
+        assert rows[4] == ["iqtlabs_gitgeo", "codacy-badger", "Lisbon", "Portugal"]
+
+
+def make_multirepo_name(scan_time):
+    """Return the name of a multirepo csv started at scan_time."""
+    return "multirepo_{}.csv".format(
+        time.strftime("%Y%m%d-%H%M%S", time.localtime(scan_time))
+    )
+
 
 class TestMultiRepoScan:  # pragma: no cover
     """Tests related to multi-repo scanning capability."""
 
     # pylint: disable=too-few-public-methods
 
-    def test_multi_repo_scan(self):
+    def test_multi_repo_scan(self, monkeypatch, tmp_path):
         """Unit test for scan_multiple_repos()."""
-        scan_multiple_repos(Path(__file__).with_name("test_repos.txt"))
-        # identify file created for test
-        files = glob.glob("results/*.csv")
-        test_file = max(files, key=os.path.getctime)
+        # write results, and the checkpoint, outside the repo's results folder
+        monkeypatch.chdir(tmp_path)
+        test_file = scan_multiple_repos(Path(__file__).with_name("test_repos.txt"))
         # check that csv rows are as expected
         with open(test_file, newline="") as test_output:
             for index, row in enumerate(csv.reader(test_output)):
@@ -308,7 +1014,283 @@ class TestMultiRepoScan:  # pragma: no cover
                         "Wellington, New Zealand",
                         "New Zealand",
                     ]
-        os.remove(test_file)
+
+    def test_multi_repo_scanner_dedupes_logins(self, monkeypatch):
+        """Unit test for MultiRepoScanner ordering and login deduplication."""
+        contributors = {
+            "a/one": ["alice", "bob"],
+            "b/two": ["bob", "carol"],
+            "c/three": ["alice", "dave", "carol"],
+        }
+        lookups = []
+
+        def fake_get_contributors(
+            repo, num, concurrency
+        ):  # pylint: disable=unused-argument
+            time.sleep(0.01 * len(contributors[repo]))  # finish out of order
+            return contributors[repo][:num]
+
+        def fake_get_contributor_location(user):
+            lookups.append(user)
+            return user.capitalize() + "ville"
+
+        monkeypatch.setattr(multi_repo_scan, "get_contributors", fake_get_contributors)
+        monkeypatch.setattr(
+            multi_repo_scan, "get_contributor_location", fake_get_contributor_location
+        )
+        scanner = MultiRepoScanner(num=100, concurrency=4)
+        results = list(scanner.scan(["a/one", "b/two", "c/three"]))
+        assert results == [
+            (repo, user, user.capitalize() + "ville")
+            for repo, users in contributors.items()
+            for user in users
+        ]
+        assert sorted(lookups) == ["alice", "bob", "carol", "dave"]
+
+    def test_multi_repo_scanner_fetches_pages_serially(self, monkeypatch):
+        """Unit test that MultiRepoScanner does not nest page pools."""
+        page_concurrencies = []
+
+        def fake_get_contributors(repo, num, concurrency):
+            page_concurrencies.append(concurrency)
+            return [repo.split("/")[0]][:num]
+
+        monkeypatch.setattr(multi_repo_scan, "get_contributors", fake_get_contributors)
+        monkeypatch.setattr(
+            multi_repo_scan, "get_contributor_location", lambda user: "Lisbon"
+        )
+        scanner = MultiRepoScanner(num=100, concurrency=4)
+        list(scanner.scan(["a/one", "b/two", "c/three"]))
+        assert page_concurrencies == [1, 1, 1]
+
+    def test_scan_multiple_repos_resume(self, monkeypatch, tmp_path):
+        """Unit test for resuming an interrupted scan_multiple_repos()."""
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "repos.txt").write_text(
+            "github.com/a/one\ngithub.com/b/two\n\ngithub.com/c/three\n"
+        )
+        contributors = {
+            "a/one": ["alice", "bob"],
+            "b/two": ["bob", "carol"],
+            "c/three": ["alice", "dave", "carol"],
+        }
+        fetched_repos = []
+        network_up = False
+
+        def fake_get_contributors(
+            repo, num, concurrency
+        ):  # pylint: disable=unused-argument
+            fetched_repos.append(repo)
+            return contributors[repo][:num]
+
+        def fake_get_contributor_location(user):
+            if user == "carol" and not network_up:
+                raise requests.exceptions.ConnectionError("network blip")
+            return "Lisbon"
+
+        monkeypatch.setattr(multi_repo_scan, "get_contributors", fake_get_contributors)
+        monkeypatch.setattr(
+            multi_repo_scan, "get_contributor_location", fake_get_contributor_location
+        )
+        with pytest.raises(requests.exceptions.ConnectionError):
+            scan_multiple_repos("repos.txt", concurrency=1)
+        (results_path,) = (tmp_path / "results").glob("multirepo_*.csv")
+        assert results_path.with_suffix(".checkpoint").exists()
+        with open(results_path, "a", encoding="utf-8") as file:
+            file.write("c_three,partial-row")  # torn write from the crash
+
+        network_up = True
+        fetched_repos.clear()
+        assert scan_multiple_repos("repos.txt", resume=results_path.name) == (
+            results_path
+        )
+        # a/one finished before the crash and is not fetched again
+        assert fetched_repos == ["b/two", "c/three"]
+        assert not results_path.with_suffix(".checkpoint").exists()
+        with open(results_path, newline="", encoding="utf-8") as file:
+            rows = list(csv.reader(file))
+        assert rows == [["software_name", "username", "location", "country"]] + [
+            [repo.replace("/", "_"), user, "Lisbon", "Portugal"]
+            for repo, users in contributors.items()
+            for user in users
+        ]
+
+    def test_scan_multiple_repos_resume_before_first_flush(self, monkeypatch, tmp_path):
+        """Unit test for resuming a scan killed before its first flush."""
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "repos.txt").write_text("github.com/a/one\ngithub.com/b/two\n")
+        contributors = {"a/one": ["alice", "bob"], "b/two": ["carol"]}
+        monkeypatch.setattr(
+            multi_repo_scan,
+            "get_contributors",
+            lambda repo, num, concurrency: contributors[repo][:num],
+        )
+        monkeypatch.setattr(
+            multi_repo_scan, "get_contributor_location", lambda user: "Lisbon"
+        )
+
+        def kill(*args, **kwargs):  # pylint: disable=unused-argument
+            raise SystemExit("killed")
+
+        with monkeypatch.context() as patch:
+            patch.setattr(multi_repo_scan, "create_result_writer", kill)
+            with pytest.raises(SystemExit):
+                scan_multiple_repos("repos.txt")
+        (checkpoint_path,) = (tmp_path / "results").glob("multirepo_*.checkpoint")
+        assert checkpoint_path.read_text() == ""
+        # rows written before the kill, but never journaled
+        results_path = checkpoint_path.with_suffix(".csv")
+        results_path.write_text(
+            "software_name,username,location,country\na_one,alice,Lis"
+        )
+
+        assert scan_multiple_repos("repos.txt", resume=results_path.name) == (
+            results_path
+        )
+        assert not checkpoint_path.exists()
+        with open(results_path, newline="", encoding="utf-8") as file:
+            assert list(csv.reader(file))[1:] == [
+                ["a_one", "alice", "Lisbon", "Portugal"],
+                ["a_one", "bob", "Lisbon", "Portugal"],
+                ["b_two", "carol", "Lisbon", "Portugal"],
+            ]
+
+    def test_scan_multiple_repos_incremental(
+        self, monkeypatch, tmp_path, temporary_cache
+    ):  # pylint: disable=redefined-outer-name, unused-argument
+        """Unit test that incremental scans only fetch new and expired profiles."""
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "repos.txt").write_text("github.com/a/one\n")
+        (tmp_path / "results").mkdir()
+        previous = make_multirepo_name(time.time() - 60 * 60)
+        (tmp_path / "results" / previous).write_text(
+            textwrap.dedent(
+                """\
+                software_name,username,location,country
+                a_one,alice,Lisbon,Portugal
+                a_one,bob,Berlin,Germany
+                a_one,dave,Paris,France
+                old_repo,zed,Madrid,Spain
+                """
+            )
+        )
+        # alice's profile was fetched again after the earlier scan
+        get_profile_cache().set(get_github_api_url("/users/alice"), "Porto")
+        # erin's entry is older than the profile TTL
+        expired_at = time.time() - CACHE_SETTINGS["profile_ttl"] - 60
+        with monkeypatch.context() as patch:
+            patch.setattr(time, "time", lambda: expired_at)
+            get_profile_cache().set(
+                get_github_api_url("/users/erin"), "Tokyo", etag='"erin-v1"'
+            )
+        sent_headers = {}
+
+        def fake_get(url, headers=None, **kwargs):  # pylint: disable=unused-argument
+            user = url.rsplit("/", 1)[-1]
+            sent_headers[user] = headers
+            if user == "carol":
+                return make_response(200, '{"login": "carol", "location": "Tokyo"}')
+            if user == "erin" and headers.get("If-None-Match") == '"erin-v1"':
+                return make_response(304)
+            return FakeSession.refuse(url)
+
+        monkeypatch.setattr(
+            multi_repo_scan,
+            "get_contributors",
+            lambda repo, num, concurrency: ["alice", "carol", "dave", "erin"],
+        )
+        set_session(FakeSession(get=fake_get))
+        try:
+            results_path = scan_multiple_repos("repos.txt", previous=previous)
+        finally:
+            set_session(None)
+        # alice is served from the cache and dave from the earlier csv; only
+        # the new login and the expired entry are requested
+        assert sorted(sent_headers) == ["carol", "erin"]
+        assert sent_headers["erin"] == {"If-None-Match": '"erin-v1"'}
+        with open(results_path, newline="", encoding="utf-8") as file:
+            assert list(csv.reader(file))[1:] == [
+                ["a_one", "alice", "Porto", "Portugal"],
+                ["a_one", "carol", "Tokyo", "Japan"],
+                ["a_one", "dave", "Paris", "France"],
+                ["a_one", "erin", "Tokyo", "Japan"],
+                ["old_repo", "zed", "Madrid", "Spain"],
+            ]
+        with open(get_delta_path(results_path), newline="", encoding="utf-8") as file:
+            assert list(csv.reader(file)) == [
+                [
+                    "software_name",
+                    "username",
+                    "change",
+                    "previous_location",
+                    "location",
+                    "country",
+                ],
+                ["a_one", "alice", "location_changed", "Lisbon", "Porto", "Portugal"],
+                ["a_one", "carol", "added", "", "Tokyo", "Japan"],
+                ["a_one", "erin", "added", "", "Tokyo", "Japan"],
+                ["a_one", "bob", "removed", "Berlin", "Berlin", "Germany"],
+            ]
+
+    def test_scan_multiple_repos_incremental_expired_scan(
+        self, monkeypatch, tmp_path, temporary_cache
+    ):  # pylint: disable=redefined-outer-name, unused-argument
+        """Unit test that locations of an expired earlier scan are fetched again."""
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "repos.txt").write_text("github.com/a/one\n")
+        (tmp_path / "results").mkdir()
+        previous = make_multirepo_name(
+            time.time() - CACHE_SETTINGS["profile_ttl"] - 60 * 60
+        )
+        (tmp_path / "results" / previous).write_text(
+            "software_name,username,location,country\na_one,alice,Lisbon,Portugal\n"
+        )
+        requested_urls = []
+
+        def fake_get(url, **kwargs):  # pylint: disable=unused-argument
+            requested_urls.append(url)
+            return make_response(200, '{"login": "alice", "location": "Porto"}')
+
+        monkeypatch.setattr(
+            multi_repo_scan,
+            "get_contributors",
+            lambda repo, num, concurrency: ["alice"],
+        )
+        set_session(FakeSession(get=fake_get))
+        try:
+            results_path = scan_multiple_repos("repos.txt", previous=previous)
+        finally:
+            set_session(None)
+        assert len(requested_urls) == 1
+        with open(results_path, newline="", encoding="utf-8") as file:
+            assert list(csv.reader(file))[1:] == [
+                ["a_one", "alice", "Porto", "Portugal"]
+            ]
+
+    def test_scan_multiple_repos_incremental_without_cache(
+        self, monkeypatch, tmp_path, temporary_cache
+    ):  # pylint: disable=redefined-outer-name, unused-argument
+        """Unit test that an empty earlier location is reused without a cache."""
+        monkeypatch.chdir(tmp_path)
+        (tmp_path / "repos.txt").write_text("github.com/a/one\n")
+        (tmp_path / "results").mkdir()
+        previous = make_multirepo_name(time.time() - 60 * 60)
+        (tmp_path / "results" / previous).write_text(
+            "software_name,username,location,country\na_one,alice,,None\n"
+        )
+        monkeypatch.setattr(
+            multi_repo_scan,
+            "get_contributors",
+            lambda repo, num, concurrency: ["alice"],
+        )
+        configure_cache(enabled=False)
+        set_session(FakeSession())
+        try:
+            results_path = scan_multiple_repos("repos.txt", previous=previous)
+        finally:
+            set_session(None)
+        with open(results_path, newline="", encoding="utf-8") as file:
+            assert list(csv.reader(file))[1:] == [["a_one", "alice", "", "None"]]
 
 
 class TestMapping:
@@ -334,6 +1316,30 @@ class TestMapping:
         assert output[0].equals(expected_ouput)
         assert output[1] >= 4
 
+    def test_get_dataframe_from_csv_in_chunks(self):
+        """Unit test for get_dataframe_from_csv() by chunk and software_name."""
+        csv_path = Path("results") / "test_chunked_multirepo.csv"
+        csv_path.write_text(
+            "software_name,username,location,country\n"
+            "octo_one,a,Lisbon,Portugal\n"
+            "octo_two,b,,None\n"
+            "octo_one,c,,None\n"
+            "octo_one,d,Porto,Portugal\n"
+            "octo_two,e,Paris,France\n"
+        )
+        try:
+            df, num_contributors = get_dataframe_from_csv(csv_path.name, chunksize=2)
+            assert dict(df.values.tolist()) == {"Portugal": 2, "None": 2, "France": 1}
+            assert df.contributor_count.tolist() == [2, 2, 1]
+            assert num_contributors == 5
+            df, num_contributors = get_dataframe_from_csv(
+                csv_path.name, software_name="octo_two", chunksize=2
+            )
+            assert sorted(df.values.tolist()) == [["France", 1], ["None", 1]]
+            assert num_contributors == 2
+        finally:
+            csv_path.unlink()
+
     def test_add_contributor_count_to_json(self):
         """Unit test for add_contributor_count_to_json()."""
         df = pd.DataFrame(
@@ -341,6 +1347,82 @@ class TestMapping:
         )
         output = add_contributor_count_to_json(df)
         assert isinstance(output, str)
+        counts = {
+            feature["properties"]["sovereignt"]: feature["properties"][
+                "contributor_count"
+            ]
+            for feature in json.loads(output)["features"]
+        }
+        assert counts["Portugal"] == 1
+        assert counts["France"] == 0
+        # the shared world geometry is left untouched
+        assert "contributor_count" not in load_world_geometry()["features"][0][
+            "properties"
+        ]
+
+    def test_make_per_repo_maps(self):
+        """Unit test for make_per_repo_maps() with a map rendered per process."""
+        csv_path = Path("results") / "test_per_repo_maps.csv"
+        csv_path.write_text(
+            "software_name,username,location,country\n"
+            "octo_one,a,Lisbon,Portugal\n"
+            "octo_two,b,,None\n"
+            "octo_one,c,Porto,Portugal\n"
+        )
+        try:
+            map_folder = make_per_repo_maps(csv_path.name, "low", processes=2)
+            maps = sorted(path.name for path in map_folder.glob("*.html"))
+            assert maps == ["octo_one.html", "octo_two.html"]
+            assert "Top 2 Contributors to octo_one" in (
+                map_folder / "octo_one.html"
+            ).read_text()
+            shutil.rmtree(map_folder)
+        finally:
+            csv_path.unlink()
+
+    def test_world_geometry_levels(self):
+        """Unit test that lower resolutions keep every country with fewer points."""
+        num_points = []
+        for resolution in MAP_RESOLUTIONS:
+            features = load_world_geometry(resolution)["features"]
+            assert len(features) == 175
+            assert all(list(feature["properties"]) == ["sovereignt"] for feature in features)
+            num_points.append(
+                sum(
+                    len(ring)
+                    for feature in features
+                    for polygon in get_polygons(feature["geometry"])
+                    for ring in polygon
+                )
+            )
+        assert num_points == sorted(num_points)
+        with pytest.raises(ValueError):
+            load_world_geometry("huge")
+
+    def test_simplify_world_geometry_keeps_shared_borders(self):
+        """Unit test that a border is simplified the same way for both countries."""
+        border = [[0, 0], [0.01, 1], [-0.01, 2], [0, 3]]  # wiggly, west to east
+        west = [[-1, 3], [-1, 0]] + border
+        east = border[::-1] + [[1, 0], [1, 3]]
+        data = {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "properties": {"sovereignt": name, "pop_est": 1},
+                    "geometry": {"type": "Polygon", "coordinates": [ring + ring[:1]]},
+                }
+                for name, ring in [("West", west), ("East", east)]
+            ],
+        }
+        output = simplify_world_geometry(data, 0.1, 2)
+        west_ring, east_ring = [
+            feature["geometry"]["coordinates"][0] for feature in output["features"]
+        ]
+        assert [0.01, 1] not in west_ring
+        for ring in [west_ring, east_ring]:
+            assert {tuple(point) for point in ring if point[0] == 0} == {(0, 0), (0, 3)}
+        assert output["features"][0]["properties"] == {"sovereignt": "West"}
 
     def test_make_map_from_repo(self):
         """Unit test for make_map() with a number greater than 100 of contributors